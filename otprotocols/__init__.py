@@ -0,0 +1,10 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Shared code for the protocols in this repository.
+
+The protocols themselves stay single scripts, but the bits that more than one
+protocol (or an offline tool) needs live here, so that what gets printed,
+exported and executed all comes from the same place.
+"""
@@ -0,0 +1,224 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Height of the agar in each well of a destination plate, and how low the
+pipette can go to dispense on it.
+
+The protocols use one hand-tuned agar_thickness per script (2.5 to 5 mm),
+whatever the volume of agar and however dry the plates are. Here each plate
+gets a (rows, cols) array of agar heights (mm from the bottom of the well):
+
+    estimated   agar volume / well area, minus what dried out since the
+                plates were poured (edge wells dry faster), minus the
+                meniscus (the agar climbs the walls, the centre is lower)
+    measured    from a calibration csv with columns plate, well, height
+                (e.g. lowering a tip until it touches the agar)
+
+and the dispense offset of a well is its agar height, plus the uncertainty
+of the map, plus SAFE_CLEARANCE. A multichannel goes as low as the highest
+well of the column allows. A drop that touches the agar before leaving the
+tip does not need a blow out (drop_touches), but only trust that on measured
+heights: an estimate that is off leaves the volume in the tip.
+
+    offsets = dispense_offsets(plate_heights(agar_volume=200,
+                                             poured='2026-10-14'))
+    plan = apply_to_plan(plan, {'11': offsets})
+
+    python -m otprotocols.agar map --volume 200 --poured 2026-10-14
+
+prints the map of a plate and its offsets.
+"""
+
+import csv
+import argparse
+import datetime
+
+import numpy as np
+
+from otprotocols.deck import LABWARE, ROWS, well_row_col
+from otprotocols.plan import channel_wells
+
+AGAR_CALIBRATION_FILE = (
+    '/data/user_storage/opentrons_data/agar_calibration.csv')
+AGAR_LABWARE = '96-well-plate-sqfb-whatman'
+# labware whose wells are square, 'diameter' is their side
+SQUARE_WELLS = ('96-well-plate-sqfb-whatman',)
+# fraction of the poured volume lost per day, and how much faster the
+# outer wells lose it
+DRYING_PER_DAY = 0.015
+EDGE_DRYING = 1.5
+# mm the centre of the well sits below the agar on the walls
+MENISCUS = 0.3
+# mm of uncertainty of the estimated and measured heights
+ESTIMATE_MARGIN = 0.3
+CALIBRATION_MARGIN = 0.1
+# mm between the agar and the end of the tip
+SAFE_CLEARANCE = 0.2
+
+
+def well_area(labware_type=AGAR_LABWARE):
+    """
+    Return the area (mm^2) of the bottom of a well of labware_type
+    """
+    diameter = LABWARE[labware_type]['diameter']
+    if labware_type in SQUARE_WELLS:
+        return diameter ** 2
+    return np.pi * diameter ** 2 / 4
+
+
+def edge_mask(labware_type=AGAR_LABWARE):
+    """
+    Return a (rows, cols) boolean array, True for the outer wells
+    """
+    n_cols, n_rows = LABWARE[labware_type]['grid']
+    mask = np.zeros((n_rows, n_cols), dtype=bool)
+    mask[[0, -1], :] = True
+    mask[:, [0, -1]] = True
+    return mask
+
+
+def plate_age_days(poured, today=None):
+    """
+    Return the days since poured (a date or 'YYYY-MM-DD')
+    """
+    if isinstance(poured, str):
+        poured = datetime.datetime.strptime(poured, '%Y-%m-%d').date()
+    today = today or datetime.date.today()
+    return max((today - poured).days, 0)
+
+
+def estimate_heights(agar_volume, age_days=0, labware_type=AGAR_LABWARE):
+    """
+    Return the (rows, cols) array of agar heights (mm) in the centre of each
+    well, agar_volume (ul per well) poured age_days ago.
+    agar_volume and age_days can also be arrays broadcasting to the plate.
+    """
+    drying = DRYING_PER_DAY * np.where(edge_mask(labware_type), EDGE_DRYING, 1)
+    left = np.clip(1 - drying * np.asarray(age_days, dtype=float), 0, 1)
+    heights = np.asarray(agar_volume, dtype=float) * left
+    heights = heights / well_area(labware_type) - MENISCUS
+    return np.clip(heights, 0, LABWARE[labware_type]['depth'])
+
+
+def load_calibration(path=AGAR_CALIBRATION_FILE, labware_type=AGAR_LABWARE):
+    """
+    Return {plate: (rows, cols) array of measured heights} from a csv with
+    columns plate, well, height. Wells not measured get the highest height
+    measured on their plate.
+    """
+    measured = {}
+    with open(path, 'r', newline='') as fid:
+        for row in csv.DictReader(fid):
+            measured.setdefault(row['plate'], {})[row['well']] = float(
+                row['height'])
+    n_cols, n_rows = LABWARE[labware_type]['grid']
+    out = {}
+    for plate, wells in measured.items():
+        heights = np.full((n_rows, n_cols), max(wells.values()))
+        for well, height in wells.items():
+            heights[well_row_col(well)] = height
+        out[plate] = heights
+    return out
+
+
+def plate_heights(plate=None, agar_volume=None, poured=None,
+                  calibration=None, labware_type=AGAR_LABWARE):
+    """
+    Return (heights, margin) of a plate: measured if plate is in calibration
+    (the dict of load_calibration), or estimated from agar_volume and the
+    date it was poured (today if None)
+    """
+    if calibration is not None and plate in calibration:
+        return calibration[plate], CALIBRATION_MARGIN
+    if agar_volume is None:
+        raise ValueError(
+            'plate {} is not calibrated and has no agar volume'.format(plate))
+    age_days = plate_age_days(poured) if poured is not None else 0
+    return (estimate_heights(agar_volume, age_days, labware_type),
+            ESTIMATE_MARGIN)
+
+
+def dispense_offsets(heights, margin=ESTIMATE_MARGIN,
+                     clearance=SAFE_CLEARANCE):
+    """
+    Return the lowest safe dispense offsets (mm from the bottom) of wells
+    """
+    return np.asarray(heights, dtype=float) + margin + clearance
+
+
+def column_offsets(offsets):
+    """
+    Return the offset of each column for a multichannel: the highest
+    """
+    return np.asarray(offsets).max(axis=0)
+
+
+def well_offset(offsets, well_name, n_channels=1):
+    """
+    Return the dispense offset for a pipette with n_channels whose first
+    channel is in well_name
+    """
+    return float(max(
+        offsets[well_row_col(well)]
+        for well in channel_wells(well_name, n_channels)))
+
+
+def drop_touches(gap, volume):
+    """
+    True where a drop of volume (ul) hanging from the tip reaches the agar
+    gap mm below it, approximating the drop as a hemisphere
+    """
+    radius = (3 * np.asarray(volume, dtype=float) / (2 * np.pi)) ** (1 / 3)
+    return np.asarray(gap) <= radius
+
+
+def apply_to_plan(plan, offsets_by_slot):
+    """
+    Return a copy of plan with the destination offset of the steps into the
+    slots of offsets_by_slot ({slot: array of dispense_offsets}) set per well
+    """
+    out = []
+    for step in plan:
+        slot, well = step['destination']
+        if slot in offsets_by_slot:
+            step = dict(step)
+            step['destination_offset'] = well_offset(
+                offsets_by_slot[slot], well, step['n_channels'])
+        out.append(step)
+    return out
+
+
+def _print_map(values, fmt='{:5.2f}'):
+    print('   ' + ''.join('{:>6}'.format(c + 1)
+                          for c in range(values.shape[1])))
+    for row, line in zip(ROWS, values):
+        print('{:<3}'.format(row) + ''.join(
+            ' ' + fmt.format(v) for v in line))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Agar heights and dispense offsets of a plate')
+    parser.add_argument('action', choices=['map'])
+    parser.add_argument('--volume', type=float, help='ul of agar per well')
+    parser.add_argument('--poured', help='YYYY-MM-DD')
+    parser.add_argument('--plate', help='plate in the calibration file')
+    parser.add_argument('--calibration', help='calibration csv')
+    parser.add_argument('--labware', default=AGAR_LABWARE)
+    args = parser.parse_args()
+    calibration = (load_calibration(args.calibration, args.labware)
+                   if args.calibration else None)
+    heights, margin = plate_heights(
+        args.plate, args.volume, args.poured, calibration, args.labware)
+    offsets = dispense_offsets(heights, margin)
+    print('agar height (mm):')
+    _print_map(heights)
+    print('dispense offset (mm), margin {} mm:'.format(margin))
+    _print_map(offsets)
+    print('multichannel, per column:')
+    _print_map(column_offsets(offsets)[None, :])
+
+
+if __name__ == '__main__':
+    main()
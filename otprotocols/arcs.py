@@ -0,0 +1,203 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+How high the pipette needs to go between two wells.
+
+APIv1 moves between wells of the same labware with an arc 5 mm above that
+labware, and between labware with an arc 20 mm above the tallest thing on
+the deck (usually the tip racks or the trash), wherever they are. Going from
+one plate to the next one only needs to clear what is under the straight
+line between them:
+
+    same well            no arc
+    same labware         labware height + LOW_ARC_CLEARANCE
+    different labware    tallest labware crossed + ARC_CLEARANCE_DECK
+
+LOW_ARC_CLEARANCE is the 5 mm APIv1 uses within a labware, so the only
+arcs lower than APIv1 ones are those between labware.
+On the robot, heights come from the labware loaded on the deck
+(loaded_heights, from their APIv1 definitions, as the robot computes its own
+arcs), never from a table. The pipette moves below the usual arc with arc_to
+(direct moves through the arc top), e.g. in otprotocols.microops.run_ops,
+only if a protocol asks for it (low_arcs in
+prestwick_library_serial_dilution_faster.py).
+Offline estimates use the heights of otprotocols.deck.LABWARE instead
+(slot_heights); labware that is not there counts as the tallest on the deck.
+
+    python -m otprotocols.arcs prestwick_library_serial_dilution_faster.py
+
+reports, from the simulated command stream, the z travel of the arcs APIv1
+does and of the planned ones.
+"""
+
+import argparse
+
+import numpy as np
+
+from otprotocols.deck import LABWARE, SLOT_ORIGINS, TRASH_SLOT, well_xy
+from otprotocols.deck import slot_centre
+from otprotocols.simcache import LOCATION_REGEX, HEADER_PREFIXES
+
+ARC_CLEARANCE_LABWARE = 5.0  # mm, as APIv1 between wells of a labware
+ARC_CLEARANCE_DECK = 20.0  # mm, as APIv1 between labware
+# mm above the labware the pipette is in, not lower than APIv1
+LOW_ARC_CLEARANCE = ARC_CLEARANCE_LABWARE
+TRASH_HEIGHT = 85.0  # tall-fixed-trash
+SLOT_SIZE = (127.76, 85.48)
+# points per move when looking for the slots it crosses
+N_SAMPLES = 32
+
+
+def loaded_heights(robot):
+    """
+    Return a dict {slot: height (mm)} of the labware loaded on the deck of
+    robot, trash included, from their APIv1 definitions
+    """
+    heights = {}
+    for slot in robot.deck:
+        for container in slot.get_children_list():
+            heights[slot.get_name()] = max(
+                heights.get(slot.get_name(), 0.0),
+                robot.max_placeable_height_on_deck(container))
+    return heights
+
+
+def slot_heights(deck_labware):
+    """
+    Return a dict {slot: height (mm)} from {slot: labware type}, for offline
+    estimates; the trash is always there, unknown labware gets the height of
+    the tallest
+    """
+    heights = {TRASH_SLOT: TRASH_HEIGHT}
+    unknown = []
+    for slot, labware_type in deck_labware.items():
+        if labware_type in LABWARE:
+            heights[str(slot)] = LABWARE[labware_type]['height']
+        else:
+            unknown.append(str(slot))
+    tallest = max(heights.values())
+    heights.update((slot, tallest) for slot in unknown)
+    return heights
+
+
+def slots_at(xy):
+    """
+    Return an array with the slot (str, '' if none) under each (x, y)
+    """
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    out = np.full(len(xy), '', dtype=object)
+    for slot, (x0, y0) in SLOT_ORIGINS.items():
+        inside = ((xy[:, 0] >= x0) & (xy[:, 0] < x0 + SLOT_SIZE[0])
+                  & (xy[:, 1] >= y0) & (xy[:, 1] < y0 + SLOT_SIZE[1]))
+        out[inside] = slot
+    return out
+
+
+def arc_tops(
+        from_xy, to_xy, from_slots, to_slots, heights,
+        labware_clearance=LOW_ARC_CLEARANCE):
+    """
+    Return (planned, APIv1) arc tops (mm above the deck) for n moves, from
+    the (n, 2) arrays of positions and the slots of both ends
+    """
+    from_xy = np.asarray(from_xy, dtype=float).reshape(-1, 2)
+    to_xy = np.asarray(to_xy, dtype=float).reshape(-1, 2)
+    from_slots = np.asarray(from_slots, dtype=object)
+    to_slots = np.asarray(to_slots, dtype=object)
+    height_of = np.vectorize(
+        lambda slot: heights.get(slot, 0.0), otypes=[float])
+    # heights under points along each move, (n, N_SAMPLES)
+    fractions = np.linspace(0, 1, N_SAMPLES)
+    points = (from_xy[:, None, :]
+              + fractions[None, :, None] * (to_xy - from_xy)[:, None, :])
+    crossed = height_of(slots_at(points.reshape(-1, 2))).reshape(
+        len(from_xy), N_SAMPLES)
+    same_slot = from_slots == to_slots
+    own = height_of(from_slots)
+    planned = np.where(
+        same_slot, own + labware_clearance,
+        np.maximum(crossed.max(axis=1), np.maximum(own, height_of(to_slots)))
+        + ARC_CLEARANCE_DECK)
+    v1 = np.where(
+        same_slot, own + ARC_CLEARANCE_LABWARE,
+        max(heights.values()) + ARC_CLEARANCE_DECK)
+    return planned, v1
+
+
+def _locations(commands):
+    # (slot, well) of each command that goes somewhere, in order
+    out = []
+    for command in commands:
+        if command.startswith(HEADER_PREFIXES):
+            continue
+        found = LOCATION_REGEX.findall(command)
+        if found:
+            well, slot = found[0]
+            out.append((slot, well))
+    return out
+
+
+def z_travel(commands, deck_labware):
+    """
+    Return a dict with the number of moves between wells, and the z travel
+    (mm, up and down) of the arcs of APIv1 and of the planned ones, for a
+    command stream
+    """
+    heights = slot_heights(deck_labware)
+    locations = _locations(commands)
+    moves = [(a, b) for a, b in zip(locations[:-1], locations[1:]) if a != b]
+    if not moves:
+        return {'moves': 0, 'v1_mm': 0.0, 'planned_mm': 0.0, 'saved_mm': 0.0}
+
+    def _xy(slot, well):
+        if slot == TRASH_SLOT:
+            return slot_centre(slot)
+        return well_xy(slot, well)
+
+    from_slots = [a[0] for a, _ in moves]
+    to_slots = [b[0] for _, b in moves]
+    planned, v1 = arc_tops(
+        [_xy(*a) for a, _ in moves], [_xy(*b) for _, b in moves],
+        from_slots, to_slots, heights)
+    # from the top of one labware up to the arc, and down to the other one
+    ends = (np.array([heights.get(s, 0.0) for s in from_slots])
+            + np.array([heights.get(s, 0.0) for s in to_slots]))
+    v1_mm = float((2 * v1 - ends).sum())
+    planned_mm = float((2 * planned - ends).sum())
+    return {
+        'moves': len(moves),
+        'v1_mm': v1_mm,
+        'planned_mm': planned_mm,
+        'saved_mm': v1_mm - planned_mm,
+        }
+
+
+def arc_to(pipette, from_well, to_well, arc_top, from_height, to_height):
+    """
+    Move pipette from above from_well to above to_well through arc_top (mm
+    above the deck), with direct moves. The next aspirate or dispense in
+    to_well then goes straight down.
+    """
+    pipette.move_to(from_well.top(arc_top - from_height), strategy='direct')
+    pipette.move_to(to_well.top(arc_top - to_height), strategy='direct')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Z travel of the arcs between wells, APIv1 vs planned')
+    parser.add_argument('protocols', nargs='+')
+    args = parser.parse_args()
+    from otprotocols.simcache import cached_simulate
+    for protocol in args.protocols:
+        entry, _ = cached_simulate(protocol)
+        travel = z_travel(entry['commands'], entry['deck'])
+        print('{}: {} moves, z travel {:.1f} -> {:.1f} m ({:.0f}% '
+              'saved)'.format(
+            protocol, travel['moves'], travel['v1_mm'] / 1000,
+            travel['planned_mm'] / 1000,
+            100 * travel['saved_mm'] / max(travel['v1_mm'], 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
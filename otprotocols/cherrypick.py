@@ -0,0 +1,152 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Cherry-picking from several identical (replica) library plates.
+
+Rather than binding each stock plate to one library plate, every destination
+well can take its strain/compound from any replica. The choice is made for
+all the destination wells at once:
+    - mode='travel': the replica that makes the pipette travel the least
+        (tiprack -> source -> destination), as long as there is enough volume
+        left in that well of that replica, otherwise the next closest
+    - mode='balance': draws of each library well are spread evenly across
+        the replicas, so that all the replicas are drawn down the same
+"""
+
+import numpy as np
+
+from otprotocols.deck import SLOT_ORIGINS, A1_OFFSET, well_row_col, slot_centre
+from otprotocols.deck import GANTRY_SPEED
+
+
+def _cumcount(keys):
+    """
+    Return, for each element, how many elements with the same key come before
+    it (keeping the original order)
+    """
+    keys = np.asarray(keys)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    is_start = np.ones(len(keys), dtype=bool)
+    is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    group_start = np.maximum.accumulate(
+        np.where(is_start, np.arange(len(keys)), 0))
+    out = np.empty(len(keys), dtype=int)
+    out[order] = np.arange(len(keys)) - group_start
+    return out
+
+
+def _positions(slots, well_names, spacing=9.0):
+    """
+    Return a (n_wells, n_slots, 2) array with the position of each well in
+    each slot
+    """
+    origins = np.array([SLOT_ORIGINS[str(s)] for s in slots], dtype=float)
+    rc = np.array([well_row_col(w) for w in well_names], dtype=float)
+    in_plate = np.stack([
+        A1_OFFSET[0] + rc[:, 1] * spacing,
+        A1_OFFSET[1] - rc[:, 0] * spacing], axis=1)
+    return in_plate[:, None, :] + origins[None, :, :]
+
+
+def travel_costs(
+        source_wells, dst_slots, dst_wells, replica_slots, tiprack_slot=None):
+    """
+    Return a (n_destinations, n_replicas) array with the travel (mm) needed
+    to serve each destination from each replica
+    """
+    src_xy = _positions(replica_slots, source_wells)
+    dst_xy = np.array(
+        [_positions([s], [w])[0, 0] for s, w in zip(dst_slots, dst_wells)])
+    cost = np.linalg.norm(src_xy - dst_xy[:, None, :], axis=2)
+    if tiprack_slot is not None:
+        tip_xy = np.array(slot_centre(tiprack_slot))
+        cost += np.linalg.norm(src_xy - tip_xy[None, None, :], axis=2)
+    return cost
+
+
+def assign_replica_sources(
+        source_wells, dst_slots, dst_wells, replica_slots, draw_volume,
+        well_volume, dead_volume=0, mode='travel', tiprack_slot=None):
+    """
+    Choose a replica library plate for each destination well.
+    source_wells: library well needed by each destination well
+    dst_slots, dst_wells: where each destination well is
+    replica_slots: slots of the identical library plates
+    draw_volume: volume taken from the library at each transfer
+    well_volume, dead_volume: volume in each library well at the start, and
+        volume that can't be aspirated
+    Return an array with the replica slot of each destination.
+    """
+    source_wells = np.asarray(source_wells)
+    n_replicas = len(replica_slots)
+    capacity = int((well_volume - dead_volume) // draw_volume)
+    _, compound_ids = np.unique(source_wells, return_inverse=True)
+    cost = travel_costs(
+        source_wells, dst_slots, dst_wells, replica_slots, tiprack_slot)
+
+    if mode == 'balance':
+        # k-th draw of a library well goes to replica k % n_replicas
+        assigned = _cumcount(compound_ids) % n_replicas
+        n_draws = np.bincount(compound_ids * n_replicas + assigned)
+        assert n_draws.max() <= capacity, (
+            'Not enough volume in the library wells for {} draws'.format(
+                n_draws.max()))
+    elif mode == 'travel':
+        preferences = np.argsort(cost, axis=1)
+        assigned = -np.ones(len(source_wells), dtype=int)
+        n_draws = np.zeros(len(np.unique(compound_ids)) * n_replicas, int)
+        # try the closest replica first, move what doesn't fit to the next one
+        for level in range(n_replicas):
+            todo = np.flatnonzero(assigned < 0)
+            if len(todo) == 0:
+                break
+            candidate = preferences[todo, level]
+            keys = compound_ids[todo] * n_replicas + candidate
+            # serve the destinations that lose the most by moving first
+            if level + 1 < n_replicas:
+                regret = (cost[todo, preferences[todo, level + 1]]
+                          - cost[todo, candidate])
+                by_regret = np.argsort(-regret, kind='stable')
+            else:
+                by_regret = np.arange(len(todo))
+            rank = np.empty(len(todo), dtype=int)
+            rank[by_regret] = _cumcount(keys[by_regret])
+            is_ok = n_draws[keys] + rank < capacity
+            assigned[todo[is_ok]] = candidate[is_ok]
+            n_draws += np.bincount(keys[is_ok], minlength=len(n_draws))
+        assert (assigned >= 0).all(), (
+            'Not enough volume in the library wells for all destinations')
+    else:
+        raise ValueError('Unknown mode {}'.format(mode))
+
+    return np.array(replica_slots)[assigned]
+
+
+def travel_report(
+        source_wells, dst_slots, dst_wells, chosen_slots, baseline_slots,
+        tiprack_slot=None, speed=GANTRY_SPEED, is_print=True):
+    """
+    Return (and print) the travel (mm) and time (s) of the chosen sources
+    against a baseline (e.g. the fixed library plate per stock plate)
+    """
+    def _total(slots):
+        total = 0.0
+        for s, src, ds, dw in zip(slots, source_wells, dst_slots, dst_wells):
+            total += travel_costs([src], [ds], [dw], [s], tiprack_slot)[0, 0]
+        return total
+
+    chosen = _total(chosen_slots)
+    baseline = _total(baseline_slots)
+    report = {
+        'travel_mm': chosen,
+        'baseline_travel_mm': baseline,
+        'saved_mm': baseline - chosen,
+        'saved_s': (baseline - chosen) / speed,
+        }
+    if is_print:
+        print('CHERRY PICKING: travel {travel_mm:.0f} mm instead of '
+              '{baseline_travel_mm:.0f} mm, about {saved_s:.0f} s '
+              'saved'.format(**report))
+    return report
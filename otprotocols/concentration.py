@@ -0,0 +1,365 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Concentration actually reached in each well, following the liquid through a
+plan (see otprotocols.plan), with confidence intervals from the pipetting
+errors.
+
+Every well of every plate is an entry of two (samples, wells) arrays, volume
+and amount of drug. Each channel of each step moves liquid at the
+concentration of its source; the tip keeps residual_volume ul after each
+dispense, and mixing is taken as complete. Sample 0 is the nominal run,
+the others draw for each pipette a systematic error (sd accuracy / 2) and
+for each aspiration a random one (sd precision), both depending on the
+volume as in the spec sheets. Volumes above the pipette capacity are split
+in equal aspirations, as transfer() does.
+
+Steps only depend on the steps that filled their source, so they are
+processed in levels (a whole dilution step of the library at once), not one
+at a time: a campaign with a thousand samples takes well under a second.
+
+    result = track_concentrations(
+        plan, {'10': '96-well-plate-pcr-thermofisher', ...},
+        {'10': (100, 100)}, {'multi': 'p10-Multi', 'single': 'p10-Single'})
+    result['conc']['1'], result['low']['1'], result['high']['1']
+
+    python -m otprotocols.concentration syngenta --samples 1000
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from otprotocols.deck import LABWARE, ROWS
+from otprotocols.plan import channel_wells, MULTI_CHANNEL_ROWS
+from otprotocols.plansim import PIPETTE_MODELS
+
+# rough accuracy and precision (relative) at the smallest and largest volume
+# of APIv1 pipettes, after the spec sheets. Precision is the CV, so 1 sd of
+# the random error of an aspiration. Accuracy is the largest systematic error
+# a pipette within spec can have, taken as ACCURACY_SDS sd (95% of pipettes)
+PIPETTE_ERRORS = {
+    'p10': {'volumes': (1, 10), 'accuracy': (0.12, 0.015),
+            'precision': (0.08, 0.008)},
+    'p50': {'volumes': (5, 50), 'accuracy': (0.10, 0.02),
+            'precision': (0.04, 0.005)},
+    'p300': {'volumes': (30, 300), 'accuracy': (0.05, 0.015),
+             'precision': (0.025, 0.006)},
+    'p1000': {'volumes': (100, 1000), 'accuracy': (0.05, 0.01),
+              'precision': (0.02, 0.005)},
+    }
+ACCURACY_SDS = 2
+# ul left in the tip after a dispense with blow out
+RESIDUAL_VOLUME = 0.05
+# two-sided confidence interval, %
+CONFIDENCE = 95
+
+
+def pipette_errors(model, volumes):
+    """
+    Return (accuracy, precision) arrays for volumes (ul) pipetted by an APIv1
+    model (e.g. 'p10-Multi'), interpolated on the log of the volume
+    """
+    errors = PIPETTE_ERRORS[model.split('-')[0]]
+    log_volumes = np.log(np.clip(volumes, *errors['volumes']))
+    log_range = np.log(errors['volumes'])
+    return (np.interp(log_volumes, log_range, errors['accuracy']),
+            np.interp(log_volumes, log_range, errors['precision']))
+
+
+def _wells_index(labware):
+    # first flat index of each slot, and its (rows, cols)
+    first, shapes, n_wells = {}, {}, 0
+    for slot in sorted(labware):
+        n_cols, n_rows = LABWARE[labware[slot]]['grid']
+        first[slot] = n_wells
+        shapes[slot] = (n_rows, n_cols)
+        n_wells += n_rows * n_cols
+    return first, shapes, n_wells
+
+
+def _events(plan, first, shapes, trash):
+    """
+    Return arrays (source, destination, volume, pipette name) of the plan,
+    one per channel, in execution order. Disposal volumes go to the trash.
+    """
+    source, destination, volume, pipette = [], [], [], []
+
+    def _flat(slot, well):
+        return first[slot] + ROWS.index(well[0]) * shapes[slot][1] + int(
+            well[1:]) - 1
+
+    for sc, step in enumerate(plan):
+        pairs = []
+        src_slot, src_well = step['source']
+        dst_slot, dst_well = step['destination']
+        for channel, dst_channel_well in enumerate(
+                channel_wells(dst_well, step['n_channels'])):
+            if shapes[src_slot][0] > 1:
+                src_channel_well = channel_wells(
+                    src_well, step['n_channels'])[channel]
+            else:
+                # single row labware (troughs): all channels in one well
+                src_channel_well = src_well
+            pairs.append((_flat(src_slot, src_channel_well),
+                          _flat(dst_slot, dst_channel_well)))
+        is_new_aspiration = step.get('aspiration') is not None and (
+            sc == 0 or plan[sc - 1].get('aspiration') != step['aspiration'])
+        for src, dst in pairs:
+            source.append(src)
+            destination.append(dst)
+            volume.append(step['volume'])
+            pipette.append(step['pipette'])
+            if is_new_aspiration and step.get('disposal_volume'):
+                source.append(src)
+                destination.append(trash)
+                volume.append(step['disposal_volume'])
+                pipette.append(step['pipette'])
+    return (np.array(source, dtype=int), np.array(destination, dtype=int),
+            np.array(volume, dtype=float), np.array(pipette, dtype=object))
+
+
+def _levels(source, destination):
+    """
+    Return the level of each event: an aspiration comes after everything
+    dispensed in its well before, a dispense after everything aspirated from
+    its well before. Events of a level can then be applied all at once.
+    """
+    filled = {}
+    emptied = {}
+    levels = np.zeros(len(source), dtype=int)
+    for ind, (src, dst) in enumerate(zip(source.tolist(),
+                                         destination.tolist())):
+        level = max(filled.get(src, -1) + 1, emptied.get(dst, 0))
+        levels[ind] = level
+        emptied[src] = max(emptied.get(src, 0), level)
+        filled[dst] = max(filled.get(dst, -1), level)
+    return levels
+
+
+def _actual_volumes(volume, pipette, pipette_models, n_samples, rng):
+    """
+    Return the (events, samples) volumes actually moved, sample 0 nominal
+    """
+    actual = np.tile(volume[:, None], (1, n_samples + 1))
+    if n_samples == 0:
+        return actual
+    for name in np.unique(pipette):
+        model = pipette_models[name]
+        is_name = pipette == name
+        # transfer() splits volumes above the capacity in equal parts
+        n_parts = np.ceil(volume[is_name] / PIPETTE_MODELS[model][1])
+        accuracy, precision = pipette_errors(
+            model, volume[is_name] / n_parts)
+        bias = (rng.standard_normal((1, n_samples))
+                * accuracy[:, None] / ACCURACY_SDS)
+        noise = (rng.standard_normal((is_name.sum(), n_samples))
+                 * (precision / np.sqrt(n_parts))[:, None])
+        actual[is_name, 1:] *= 1 + bias + noise
+    return np.maximum(actual, 0)
+
+
+def _add_rows(target, rows, values):
+    # target[rows] += values, summing repeated rows (faster than np.add.at)
+    order = np.argsort(rows, kind='stable')
+    unique, starts = np.unique(rows[order], return_index=True)
+    target[unique] += np.add.reduceat(values[order], starts, axis=0)
+
+
+def track_concentrations(
+        plan, labware, initial, pipette_models, n_samples=1000,
+        residual_volume=RESIDUAL_VOLUME, seed=None, state=None):
+    """
+    Follow volumes and concentrations through a plan.
+    labware: {slot: labware type}, every slot the plan uses
+    initial: {slot: (volume, concentration)}, scalars or (rows, cols)
+        arrays; other wells start empty
+    pipette_models: {pipette name in the plan: APIv1 model}
+    state: the 'state' of a previous result, to carry on from it (initial
+        then only applies to the slots not in it)
+    seed: for the random errors, or a numpy Generator
+    Return a dict of {slot: (rows, cols) array}: 'volume' and 'conc'
+    (nominal), 'low' and 'high' (CONFIDENCE % interval of the
+    concentration), and the 'state' to carry on from.
+    """
+    first, shapes, n_wells = _wells_index(labware)
+    trash = n_wells
+    # (wells, samples), the trash last
+    volumes = np.zeros((n_wells + 1, n_samples + 1))
+    amounts = np.zeros((n_wells + 1, n_samples + 1))
+    for slot, (volume, conc) in initial.items():
+        wells = slice(first[slot], first[slot] + np.prod(shapes[slot]))
+        volume = np.broadcast_to(volume, shapes[slot]).ravel()
+        conc = np.broadcast_to(conc, shapes[slot]).ravel()
+        volumes[wells] = volume[:, None]
+        amounts[wells] = (volume * conc)[:, None]
+    for slot, (volume, amount) in (state or {}).items():
+        wells = slice(first[slot], first[slot] + np.prod(shapes[slot]))
+        volumes[wells] = volume
+        amounts[wells] = amount
+
+    source, destination, volume, pipette = _events(
+        plan, first, shapes, trash)
+    rng = np.random.default_rng(seed)
+    actual = _actual_volumes(volume, pipette, pipette_models, n_samples, rng)
+    delivered = np.maximum(actual - residual_volume, 0)
+    levels = _levels(source, destination)
+    by_level = np.argsort(levels, kind='stable')
+    bounds = np.flatnonzero(np.diff(levels[by_level])) + 1
+    for events in np.split(by_level, bounds):
+        src = source[events]
+        dst = destination[events]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            conc = np.where(volumes[src] > 0, amounts[src] / volumes[src], 0)
+        _add_rows(volumes, src, -actual[events])
+        _add_rows(amounts, src, -actual[events] * conc)
+        _add_rows(volumes, dst, delivered[events])
+        _add_rows(amounts, dst, delivered[events] * conc)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        conc = np.where(volumes > 0, amounts / volumes, 0)
+    tail = (100 - CONFIDENCE) / 2
+    if n_samples > 0:
+        low, high = np.percentile(conc[:, 1:], [tail, 100 - tail], axis=1)
+    else:
+        low, high = conc[:, 0], conc[:, 0]
+    out = {'volume': {}, 'conc': {}, 'low': {}, 'high': {}, 'state': {}}
+    for slot in labware:
+        wells = slice(first[slot], first[slot] + np.prod(shapes[slot]))
+        for key, values in [('volume', volumes[:, 0]), ('conc', conc[:, 0]),
+                            ('low', low), ('high', high)]:
+            out[key][slot] = values[wells].reshape(shapes[slot])
+        out['state'][slot] = (volumes[wells], amounts[wells])
+    return out
+
+
+def track_campaign(plan, labware, initial, pipette_models, swapped_slots,
+                   **kwargs):
+    """
+    Track a plan whose steps have a 'round' key: between rounds the plates
+    in swapped_slots are replaced (by plates as in initial), the others
+    carry on. Return {round: result of track_concentrations}.
+    """
+    rounds = sorted(set(step.get('round', 0) for step in plan))
+    # one generator, so that rounds do not repeat the same errors
+    kwargs['seed'] = np.random.default_rng(kwargs.get('seed'))
+    results = {}
+    state = None
+    for round_ind in rounds:
+        results[round_ind] = track_concentrations(
+            [step for step in plan if step.get('round', 0) == round_ind],
+            labware, initial, pipette_models, state=state, **kwargs)
+        state = {slot: values
+                 for slot, values in results[round_ind]['state'].items()
+                 if slot not in swapped_slots}
+    return results
+
+
+def _syngenta_campaign():
+    # the 41 drugs at 100 mM and 6 at 30 mM of syngenta_library_to_stock_plates
+    from otprotocols.doseresponse import (
+        design_dilutions, stock_layout, design_plan, SYNGENTA_DOSES)
+    stock_slots = ['1', '2', '4', '5', '7', '8']
+    top_conc = np.array([100] * 41 + [30] * 6)
+    design = design_dilutions(top_conc, SYNGENTA_DOSES, 11)
+    dose_wells, rounds = stock_layout(
+        design['used'].sum(axis=1), stock_slots)
+    library_wells = [('10', MULTI_CHANNEL_ROWS[ind % 8] + str(ind // 8 + 1))
+                     for ind in range(len(top_conc))]
+    plan = design_plan(
+        design, library_wells, dose_wells, ('11', 'A1'), n_channels=8,
+        rounds=rounds)
+    labware = {slot: '96-well-plate-pcr-thermofisher'
+               for slot in stock_slots + ['10']}
+    labware['11'] = 'trough-12row'
+    # library wells column by column, like library_wells
+    library_conc = np.zeros(96)
+    library_conc[:len(top_conc)] = top_conc
+    library_conc = library_conc.reshape(12, 8).T
+    initial = {'10': (100, library_conc), '11': (20000, 0)}
+    models = {'multi': 'p10-Multi', 'single': 'p10-Single'}
+    return design, plan, labware, initial, models, stock_slots
+
+
+def _prestwick_campaign():
+    # 240 drugs, 29 per library plate, diluted 1:10 twice in place, as
+    # prestwick_library_serial_dilution_faster
+    from otprotocols.doseresponse import design_dilutions, design_plan
+    high_wells = [row + col for row in MULTI_CHANNEL_ROWS
+                  for col in ['1', '4', '7', '10']]
+    high_wells = [w for w in high_wells
+                  if w[0] != 'A' or w[1:] == '1'][:29]
+    n_drugs = 240
+    design = design_dilutions(
+        np.ones(n_drugs), [1, 0.1, 0.01], 40, in_place=True)
+    dose_wells = np.full((n_drugs, 3), None, dtype=object)
+    rounds = np.full((n_drugs, 3), None, dtype=object)
+    for drug in range(n_drugs):
+        well = high_wells[drug % len(high_wells)]
+        for dose in range(3):
+            dose_wells[drug, dose] = (
+                '6', well[0] + str(int(well[1:]) + dose))
+            rounds[drug, dose] = drug // len(high_wells)
+    plan = design_plan(
+        design, [w[0] for w in dose_wells], dose_wells, ('9', 'A1'),
+        pipettes={'solvent': 'solvent', 'dilution': 'drugs'}, rounds=rounds,
+        mix_after=(2, 10))
+    library_conc = np.zeros((8, 12))
+    for well in high_wells:
+        library_conc[ROWS.index(well[0]), int(well[1:]) - 1] = 1
+    labware = {'6': '96-well-plate-pcr-thermofisher', '9': 'trough-12row'}
+    initial = {'6': (45 * library_conc, library_conc), '9': (20000, 0)}
+    models = {'drugs': 'p10-Single', 'solvent': 'p50-Single'}
+    return design, plan, labware, initial, models, ['6']
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Concentrations reached by a dilution campaign, with '
+                    'confidence intervals from the pipetting errors')
+    parser.add_argument('campaign', choices=['syngenta', 'prestwick'])
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--residual-volume', type=float,
+                        default=RESIDUAL_VOLUME)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    campaign = {'syngenta': _syngenta_campaign,
+                'prestwick': _prestwick_campaign}[args.campaign]
+    design, plan, labware, initial, models, swapped_slots = campaign()
+
+    tic = time.time()
+    results = track_campaign(
+        plan, labware, initial, models, swapped_slots,
+        n_samples=args.samples, residual_volume=args.residual_volume,
+        seed=args.seed)
+    toc = time.time()
+    print('{} steps, {} rounds, {} samples in {:.2f} s'.format(
+        len(plan), len(results), args.samples, toc - tic))
+
+    # per dose: nominal error and confidence interval, relative to the design
+    rows = {}
+    for step in plan:
+        if step['phase'] == 'solvent':
+            continue
+        result = results[step['round']]
+        slot, well = step['destination']
+        for channel_well in channel_wells(well, step['n_channels']):
+            ind = (ROWS.index(channel_well[0]), int(channel_well[1:]) - 1)
+            dose = step['dose']
+            rows.setdefault(round(dose, 6), []).append([
+                result[key][slot][ind] / dose
+                for key in ('conc', 'low', 'high')])
+    print('{:>10} {:>8} {:>8} {:>8} {:>6}'.format(
+        'dose', 'nominal', 'low', 'high', 'wells'))
+    for dose, values in sorted(rows.items(), reverse=True):
+        values = np.array(values)
+        print('{:>10g} {:>+7.1f}% {:>+7.1f}% {:>+7.1f}% {:>6}'.format(
+            dose, 100 * (values[:, 0].mean() - 1),
+            100 * (values[:, 1].mean() - 1), 100 * (values[:, 2].mean() - 1),
+            len(values)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Minimal model of the OT-2 deck, for the offline tools.
+
+Positions are in mm, in deck coordinates (x left to right, y front to back),
+and only need to be good enough to compare plans, not to drive the robot.
+Labware geometry is the same we give to labware.create in the protocols;
+heights are approximate (measured with a ruler, tips included for tipracks).
+"""
+
+import numpy as np
+
+# APIv1 default gantry speed and z speed, and the fastest the gantry is
+# allowed to travel, mm/s
+GANTRY_SPEED = 400.0
+Z_SPEED = 125.0
+MAX_GANTRY_SPEED = 600.0
+
+# front left corner of each slot
+SLOT_ORIGINS = {
+    '1': (0.0, 0.0), '2': (132.5, 0.0), '3': (265.0, 0.0),
+    '4': (0.0, 90.5), '5': (132.5, 90.5), '6': (265.0, 90.5),
+    '7': (0.0, 181.0), '8': (132.5, 181.0), '9': (265.0, 181.0),
+    '10': (0.0, 271.5), '11': (132.5, 271.5), '12': (265.0, 271.5),
+    }
+TRASH_SLOT = '12'
+
+# position of well A1 from the front left corner of a SBS footprint
+A1_OFFSET = (14.38, 74.24)
+
+LABWARE = {
+    '96-well-plate-pcr-thermofisher': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 5.50,
+        'depth': 15.00, 'volume': 200, 'height': 16.0},
+    '96-well-plate-sqfb-whatman': {
+        'grid': (12, 8), 'spacing': (8.99, 8.99), 'diameter': 7.57,
+        'depth': 10.35, 'volume': 650, 'height': 14.2},
+    '48-well-plate-sarsted': {
+        'grid': (8, 6), 'spacing': (12.4, 12.4), 'diameter': 10,
+        'depth': 17.05, 'volume': 500, 'height': 20.0},
+    '96-flat': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 6.4,
+        'depth': 10.5, 'volume': 400, 'height': 14.2},
+    'trough-12row': {
+        'grid': (12, 1), 'spacing': (9.00, 9.00), 'diameter': 8.0,
+        'depth': 38.0, 'volume': 22000, 'height': 40.0},
+    'opentrons-tiprack-10ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 3.5,
+        'depth': 0, 'volume': 10, 'height': 64.7},
+    'tiprack-10ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 3.5,
+        'depth': 0, 'volume': 10, 'height': 64.7},
+    'opentrons_96_tiprack_10ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 3.5,
+        'depth': 0, 'volume': 10, 'height': 64.7},
+    'opentrons-tiprack-300ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 5.2,
+        'depth': 0, 'volume': 300, 'height': 64.5},
+    'opentrons_96_tiprack_300ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 5.2,
+        'depth': 0, 'volume': 300, 'height': 64.5},
+    'opentrons_96_filtertiprack_200ul': {
+        'grid': (12, 8), 'spacing': (9.00, 9.00), 'diameter': 5.2,
+        'depth': 0, 'volume': 200, 'height': 64.5},
+    }
+
+ROWS = 'ABCDEFGHIJKLMNOP'
+
+
+def well_row_col(well_name):
+    """
+    Return 0-indexed (row, col) of a well name, e.g. 'B3' -> (1, 2)
+    """
+    return ROWS.index(well_name[0]), int(well_name[1:]) - 1
+
+
+def well_xy(slot, well_name, spacing=(9.0, 9.0)):
+    """
+    Return the (x, y) position in mm of a well on the deck
+    """
+    row, col = well_row_col(well_name)
+    x0, y0 = SLOT_ORIGINS[str(slot)]
+    return (x0 + A1_OFFSET[0] + col * spacing[0],
+            y0 + A1_OFFSET[1] - row * spacing[1])
+
+
+def wells_xy(slots, well_names, spacing=(9.0, 9.0)):
+    """
+    Vectorised well_xy: return a (n, 2) array of positions
+    """
+    origins = np.array([SLOT_ORIGINS[str(s)] for s in slots], dtype=float)
+    rc = np.array([well_row_col(w) for w in well_names], dtype=float)
+    rc = rc.reshape(-1, 2)
+    x = origins[:, 0] + A1_OFFSET[0] + rc[:, 1] * spacing[0]
+    y = origins[:, 1] + A1_OFFSET[1] - rc[:, 0] * spacing[1]
+    return np.stack([x, y], axis=1)
+
+
+def slot_centre(slot):
+    """
+    Return the (x, y) centre of a slot
+    """
+    x0, y0 = SLOT_ORIGINS[str(slot)]
+    return (x0 + 127.76 / 2, y0 + 85.48 / 2)
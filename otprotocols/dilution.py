@@ -0,0 +1,128 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Serial dilution chains (high -> mid -> low ...).
+
+With tip_mode='always' every step of a chain gets a new tip, like the
+protocols have always done. With tip_mode='series' the whole chain is done
+with one tip: liquid only ever moves towards lower concentrations, and the tip
+is mixed in each well it dispenses into, so it carries very little of the
+higher concentration forward. Optionally the tip is pre-rinsed in the well it
+is about to aspirate from (extra mix cycles before aspirating).
+
+carryover_error estimates what that costs, tip_mode_report what it saves.
+"""
+
+import numpy as np
+
+from otprotocols.plan import make_step
+
+# rough guess of the time for a pick up and a drop, including the moves
+PICK_DROP_SECONDS = 9.0
+
+
+def wells_to_the_right(well_name, n_wells):
+    """
+    Return the names of the n_wells wells to the right of well_name
+    """
+    row = well_name[0]
+    col = int(well_name[1:])
+    return [row + str(col + i) for i in range(1, n_wells + 1)]
+
+
+def dilution_chain_plan(
+        slot, high_well, volumes, pipette='drugs', phase='dilution',
+        tip_mode='always', pre_rinse_cycles=0, mix_before=(2, 10),
+        mix_after=(2, 10), offset=None, **options):
+    """
+    Return the plan (list of steps) to serially dilute high_well into the
+    wells to its right, one step per volume in volumes.
+    tip_mode: 'always' (new tip per step) or 'series' (one tip per chain)
+    pre_rinse_cycles: in series mode, extra mix cycles in each well before
+        aspirating from it (not for the first well, the tip is clean there)
+    Other keyword arguments are passed to pipette.transfer.
+    """
+    assert tip_mode in ('always', 'series'), (
+        'Unknown tip mode {}'.format(tip_mode))
+    chain_wells = [high_well] + wells_to_the_right(high_well, len(volumes))
+    plan = []
+    for vc, volume in enumerate(volumes):
+        step_options = dict(options)
+        step_options['mix_after'] = mix_after
+        step_options['new_tip'] = 'always' if tip_mode == 'always' else 'once'
+        if mix_before is not None:
+            n_mix, mix_volume = mix_before
+            if tip_mode == 'series' and vc > 0:
+                n_mix += pre_rinse_cycles
+            step_options['mix_before'] = (n_mix, mix_volume)
+        plan.append(make_step(
+            phase, pipette, volume,
+            (slot, chain_wells[vc]), (slot, chain_wells[vc + 1]),
+            source_offset=offset, destination_offset=offset,
+            options=step_options,
+            chain=(slot, high_well),
+            dose=vc + 1,
+            ))
+    return plan
+
+
+def carryover_error(
+        volumes, well_volumes, residual_volume=0.05, washout=0.1,
+        mix_cycles=4, pre_rinse_cycles=0):
+    """
+    Estimate the relative concentration error that using one tip for a
+    whole chain adds to each diluted well.
+
+    residual_volume and washout are guesses, not measurements, so this is an
+    order of magnitude: series mode is opt-in in the protocols.
+
+    Model: after dispensing and mixing in a well the tip keeps residual_volume
+    ul of liquid (inner and outer film). Each mix cycle in a well only replaces
+    a fraction (1 - washout) of that liquid with the well content. Whatever is
+    left from the previous, more concentrated well is dispensed in the next
+    one.
+
+    volumes: volume moved at each step (ul)
+    well_volumes: final volume in each diluted well (ul), same length
+    mix_cycles: mix cycles in a well before aspirating from it (mix_after of
+        the previous step plus mix_before)
+    Return an array with the relative error of each diluted well (0.01 = 1%
+    more concentrated than intended). The first diluted well is always 0, as
+    the tip comes in clean.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    well_volumes = np.asarray(well_volumes, dtype=float)
+    # intended concentrations along the chain, relative to the high well
+    dilution_factors = volumes / well_volumes
+    conc = np.concatenate([[1.0], np.cumprod(dilution_factors)])
+    # step k aspirates from well k, after mixing in it with the tip holding
+    # liquid at the concentration of well k-1
+    n_cycles = mix_cycles + pre_rinse_cycles
+    leftover = washout ** n_cycles
+    excess = np.zeros(len(volumes))
+    excess[1:] = residual_volume * leftover * (conc[:-2] - conc[1:-1])
+    return excess / (well_volumes * conc[1:])
+
+
+def tip_mode_report(
+        n_chains, n_steps, n_channels=1, pick_drop_seconds=PICK_DROP_SECONDS,
+        is_print=True):
+    """
+    Return (and print) a dict comparing tips and pick/drop time of the two
+    tip modes for n_chains chains of n_steps steps each.
+    """
+    pickups_always = n_chains * n_steps
+    pickups_series = n_chains
+    report = {
+        'tips_always': pickups_always * n_channels,
+        'tips_series': pickups_series * n_channels,
+        'tips_saved': (pickups_always - pickups_series) * n_channels,
+        'seconds_saved': (pickups_always - pickups_series) * pick_drop_seconds,
+        }
+    if is_print:
+        print('DILUTION TIPS: {tips_always} with new tips at each step, '
+              '{tips_series} with the same tips for a whole dilution, '
+              'saving {tips_saved} tips and about '
+              '{seconds_saved:.0f} s of pick up/drop'.format(**report))
+    return report
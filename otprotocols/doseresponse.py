@@ -0,0 +1,318 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Dose-response design: from the concentration of each drug in the library and
+the doses we want, the volumes of every transfer and solvent top-up.
+
+Each dose of a drug is a well (or a column, with a multichannel) that gets
+    transfer    ul from the library (first dose) or from the previous dose
+    solvent     ul of solvent, so that the well has working_volume ul
+with transfer / working_volume = dose / previous concentration. Drugs only get
+the doses up to their library concentration, so one list of doses serves a
+library with drugs at 100 mM and 30 mM:
+
+    design = design_dilutions([100, 30], [100, 30, 10, 3, 1], 11)
+    design['transfer']  # [[11, 3.3, 3.67, 3.3, 3.67],
+                        #  [nan, 11, 3.67, 3.3, 3.67]]
+
+Volumes smaller than the pipette minimum are avoided by raising the working
+volume of that well, and each well keeps at least min_left ul after the next
+dose is taken from it. Everything is computed for the whole library at once
+(arrays of n_drugs x n_doses). design_plan turns a design into a plan (see
+otprotocols.plan), stock_layout places the doses like the syngenta protocol.
+
+    python -m otprotocols.doseresponse --n-drugs 240 --top-conc 100
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from otprotocols.plan import make_step, channel_wells
+
+# APIv1 P10 minimum volume, ul
+P10_MIN_VOLUME = 1.0
+# volumes are rounded to this many decimals, as we write them by hand
+VOLUME_DECIMALS = 2
+# half log doses of the syngenta library, mM
+SYNGENTA_DOSES = [100, 30, 10, 3, 1]
+
+
+def design_dilutions(
+        top_conc, doses, working_volume, min_volume=P10_MIN_VOLUME,
+        max_volume=None, min_left=0.0, in_place=False, rtol=1e-6):
+    """
+    Return a dict of (n_drugs, n_doses) arrays (nan for doses a drug skips):
+        used        bool, dose below the library concentration of the drug
+        transfer    ul from the library or previous dose into the well
+        solvent     ul of solvent into the well
+        working     ul in the well once filled
+        final       ul left in the well at the end
+        conc        concentration actually reached, after rounding volumes
+    and 'ok' (n_drugs,), False if a well of the drug overflows max_volume.
+    top_conc: concentration of each drug in the library
+    doses: decreasing, same unit as top_conc
+    in_place: the first dose is the library well itself (its concentration
+        must be the library one), and working_volume is what it holds
+    """
+    top_conc = np.atleast_1d(np.asarray(top_conc, dtype=float))
+    doses = np.asarray(doses, dtype=float)
+    assert (np.diff(doses) < 0).all(), 'doses must be decreasing'
+    n_drugs, n_doses = len(top_conc), len(doses)
+    doses = np.broadcast_to(doses, (n_drugs, n_doses))
+    used = doses <= top_conc[:, None] * (1 + rtol)
+    first = used & ~np.concatenate(
+        [np.zeros((n_drugs, 1), dtype=bool), used[:, :-1]], axis=1)
+    previous = np.concatenate([top_conc[:, None], doses[:, :-1]], axis=1)
+    previous = np.where(first, top_conc[:, None], previous)
+    factor = np.where(used, np.minimum(doses / previous, 1), np.nan)
+    if in_place:
+        assert np.allclose(factor[first], 1, rtol=rtol), (
+            'in place, the first dose must be the library concentration')
+
+    # smallest working volume that keeps both volumes above the minimum
+    with np.errstate(divide='ignore', invalid='ignore'):
+        working = np.fmax(
+            np.fmax(working_volume, min_volume / factor),
+            np.where(factor < 1, min_volume / (1 - factor), 0))
+    working = np.where(used, working, np.nan)
+
+    def _volumes(working):
+        transfer = np.round(working * factor, VOLUME_DECIMALS)
+        if in_place:
+            transfer = np.where(first, 0.0, transfer)
+        solvent = np.where(
+            first & in_place, 0.0,
+            np.round(working - transfer, VOLUME_DECIMALS))
+        return transfer, solvent
+
+    # each well has to give the next dose and keep min_left
+    transfer, solvent = _volumes(working)
+    for dose in range(n_doses - 2, -1, -1):
+        needed = np.where(
+            used[:, dose + 1], transfer[:, dose + 1] + min_left, 0)
+        working[:, dose] = np.fmax(working[:, dose], needed)
+        transfer, solvent = _volumes(working)
+    working = np.where(first & in_place, working, transfer + solvent)
+
+    taken = np.concatenate(
+        [np.where(used[:, 1:], transfer[:, 1:], 0),
+         np.zeros((n_drugs, 1))], axis=1)
+    final = np.where(used, working - taken, np.nan)
+    ratio = np.where(used & ~(first & in_place), transfer / working, 1.0)
+    conc = np.where(used, top_conc[:, None] * np.cumprod(ratio, axis=1),
+                    np.nan)
+    ok = (final >= min_left - 1e-9) | ~used
+    if max_volume is not None:
+        ok &= (working <= max_volume) | ~used
+    return {
+        'used': used,
+        'transfer': np.where(used, transfer, np.nan),
+        'solvent': np.where(used, solvent, np.nan),
+        'working': working,
+        'final': final,
+        'conc': conc,
+        'ok': ok.all(axis=1),
+        }
+
+
+def chain_volumes(design, drug=0):
+    """
+    Return the transfers of the dilution steps of a drug, as the protocols
+    list them (e.g. drugs_volumes_for_dilutions)
+    """
+    used = design['used'][drug]
+    return [float(v) for v in design['transfer'][drug][used][1:]]
+
+
+def block_of(counter, block_columns):
+    """
+    Return (index, first counter, end counter) of the block a counter is in,
+    with blocks of block_columns columns one after the other (cycled)
+    """
+    cycle = sum(block_columns)
+    n_cycles, rest = divmod(int(counter), cycle)
+    start = n_cycles * cycle
+    for bc, n_columns in enumerate(block_columns):
+        if rest < n_columns:
+            return n_cycles * len(block_columns) + bc, start, start + n_columns
+        rest -= n_columns
+        start += n_columns
+
+
+def chain_counters(n_doses, block_columns=None):
+    """
+    Return the counter (index of the column across the stock plates, as in
+    counter_to_platecolumn) of the first dose of each drug, the doses of a
+    drug in consecutive columns.
+    block_columns: columns of each block, cycled (e.g. the banks of a double
+        buffered deck): a drug that would span two blocks starts at the next
+        one, so that its whole chain is in one block
+    """
+    n_doses = np.asarray(n_doses, dtype=int)
+    if not block_columns:
+        return np.concatenate([[0], np.cumsum(n_doses)[:-1]]).astype(int)
+    assert n_doses.max() <= min(block_columns), 'a drug does not fit a block'
+    counters = []
+    counter = 0
+    for n_drug_doses in n_doses:
+        _, _, block_end = block_of(counter, block_columns)
+        if counter + n_drug_doses > block_end:
+            counter = block_end
+        counters.append(counter)
+        counter += n_drug_doses
+    return np.array(counters, dtype=int)
+
+
+def stock_layout(n_doses, stock_slots, useful_columns=range(2, 12),
+                 block_columns=None):
+    """
+    Place the doses of each drug in consecutive columns of the stock plates,
+    like counter_to_platecolumn in syngenta_library_to_stock_plates.py.
+    n_doses: doses of each drug
+    block_columns: see chain_counters
+    Return (dose_wells, rounds): (n_drugs, max doses) object arrays with the
+    (slot, 'A<col>') of each dose and the round of stock plates it is in
+    (None where a drug has fewer doses).
+    """
+    n_doses = np.asarray(n_doses, dtype=int)
+    useful_columns = list(useful_columns)
+    counters = chain_counters(n_doses, block_columns)
+    counters = counters[:, None] + np.arange(n_doses.max())[None, :]
+    has_dose = np.arange(n_doses.max())[None, :] < n_doses[:, None]
+    per_plate = len(useful_columns)
+    per_round = per_plate * len(stock_slots)
+    dose_wells = np.full(counters.shape, None, dtype=object)
+    rounds = np.full(counters.shape, None, dtype=object)
+    for ind in zip(*np.nonzero(has_dose)):
+        counter = counters[ind]
+        slot = stock_slots[(counter // per_plate) % len(stock_slots)]
+        col = useful_columns[counter % per_plate]
+        dose_wells[ind] = (str(slot), 'A{}'.format(col))
+        rounds[ind] = int(counter // per_round)
+    return dose_wells, rounds
+
+
+def _used_wells(design, dose_wells):
+    # dose wells aligned to the right of the design, as the doses a drug
+    # skips are the highest ones
+    out = np.full(design['used'].shape, None, dtype=object)
+    for drug, used in enumerate(design['used']):
+        wells = [w for w in dose_wells[drug] if w is not None]
+        for dose, well in zip(np.flatnonzero(used), wells):
+            out[drug, dose] = well
+    return out
+
+
+def design_plan(
+        design, library_wells, dose_wells, solvent_source, n_channels=1,
+        pipettes=None, rounds=None, compounds=None, mix_before=(2, 10),
+        mix_after=(3, 10), options=None):
+    """
+    Return the plan of a design: per round of plates (steps have a 'round'
+    key, 0 if rounds is None), the solvent top-ups (one tip), then for each
+    drug the transfer from the library (single channel, one tip per drug,
+    into each well the multichannel will use) and the dilution steps (one
+    chain per drug).
+    library_wells: (slot, well) of each drug
+    dose_wells: (slot, well) of each dose of each drug, in order, as from
+        stock_layout (first channel, if n_channels > 1)
+    pipettes: names in the plan of the 'solvent', 'library' and 'dilution'
+        pipettes
+    """
+    names = {'solvent': 'multi', 'library': 'single', 'dilution': 'multi'}
+    names.update(pipettes or {})
+    options = dict(options or {'blow_out': True})
+    wells = _used_wells(design, dose_wells)
+    if rounds is None:
+        rounds = np.where(design['used'], 0, None)
+    else:
+        rounds = _used_wells(design, rounds)
+    n_drugs, n_doses = design['used'].shape
+    compounds = compounds or list(range(n_drugs))
+
+    plan = []
+    for round_ind in sorted(set(r for r in rounds.ravel() if r is not None)):
+        in_round = design['used'] & (rounds == round_ind)
+        for drug, dose in zip(*np.nonzero(in_round & (design['solvent'] > 0))):
+            plan.append(make_step(
+                'solvent', names['solvent'], design['solvent'][drug, dose],
+                solvent_source, wells[drug, dose], n_channels=n_channels,
+                options=dict(options, new_tip='once'),
+                chain=('solvent', round_ind), compound='DMSO',
+                round=round_ind))
+        for drug in np.flatnonzero(in_round.any(axis=1)):
+            for dose in np.flatnonzero(in_round[drug]):
+                volume = design['transfer'][drug, dose]
+                if volume == 0:
+                    continue
+                annotations = dict(
+                    compound=compounds[drug], dose=design['conc'][drug, dose],
+                    round=round_ind)
+                is_first = dose == np.flatnonzero(design['used'][drug])[0]
+                if is_first:
+                    slot, well = wells[drug, dose]
+                    for channel_well in channel_wells(well, n_channels):
+                        plan.append(make_step(
+                            'library', names['library'], volume,
+                            library_wells[drug], (slot, channel_well),
+                            options=dict(options, new_tip='once'),
+                            chain=('library', drug), **annotations))
+                    continue
+                step_options = dict(
+                    options, new_tip='once', mix_before=mix_before,
+                    mix_after=mix_after)
+                plan.append(make_step(
+                    'dilution', names['dilution'], volume,
+                    wells[drug, dose - 1], wells[drug, dose],
+                    n_channels=n_channels, options=step_options,
+                    chain=('dilution', drug), **annotations))
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Transfer and solvent volumes of a dose-response library')
+    parser.add_argument('--n-drugs', type=int, default=240)
+    parser.add_argument('--top-conc', type=float, nargs='+', default=[100],
+                        help='library concentration, one or one per drug')
+    parser.add_argument('--doses', type=float, nargs='+',
+                        default=SYNGENTA_DOSES)
+    parser.add_argument('--working-volume', type=float, default=11)
+    parser.add_argument('--min-volume', type=float, default=P10_MIN_VOLUME)
+    parser.add_argument('--min-left', type=float, default=0.0)
+    args = parser.parse_args()
+    top_conc = np.resize(args.top_conc, args.n_drugs)
+
+    tic = time.time()
+    design = design_dilutions(
+        top_conc, args.doses, args.working_volume, args.min_volume,
+        min_left=args.min_left)
+    n_doses = design['used'].sum(axis=1)
+    dose_wells, rounds = stock_layout(n_doses, ['1', '2', '4', '5', '7', '8'])
+    plan = design_plan(
+        design, [('10', 'A1')] * args.n_drugs, dose_wells, ('11', 'A1'),
+        n_channels=8, rounds=rounds)
+    toc = time.time()
+
+    print('{} drugs, {} steps, designed in {:.0f} ms'.format(
+        args.n_drugs, len(plan), 1000 * (toc - tic)))
+    patterns = {}
+    for drug in range(args.n_drugs):
+        used = design['used'][drug]
+        key = (float(top_conc[drug]),
+               tuple(design['transfer'][drug][used].tolist()),
+               tuple(design['solvent'][drug][used].tolist()))
+        patterns[key] = patterns.get(key, 0) + 1
+    for (conc, transfer, solvent), count in patterns.items():
+        print('{} drugs at {:g}: transfer {}, solvent {}'.format(
+            count, conc, list(transfer), list(solvent)))
+    if not design['ok'].all():
+        print('{} drugs do not fit the wells'.format(
+            (~design['ok']).sum()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+How long will a run take: per-command durations fitted on past runs.
+
+Each run is described by a few features of its command stream (tip pick ups
+and drops, aspirations, dispenses, ul aspirated, blow outs, touch tips,
+metres travelled, pauses) and its duration, from the start time in the
+runlog header (see otprotocols.runlogs.write_runlog) to the end time in its
+name; delays are known, so they are taken out. The seconds per unit of each
+feature are the least squares fit over the runs, pulled towards the rough
+values of otprotocols.simcache (so that a few runs are enough to start
+with), and never negative. The pause coefficient is how long the operator
+takes, on average, to resume.
+
+    python -m otprotocols.eta calibrate
+    python -m otprotocols.eta predict syngenta_library_to_stock_plates.py
+
+The model is recalibrated whenever it is loaded: the runlogs it has not
+seen are added and the seconds refitted (instant), so predictions always
+use every finished run. calibrate does the same and prints the model.
+"""
+
+import os
+import re
+import json
+import argparse
+import datetime
+
+import numpy as np
+
+from otprotocols.runlogs import RUNLOG_DIR, RUNLOG_SUFFIX, TIME_FORMAT
+from otprotocols.runlogs import read_runlog
+from otprotocols.deck import GANTRY_SPEED
+from otprotocols.simcache import COMMAND_SECONDS, DELAY_REGEX
+from otprotocols.versiondiff import travel_mm
+
+ETA_MODEL_FILE = os.path.join(RUNLOG_DIR, 'eta_model.json')
+
+FEATURES = [
+    'pick_up', 'drop', 'aspirate', 'dispense', 'aspirate_ul', 'blow_out',
+    'touch_tip', 'travel_m', 'pause']
+FEATURE_PREFIXES = {
+    'Picking up tip': 'pick_up',
+    'Dropping tip': 'drop',
+    'Aspirating': 'aspirate',
+    'Dispensing': 'dispense',
+    'Blowing out': 'blow_out',
+    'Touching tip': 'touch_tip',
+    'Pausing': 'pause',
+    }
+# seconds per unit before any run is seen
+PRIOR_SECONDS = {
+    'pick_up': COMMAND_SECONDS['Picking up tip'],
+    'drop': COMMAND_SECONDS['Dropping tip'],
+    'aspirate': COMMAND_SECONDS['Aspirating'],
+    'dispense': COMMAND_SECONDS['Dispensing'],
+    'aspirate_ul': 0.0,
+    'blow_out': COMMAND_SECONDS['Blowing out'],
+    'touch_tip': COMMAND_SECONDS['Touching tip'],
+    'travel_m': 1000 / GANTRY_SPEED,
+    'pause': 60.0,
+    }
+VOLUME_REGEX = re.compile(r'^Aspirating (\d+(?:\.\d+)?) uL')
+
+
+def command_features(commands):
+    """
+    Return (features, delay seconds) of a list of commands: an array with
+    one value per name in FEATURES, and the total of the explicit delays
+    """
+    counts = dict.fromkeys(FEATURES, 0.0)
+    delays = 0.0
+    for command in commands:
+        match = DELAY_REGEX.search(command)
+        if match is not None:
+            delays += 60 * int(match.group(1)) + float(match.group(2))
+            continue
+        for prefix, feature in FEATURE_PREFIXES.items():
+            if command.startswith(prefix):
+                counts[feature] += 1
+                break
+        match = VOLUME_REGEX.match(command)
+        if match is not None:
+            counts['aspirate_ul'] += float(match.group(1))
+    counts['travel_m'] = travel_mm(commands) / 1000
+    return np.array([counts[f] for f in FEATURES]), delays
+
+
+def new_model():
+    return {
+        'features': FEATURES,
+        'seconds': [PRIOR_SECONDS[f] for f in FEATURES],
+        'runs': {},
+        }
+
+
+def load_model(path=ETA_MODEL_FILE, log_dir=RUNLOG_DIR):
+    """
+    Return the model, recalibrated on the runlogs of log_dir it has not
+    seen yet (None not to look for new runs)
+    """
+    if os.path.exists(path):
+        with open(path) as fid:
+            model = json.load(fid)
+    else:
+        model = new_model()
+    if log_dir is not None and os.path.isdir(log_dir):
+        if add_runlogs(model, log_dir):
+            refit(model)
+            save_model(model, path)
+    return model
+
+
+def save_model(model, path=ETA_MODEL_FILE):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fid:
+        json.dump(model, fid)
+    os.replace(tmp_path, path)
+
+
+def fit(features, durations, prior=None, weight=1.0):
+    """
+    Return the seconds per unit of each feature: least squares of
+    features (n_runs x n_features) @ seconds = durations, with a ridge
+    penalty weight * (seconds - prior)**2, clipped at 0
+    """
+    features = np.asarray(features, dtype=float).reshape(-1, len(FEATURES))
+    durations = np.asarray(durations, dtype=float)
+    if prior is None:
+        prior = np.array([PRIOR_SECONDS[f] for f in FEATURES])
+    # scale the penalty with how much each feature is used
+    scale = np.maximum(features.mean(axis=0), 1.0) if len(features) else 1.0
+    penalty = weight * np.diag(scale ** 2)
+    lhs = features.T @ features + penalty
+    rhs = features.T @ durations + penalty @ prior
+    return np.maximum(np.linalg.solve(lhs, rhs), 0)
+
+
+def add_runlogs(model, log_dir=RUNLOG_DIR):
+    """
+    Add to the model the runlogs of log_dir it has not seen yet (only those
+    with a start time). Return how many were added.
+    """
+    n_added = 0
+    for fname in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, fname)
+        if not fname.endswith(RUNLOG_SUFFIX) or fname in model['runs']:
+            continue
+        header, commands = read_runlog(path)
+        if not header.get('started') or not header.get('finished'):
+            continue
+        duration = (
+            datetime.datetime.strptime(header['finished'], TIME_FORMAT)
+            - datetime.datetime.strptime(header['started'], TIME_FORMAT)
+            ).total_seconds()
+        features, delays = command_features(commands)
+        model['runs'][fname] = {
+            'features': features.tolist(),
+            'seconds': duration - delays,
+            }
+        n_added += 1
+    return n_added
+
+
+def refit(model):
+    """
+    Refit the seconds per unit of the model on all its runs
+    """
+    runs = list(model['runs'].values())
+    model['seconds'] = fit(
+        [run['features'] for run in runs],
+        [run['seconds'] for run in runs]).tolist()
+    return model
+
+
+def calibrate(log_dir=RUNLOG_DIR, model_path=ETA_MODEL_FILE):
+    """
+    Add the runlogs of log_dir not in the model yet, refit and save.
+    Return the model.
+    """
+    model = load_model(model_path, log_dir=None)
+    add_runlogs(model, log_dir)
+    refit(model)
+    save_model(model, model_path)
+    return model
+
+
+def predict_seconds(commands, model=None):
+    """
+    Return the predicted duration (s) of a command stream
+    """
+    model = model or new_model()
+    features, delays = command_features(commands)
+    return float(features @ np.array(model['seconds'])) + delays
+
+
+def remaining_seconds(commands, n_done, model=None):
+    """
+    Return the predicted time left once the first n_done commands are done
+    """
+    return predict_seconds(commands[n_done:], model)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fit command durations on runlogs, predict run times')
+    parser.add_argument('--log-dir', default=RUNLOG_DIR)
+    parser.add_argument('--model', default=None)
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('calibrate')
+    predict_parser = subparsers.add_parser('predict')
+    predict_parser.add_argument('protocols', nargs='+')
+    args = parser.parse_args()
+
+    model_path = args.model or os.path.join(args.log_dir, 'eta_model.json')
+    if args.action == 'calibrate':
+        model = calibrate(args.log_dir, model_path)
+        print('{} runs'.format(len(model['runs'])))
+        for feature, seconds in zip(model['features'], model['seconds']):
+            print('{:<12} {:8.3f} s'.format(feature, seconds))
+    elif args.action == 'predict':
+        from otprotocols.simcache import cached_simulate
+        model = load_model(model_path, args.log_dir)
+        for protocol in args.protocols:
+            entry, _ = cached_simulate(protocol)
+            print('{}: {:.0f} min'.format(
+                protocol, predict_seconds(entry['commands'], model) / 60))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Golden files of the command streams of the protocols, to see what a change
+does on the robot.
+
+    python -m otprotocols.simserver serve &
+    python -m otprotocols.golden check
+
+record simulates a protocol (through otprotocols.simcache, so a running
+otprotocols.simserver) at the fixed parameters of GOLDEN_PROTOCOLS, and
+stores them with its normalised command stream and a rolling hash in
+golden/<protocol name>.json. check simulates it again at the parameters of
+its golden file: if the hash is the same there is nothing to do, otherwise
+it lists the commands added, removed and moved, and what they do to the
+estimated duration. Without protocols, both act on GOLDEN_PROTOCOLS, and
+check exits with an error if any protocol changed or failed: run it before
+committing a change to a protocol or to otprotocols, and record again the
+protocols whose change is intended.
+
+The diff skips the common start and end, then pairs the k-th occurrence of
+a command in the old stream with its k-th occurrence in the new one, first
+with its neighbouring commands as context, then alone (dicts, linear time).
+Pairs in the same order in both streams (longest increasing subsequence,
+n log n) are in place, the others are the moved commands. Protocols of 10k
+commands are compared in a few tens of ms.
+"""
+
+import os
+import re
+import sys
+import json
+import bisect
+import hashlib
+import argparse
+
+from otprotocols.simcache import estimate_seconds, cached_simulate
+
+GOLDEN_DIR = 'golden'
+# protocols with a golden file, and the parameters they are simulated at
+GOLDEN_PROTOCOLS = {
+    'prestwick_library_serial_dilution_faster.py': {
+        'solvent_pipette_type': 'p50-Single', 'control_layout': 'blocks',
+        'dilution_tip_mode': 'always', 'dilution_micro_ops': False},
+    'prestwick_library_to_shuffled_stockplates.py': {
+        'date': 20201118, 'plate_number': 0, 'double_buffered': False},
+    'schulenburg_library_to_stock_plates.py': {
+        'seed': 20191220, 'replica_mode': None},
+    'syngenta_library_to_stock_plates.py': {
+        'dilution_tip_mode': 'always', 'double_buffered': False},
+    'tiprack_audit.py': {
+        'is_new_rack': False, 'trust_tip_state': True},
+    'water+replicatewithshuffle_4x96WP.py': {
+        'seed': 20191205, 'agar_volume': None,
+        'agar_calibration_file': None},
+    }
+HASH_BASE = 1000003
+HASH_MOD = 2**61 - 1
+NUMBER_REGEX = re.compile(r'-?\d+\.\d+')
+
+
+def normalise(commands):
+    """
+    Return the commands with whitespace collapsed and floats rounded to 2
+    decimals, so that only changes that matter on the robot show up
+    """
+    out = []
+    for command in commands:
+        command = ' '.join(command.split())
+        command = NUMBER_REGEX.sub(
+            lambda m: '{:g}'.format(round(float(m.group()), 2)), command)
+        out.append(command)
+    return out
+
+
+def command_hash(command):
+    return int(hashlib.md5(command.encode('utf-8')).hexdigest()[:15], 16)
+
+
+def rolling_hash(commands):
+    """
+    Return the polynomial rolling hash of a command stream (as a hex str).
+    Streams with the same commands in a different order hash differently.
+    """
+    value = 0
+    for command in commands:
+        value = (value * HASH_BASE + command_hash(command)) % HASH_MOD
+    return '{:016x}'.format(value)
+
+
+def _longest_increasing(values):
+    """
+    Return the indices of a longest strictly increasing subsequence
+    """
+    tail_values = []  # smallest last value of an increasing run of k+1
+    tails = []        # and its index
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        k = bisect.bisect_left(tail_values, value)
+        if k > 0:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+            tail_values.append(value)
+        else:
+            tails[k] = i
+            tail_values[k] = value
+    out = []
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        out.append(i)
+        i = previous[i]
+    return out[::-1]
+
+
+def _match_occurrences(old_keys, new_keys, old_todo, new_todo):
+    """
+    Pair the k-th occurrence of a key among old_todo (indices in old) with
+    its k-th occurrence among new_todo. Return a dict {new index: old index}
+    """
+    positions = {}
+    for i in old_todo:
+        positions.setdefault(old_keys[i], []).append(i)
+    seen = {}
+    pairs = {}
+    for j in new_todo:
+        key = new_keys[j]
+        k = seen.get(key, 0)
+        old_positions = positions.get(key, ())
+        if k < len(old_positions):
+            seen[key] = k + 1
+            pairs[j] = old_positions[k]
+    return pairs
+
+
+def _with_context(commands):
+    # a command with its neighbours, much more unique than the command alone
+    padded = [None] + list(commands) + [None]
+    return [tuple(padded[i:i+3]) for i in range(len(commands))]
+
+
+def diff_commands(old, new):
+    """
+    Compare two (normalised) command streams.
+    Return a dict with lists of (index, command): 'added' (index in new),
+    'removed' (index in old), 'moved' (index in new), and 'seconds' (change
+    in estimated duration).
+    """
+    # common start and end are unchanged
+    n_start = 0
+    while (n_start < min(len(old), len(new))
+           and old[n_start] == new[n_start]):
+        n_start += 1
+    n_end = 0
+    while (n_end < min(len(old), len(new)) - n_start
+           and old[-1 - n_end] == new[-1 - n_end]):
+        n_end += 1
+    old_todo = range(n_start, len(old) - n_end)
+    new_todo = range(n_start, len(new) - n_end)
+    # pair commands in the same context first, then the same commands
+    pairs = _match_occurrences(
+        _with_context(old), _with_context(new), old_todo, new_todo)
+    paired_old = set(pairs.values())
+    pairs.update(_match_occurrences(
+        old, new,
+        [i for i in old_todo if i not in paired_old],
+        [j for j in new_todo if j not in pairs]))
+    paired_old = set(pairs.values())
+    added = [(j, new[j]) for j in new_todo if j not in pairs]
+    removed = [(i, old[i]) for i in old_todo if i not in paired_old]
+    # pairs in the same order in both streams are in place, the rest moved
+    matched_new = sorted(pairs)
+    matched_old = [pairs[j] for j in matched_new]
+    in_place = set(_longest_increasing(matched_old))
+    moved = [
+        (j, new[j]) for m, j in enumerate(matched_new) if m not in in_place]
+    seconds = (estimate_seconds([c for _, c in added], speed=None)
+               - estimate_seconds([c for _, c in removed], speed=None))
+    return {
+        'added': added,
+        'removed': removed,
+        'moved': moved,
+        'seconds': seconds,
+        }
+
+
+def golden_path(protocol, golden_dir=None):
+    if golden_dir is None:
+        golden_dir = os.path.join(
+            os.path.dirname(os.path.abspath(protocol)), GOLDEN_DIR)
+    name = os.path.splitext(os.path.basename(protocol))[0]
+    return os.path.join(golden_dir, name + '.json')
+
+
+def golden_parameters(protocol, golden_dir=None):
+    """
+    Return the parameters the golden file of protocol was recorded at
+    """
+    with open(golden_path(protocol, golden_dir)) as fid:
+        return json.load(fid).get('parameters')
+
+
+def record(protocol, commands, golden_dir=None, parameters=None):
+    """
+    Write the golden file of a protocol, return its path
+    """
+    commands = normalise(commands)
+    path = golden_path(protocol, golden_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fid:
+        json.dump({
+            'protocol': os.path.basename(protocol),
+            'parameters': parameters,
+            'hash': rolling_hash(commands),
+            'n_commands': len(commands),
+            'commands': commands,
+            }, fid, indent=0)
+    return path
+
+
+def check(protocol, commands, golden_dir=None):
+    """
+    Compare commands with the golden file of protocol.
+    Return None if they match, the output of diff_commands otherwise.
+    """
+    with open(golden_path(protocol, golden_dir)) as fid:
+        golden = json.load(fid)
+    commands = normalise(commands)
+    if rolling_hash(commands) == golden['hash']:
+        return None
+    return diff_commands(golden['commands'], commands)
+
+
+def print_diff(protocol, diff, max_lines=20):
+    print('{}: {} added, {} removed, {} moved, {:+.0f} s'.format(
+        protocol, len(diff['added']), len(diff['removed']),
+        len(diff['moved']), diff['seconds']))
+    for sign, key in [('+', 'added'), ('-', 'removed'), ('~', 'moved')]:
+        for index, command in diff[key][:max_lines]:
+            print('  {} {:6d} {}'.format(sign, index, command))
+        if len(diff[key]) > max_lines:
+            print('  {} ... {} more'.format(sign, len(diff[key]) - max_lines))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Record or check golden command streams of protocols')
+    parser.add_argument('action', choices=['record', 'check'])
+    parser.add_argument(
+        'protocols', nargs='*', default=sorted(GOLDEN_PROTOCOLS),
+        help='default: all the protocols of GOLDEN_PROTOCOLS')
+    parser.add_argument('--golden-dir', default=None)
+    args = parser.parse_args()
+
+    n_changed = 0
+    for protocol in args.protocols:
+        if args.action == 'record':
+            parameters = GOLDEN_PROTOCOLS.get(os.path.basename(protocol))
+        elif not os.path.isfile(golden_path(protocol, args.golden_dir)):
+            print('{}: no golden file, record it first'.format(protocol),
+                  file=sys.stderr)
+            n_changed += 1
+            continue
+        else:
+            parameters = golden_parameters(protocol, args.golden_dir)
+        try:
+            entry, _ = cached_simulate(protocol, parameters)
+        except RuntimeError as err:
+            print('{}: FAILED\n{}'.format(protocol, err), file=sys.stderr)
+            n_changed += 1
+            continue
+        if args.action == 'record':
+            path = record(
+                protocol, entry['commands'], args.golden_dir, parameters)
+            print('{}: {} commands -> {}'.format(
+                protocol, len(entry['commands']), path))
+            continue
+        diff = check(protocol, entry['commands'], args.golden_dir)
+        if diff is None:
+            print('{}: unchanged'.format(protocol))
+        else:
+            n_changed += 1
+            print_diff(protocol, diff)
+    if n_changed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
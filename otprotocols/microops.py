@@ -0,0 +1,313 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Run a plan as the minimal sequence of pipette actions, instead of
+pipette.transfer calls.
+
+APIv1 transfer() with blow_out=True blows out into the trash after every
+dispense (a trip across the deck and back), and mixes, touches tips and
+splits volumes by its own rules. compile_plan turns a plan into a flat list
+of micro-ops, once, with every option explicit:
+
+    ('pick_up', pipette)
+    ('drop', pipette)
+    ('mix', pipette, repetitions, volume, location)
+    ('aspirate', pipette, volume, location)
+    ('dispense', pipette, volume, location)
+    ('blow_out', pipette, location)   # location None: the trash
+    ('touch_tip', pipette, location)
+
+where location is (slot, well, offset from the bottom or None). By default
+blow outs happen at the top of the destination well; blow_out_at='trash'
+blows out where transfer() does.
+
+    python -m otprotocols.microops bench --param dilution_tip_mode=series
+
+simulates prestwick_library_serial_dilution_faster.py with its dilutions run
+by transfer() and by micro-ops (dilution_micro_ops False and True, through
+otprotocols.simcache, so a simulation server is needed on a miss) and
+compares the two robot.commands() streams as otprotocols.versiondiff does.
+The gain is the trips to the trash for blow outs: none with a new tip per
+dilution step, as the tip goes to the trash anyway. The z travel saved by
+lower arcs does not show in the commands (see otprotocols.arcs).
+
+execute_plan_ops runs the micro-ops on the robot, a group of steps at a
+time (same grouping and tips as otprotocols.plan.execute_plan). Given the
+heights of the labware on the deck (otprotocols.arcs.loaded_heights), moves
+between wells go only as high as needed; given a MotionManager
+(otprotocols.motion), speeds and flow rates follow the slot and liquid.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from otprotocols.plan import group_steps, split_steps, transfer_options
+from otprotocols.deck import well_xy
+from otprotocols.simcache import cached_simulate
+from otprotocols.simserver import parse_param
+from otprotocols.versiondiff import phase_metrics, print_comparison
+from otprotocols.arcs import arc_tops, arc_to
+
+BLOW_OUT_PLACES = ('destination', 'trash')
+BENCH_PROTOCOL = 'prestwick_library_serial_dilution_faster.py'
+BENCH_PARAMETER = 'dilution_micro_ops'
+
+
+def _where(slot_well, offset):
+    return (slot_well[0], slot_well[1], offset)
+
+
+def _compile_group(group, max_volume, blow_out_at, held_tip):
+    # held_tip: the pipette already holds the tip for this group
+    first = group[0]
+    name = first['pipette']
+    options = transfer_options(first['options'])
+    new_tip = options.get('new_tip', 'once')
+    ops = []
+    if new_tip == 'once' and not held_tip:
+        ops.append(('pick_up', name))
+    if first.get('aspiration') is not None:
+        # one aspiration, several dispenses, disposal volume to the trash
+        src = _where(first['source'], first['source_offset'])
+        total = sum(s['volume'] for s in group) + first['disposal_volume']
+        ops.append(('aspirate', name, total, src))
+        for step in group:
+            ops.append(('dispense', name, step['volume'], _where(
+                step['destination'], step['destination_offset'])))
+        if first['disposal_volume'] > 0 or options.get('blow_out'):
+            ops.append(('blow_out', name, None))
+    else:
+        for step in group:
+            src = _where(step['source'], step['source_offset'])
+            dst = _where(step['destination'], step['destination_offset'])
+            if new_tip == 'always':
+                ops.append(('pick_up', name))
+            # same split as transfer(): equal parts within the capacity
+            n_parts = int(np.ceil(step['volume'] / max_volume))
+            part = step['volume'] / n_parts
+            for _ in range(n_parts):
+                if options.get('mix_before'):
+                    ops.append(('mix', name) + tuple(options['mix_before'])
+                               + (src,))
+                ops.append(('aspirate', name, part, src))
+                if options.get('touch_tip'):
+                    ops.append(('touch_tip', name, src))
+                ops.append(('dispense', name, part, dst))
+                if options.get('mix_after'):
+                    ops.append(('mix', name) + tuple(options['mix_after'])
+                               + (dst,))
+                if options.get('blow_out'):
+                    ops.append((
+                        'blow_out', name,
+                        dst[:2] + (None,) if blow_out_at == 'destination'
+                        else None))
+                if options.get('touch_tip'):
+                    ops.append(('touch_tip', name, dst))
+            if new_tip == 'always':
+                ops.append(('drop', name))
+    if new_tip == 'once' and not held_tip and first.get('chain') is None:
+        ops.append(('drop', name))
+    return ops
+
+
+def compile_plan(plan, max_volumes, blow_out_at='destination',
+                 per_step=False):
+    """
+    Return a list of (group of steps, micro-ops) for a plan.
+    max_volumes: dict {step['pipette']: max volume}
+    blow_out_at: 'destination' (top of the well just dispensed into) or
+        'trash' (like transfer)
+    per_step: split groups into single steps where that makes the same ops
+        (see otprotocols.plan.split_steps), to report progress per step
+    Steps of a chain with new_tip='once' share a tip, as in execute_plan.
+    """
+    if blow_out_at not in BLOW_OUT_PLACES:
+        raise ValueError('blow_out_at must be one of {}'.format(
+            BLOW_OUT_PLACES))
+    blocks = []
+    held = None
+    for group in group_steps(plan):
+        first = group[0]
+        name = first['pipette']
+        chain = first.get('chain')
+        ops = []
+        if held is not None and held != (name, chain):
+            ops.append(('drop', held[0]))
+            held = None
+        held_tip = held is not None
+        new_tip = first['options'].get('new_tip', 'once')
+        if chain is not None and new_tip == 'once':
+            held = (name, chain)
+            new_tip = 'never'
+        parts = split_steps(group, new_tip) if per_step else [group]
+        for pc, part in enumerate(parts):
+            # after the first part, the chain holds the tip
+            ops += _compile_group(
+                part, max_volumes[name], blow_out_at, held_tip or pc > 0)
+            blocks.append((part, ops))
+            ops = []
+    if held is not None:
+        blocks[-1][1].append(('drop', held[0]))
+    return blocks
+
+
+def run_ops(ops, pipettes, plates, heights=None, motion=None,
+            liquid_class=None, _cache=None):
+    """
+    Run micro-ops on the robot.
+    pipettes: dict {step['pipette']: opentrons pipette}
+    plates: dict {slot: opentrons labware}
+    heights: optional {slot: labware height}, for low arcs between wells
+    motion: optional otprotocols.motion.MotionManager, for the speeds of each
+        slot and liquid_class
+    """
+    # locations are made once per well and offset
+    cache = {} if _cache is None else _cache
+    tops = {}
+    previous = None  # (slot, well) the pipette is in, if known
+
+    def _move(pipette, where):
+        # from the previous well (if there was one) to above where
+        to_where = where[:2]
+        if previous == to_where:
+            return
+        to_well = plates[to_where[0]].wells(to_where[1])
+        if motion is not None and previous is not None:
+            motion.leave(
+                pipette, plates[previous[0]].wells(previous[1]), previous[0])
+        if heights is not None and previous is not None:
+            key = (previous, to_where)
+            if key not in tops:
+                tops[key] = float(arc_tops(
+                    [well_xy(*previous)], [well_xy(*to_where)],
+                    [previous[0]], [to_where[0]], heights)[0][0])
+            arc_to(
+                pipette, plates[previous[0]].wells(previous[1]), to_well,
+                tops[key], heights[previous[0]], heights[to_where[0]])
+        elif motion is not None:
+            pipette.move_to(to_well.top())
+        if motion is not None:
+            motion.enter(to_where[0])
+
+    def _loc(where, top=False):
+        key = where + (top,)
+        if key not in cache:
+            well = plates[where[0]].wells(where[1])
+            if top:
+                cache[key] = well.top()
+            elif where[2] is None:
+                cache[key] = well
+            else:
+                cache[key] = well.bottom(where[2])
+        return cache[key]
+
+    def _rate(where, kind):
+        if motion is None:
+            return 1.0
+        return motion.profile(where[0], liquid_class)[kind + '_rate']
+
+    for op in ops:
+        kind = op[0]
+        pipette = pipettes[op[1]]
+        where = op[-1] if kind in ('aspirate', 'dispense', 'mix', 'blow_out',
+                                   'touch_tip') else None
+        if where is not None:
+            _move(pipette, where)
+        elif motion is not None:
+            motion.travel()
+        previous = where[:2] if where is not None else None
+        if kind == 'pick_up':
+            pipette.pick_up_tip()
+        elif kind == 'drop':
+            pipette.drop_tip()
+        elif kind == 'aspirate':
+            pipette.aspirate(
+                op[2], _loc(op[3]), rate=_rate(op[3], 'aspirate'))
+        elif kind == 'dispense':
+            pipette.dispense(
+                op[2], _loc(op[3]), rate=_rate(op[3], 'dispense'))
+        elif kind == 'mix':
+            pipette.mix(
+                op[2], op[3], _loc(op[4]), rate=_rate(op[4], 'aspirate'))
+        elif kind == 'blow_out':
+            if op[2] is None:
+                pipette.blow_out(pipette.trash_container)
+            else:
+                pipette.blow_out(_loc(op[2], top=True))
+        elif kind == 'touch_tip':
+            pipette.touch_tip(_loc(op[2]))
+        else:
+            raise ValueError('unknown micro-op {}'.format(kind))
+
+
+def execute_plan_ops(
+        plan, pipettes, plates, telemetry=None, blow_out_at='destination',
+        heights=None, motion=None):
+    """
+    Like otprotocols.plan.execute_plan, with micro-ops instead of transfer.
+    heights: optional {slot: labware height}, for low arcs (see run_ops)
+    motion: optional otprotocols.motion.MotionManager, for the speeds
+        (back to the defaults on return)
+    """
+    max_volumes = {
+        name: pipette.max_volume for name, pipette in pipettes.items()}
+    cache = {}
+    per_step = telemetry is not None
+    blocks = compile_plan(plan, max_volumes, blow_out_at, per_step)
+    try:
+        for group, ops in blocks:
+            tic = time.time()
+            liquid_class = (
+                None if motion is None else motion.liquid_of(group[0]))
+            run_ops(
+                ops, pipettes, plates, heights, motion, liquid_class, cache)
+            if telemetry is not None:
+                telemetry.step_done(len(group), group[0]['phase'],
+                                    time.time() - tic)
+    finally:
+        if motion is not None:
+            motion.restore()
+
+
+def benchmark(path=BENCH_PROTOCOL, parameter=BENCH_PARAMETER, cache=None,
+              parameters=None):
+    """
+    Return (metrics with transfer(), metrics with micro-ops) of the whole
+    simulated command stream of a protocol, parameter False and True (see
+    otprotocols.versiondiff.phase_metrics).
+    parameters: other parameters of the protocol to simulate with
+    """
+    out = []
+    for use_micro_ops in (False, True):
+        entry, _ = cached_simulate(
+            path, dict(parameters or {}, **{parameter: use_micro_ops}),
+            cache=cache)
+        out.append(phase_metrics(entry['commands']))
+    return tuple(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the simulated commands of a protocol run with '
+                    'transfer() and with micro-ops')
+    parser.add_argument('action', choices=['bench'])
+    parser.add_argument('protocol', nargs='?', default=BENCH_PROTOCOL)
+    parser.add_argument('--parameter', default=BENCH_PARAMETER,
+                        help='protocol parameter switching micro-ops on')
+    parser.add_argument(
+        '--param', action='append', default=[], type=parse_param,
+        help='name=value, other protocol parameter to simulate with')
+    args = parser.parse_args()
+    transfer, micro = benchmark(
+        args.protocol, args.parameter, parameters=dict(args.param))
+    print_comparison(
+        [('total', transfer, micro)], 'transfer()', 'micro-ops')
+    print('{:.0f}% of the time saved'.format(
+        100 * (1 - micro['seconds'] / transfer['seconds'])))
+
+
+if __name__ == '__main__':
+    main()
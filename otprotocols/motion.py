@@ -0,0 +1,232 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Motion profiles: how fast the pipette travels, goes down into a well,
+comes back up, and moves liquid, depending on what is in the well.
+
+A profile is a dict of
+    travel          gantry speed between wells (mm/s)
+    approach        z speed going down into a well (mm/s)
+    retract         z speed coming out of a well (mm/s)
+    aspirate_rate   multiplier of the aspirate flow rate
+    dispense_rate   multiplier of the dispense flow rate
+built from MOTION_PROFILES: the base profile, updated with the profile of
+the labware class of the slot (e.g. 'agar': slow down before touching the
+agar) and then of the liquid class of the step (e.g. 'water': dispense
+fast). Setting the speed once per protocol (set_speed(dispense=...*4),
+rate=4.0) either slows everything down to what the agar needs, or goes into
+the agar as fast as anywhere else.
+
+MotionManager applies the profiles in otprotocols.microops.run_ops: before
+leaving a well it retracts to the top at the retract speed, travels at the
+travel speed, and goes down into the next well at the approach speed of its
+slot; aspirate and dispense get the rates of the liquid. The head speeds
+stick in APIv1, so otprotocols.microops.execute_plan_ops puts the defaults
+back (restore) when it returns, and later transfer() calls are not affected.
+water+replicatewithshuffle_4x96WP.py runs its plates this way.
+
+    python -m otprotocols.motion bench
+
+compares the estimated motion time and the fast approaches into agar of
+APIv1 defaults, one safe blanket profile, and per-move profiles.
+"""
+
+import argparse
+
+import numpy as np
+
+from otprotocols.deck import LABWARE, TRASH_SLOT, well_xy
+from otprotocols.deck import GANTRY_SPEED, Z_SPEED, MAX_GANTRY_SPEED
+from otprotocols.arcs import ARC_CLEARANCE_DECK
+
+# fastest approach that does not break the agar surface, mm/s
+AGAR_APPROACH_SPEED = 20.0
+
+MOTION_PROFILES = {
+    'default': {
+        'travel': GANTRY_SPEED, 'approach': Z_SPEED, 'retract': Z_SPEED,
+        'aspirate_rate': 1.0, 'dispense_rate': 1.0},
+    'fast': {'travel': MAX_GANTRY_SPEED},
+    # labware classes
+    'agar': {'approach': AGAR_APPROACH_SPEED},
+    # liquid classes
+    'water': {'dispense_rate': 4.0},
+    'bacteria': {'aspirate_rate': 4.0, 'dispense_rate': 4.0},
+    'dmso': {'aspirate_rate': 0.5, 'dispense_rate': 1.0},
+    }
+
+
+def make_profile(base='fast', labware_class=None, liquid_class=None):
+    """
+    Return the profile (dict) of a move, see module docstring
+    """
+    profile = dict(MOTION_PROFILES['default'])
+    for name in (base, labware_class, liquid_class):
+        if name is not None:
+            profile.update(MOTION_PROFILES[name])
+    return profile
+
+
+class MotionManager(object):
+    """
+    Profiles of the slots of a deck, applied to the robot by run_ops.
+    slot_classes: {slot: labware class}, e.g. {'1': 'agar'}
+    liquid_classes: {step 'compound' or 'liquid': liquid class}
+    """
+
+    def __init__(self, robot, slot_classes=None, liquid_classes=None,
+                 base='fast'):
+        self.robot = robot
+        self.slot_classes = {
+            str(k): v for k, v in (slot_classes or {}).items()}
+        self.liquid_classes = dict(liquid_classes or {})
+        self.base = base
+        self._profiles = {}
+        self._speeds = None
+
+    def liquid_of(self, step):
+        """
+        Return the liquid class of a plan step (None if not known)
+        """
+        liquid = step.get('liquid', step.get('compound'))
+        return self.liquid_classes.get(liquid)
+
+    def profile(self, slot, liquid_class=None):
+        key = (str(slot), liquid_class)
+        if key not in self._profiles:
+            self._profiles[key] = make_profile(
+                self.base, self.slot_classes.get(str(slot)), liquid_class)
+        return self._profiles[key]
+
+    def _head_speed(self, travel, z):
+        # only talk to the robot if something changes
+        if self._speeds != (travel, z):
+            self.robot.head_speed(combined_speed=travel, z=z)
+            self._speeds = (travel, z)
+
+    def leave(self, pipette, well, slot):
+        """
+        Come out of well at the retract speed, ready to travel
+        """
+        profile = self.profile(slot)
+        self._head_speed(profile['travel'], profile['retract'])
+        pipette.move_to(well.top(), strategy='direct')
+
+    def travel(self):
+        """
+        Speeds for moves outside the wells (tips, trash)
+        """
+        profile = self.profile(None)
+        self._head_speed(profile['travel'], profile['retract'])
+
+    def enter(self, slot):
+        """
+        Slow down z for going into a well of slot
+        """
+        profile = self.profile(slot)
+        self._head_speed(profile['travel'], profile['approach'])
+
+    def restore(self):
+        """
+        Put the robot back to the APIv1 default speeds, if changed
+        """
+        if self._speeds is None:
+            return
+        default = MOTION_PROFILES['default']
+        self.robot.head_speed(
+            combined_speed=default['travel'], z=default['approach'])
+        self._speeds = None
+
+
+def _depth(labware_type, offset):
+    # mm from the top of a well to where the tip goes
+    depth = LABWARE.get(labware_type, {}).get('depth', 0.0)
+    return depth if offset is None else max(depth - offset, 0.0)
+
+
+def motion_seconds(ops, deck_labware, profile_of, agar_slots=()):
+    """
+    Return (seconds, fast approaches into agar) of the moves of micro-ops
+    (see otprotocols.microops): travel between wells, arcs and going in and
+    out of wells, with profile_of(slot) giving the profile of each slot.
+    Only moves between wells are counted (not to the tips or the trash).
+    """
+    seconds = 0.0
+    n_fast_agar = 0
+    previous = None
+    for op in ops:
+        if op[0] in ('pick_up', 'drop') or op[-1] is None:
+            continue
+        slot, well, offset = op[-1]
+        if (slot, well) == (previous[:2] if previous else None):
+            continue
+        profile = profile_of(slot)
+        depth = _depth(deck_labware.get(slot), offset)
+        if previous is not None:
+            old = profile_of(previous[0])
+            old_depth = _depth(deck_labware.get(previous[0]), previous[2])
+            distance = np.linalg.norm(
+                np.subtract(well_xy(slot, well), well_xy(*previous[:2])))
+            seconds += (old_depth + ARC_CLEARANCE_DECK) / old['retract']
+            seconds += distance / profile['travel']
+        seconds += (ARC_CLEARANCE_DECK + depth) / profile['approach']
+        if slot in agar_slots and profile['approach'] > AGAR_APPROACH_SPEED:
+            n_fast_agar += 1
+        previous = (slot, well, offset)
+    return seconds, n_fast_agar
+
+
+def benchmark(ops, deck_labware, slot_classes):
+    """
+    Return {name: (seconds, fast approaches into agar)} of the moves of ops
+    with APIv1 defaults everywhere, the agar profile everywhere, and the
+    per-move profiles
+    """
+    agar_slots = {s for s, c in slot_classes.items() if c == 'agar'}
+    default = make_profile('default')
+    blanket = make_profile('default', 'agar')
+    per_move = {
+        slot: make_profile('fast', slot_classes.get(slot))
+        for slot in set(deck_labware) | {TRASH_SLOT}}
+    return {
+        'defaults': motion_seconds(
+            ops, deck_labware, lambda s: default, agar_slots),
+        'blanket': motion_seconds(
+            ops, deck_labware, lambda s: blanket, agar_slots),
+        'per move': motion_seconds(
+            ops, deck_labware, lambda s: per_move.get(s, default),
+            agar_slots),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the motion time of one speed for everything '
+                    'and of per-move profiles')
+    parser.add_argument('action', choices=['bench'])
+    parser.add_argument('--agar-thickness', type=float, default=3.3)
+    args = parser.parse_args()
+
+    from otprotocols.plan import shuffle_plan
+    from otprotocols.microops import compile_plan
+    # like water+replicatewithshuffle_4x96WP: drugs into agar plates
+    dst_slots = ['1', '2', '3', '4']
+    plan = shuffle_plan(
+        {('10', dst): (list(range(12)), list(range(12)))
+         for dst in dst_slots},
+        3.0, source_offset=1, destination_offset=args.agar_thickness,
+        options={'new_tip': 'always', 'blow_out': True})
+    ops = [op for _, block in compile_plan(plan, {'multi': 10})
+           for op in block]
+    deck_labware = {'10': '96-well-plate-pcr-thermofisher'}
+    deck_labware.update(
+        (slot, '96-well-plate-sqfb-whatman') for slot in dst_slots)
+    result = benchmark(ops, deck_labware, {s: 'agar' for s in dst_slots})
+    for name, (seconds, n_fast_agar) in result.items():
+        print('{:<10} {:6.1f} min of motion, {} fast approaches into '
+              'agar'.format(name, seconds / 60, n_fast_agar))
+
+
+if __name__ == '__main__':
+    main()
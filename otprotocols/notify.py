@@ -0,0 +1,240 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tell the operator that the robot is about to pause, and that it paused.
+
+A PauseNotifier sends a message through each of its notifiers:
+    - lead_seconds before a pause (listening to a Telemetry, that knows
+      when that is): at the last step reported before that time
+    - when the protocol calls pause_notifier.pause(robot, message)
+and records how long it took for the run to be resumed, in a csv
+(pause_log.csv next to the runlogs), to see where operator time goes.
+
+Notifiers: PrintNotifier, WebhookNotifier (json POST, e.g. to a chat
+webhook or a local stand-in), SmtpNotifier (e.g. to a local debugging SMTP
+server), DesktopNotifier (notify-send). Messages are sent from a background
+thread, so a slow network never holds the robot.
+
+robot.pause() does not block in APIv1, the next robot command does. So the
+run counts as resumed when the first step reported to the telemetry after
+the pause is done, or when resumed() is called, minus how long the robot
+was busy since the pause: the commands it issued since, timed with the
+otprotocols.eta model (the wall time of that step includes the wait).
+"""
+
+import os
+import csv
+import json
+import time
+import shutil
+import smtplib
+import datetime
+import threading
+import subprocess
+from email.message import EmailMessage
+from urllib.request import Request, urlopen
+
+from otprotocols.eta import load_model, predict_seconds
+
+PAUSE_LOG_FILE = '/data/user_storage/opentrons_data/pause_log.csv'
+PAUSE_LOG_COLUMNS = ['paused_at', 'message', 'warned_ahead', 'ack_seconds']
+
+
+class PrintNotifier(object):
+
+    def send(self, subject, body):
+        print('NOTIFICATION: {} - {}'.format(subject, body))
+
+
+class WebhookNotifier(object):
+    """
+    POST {"subject": ..., "text": ...} as json to url
+    """
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, subject, body):
+        data = json.dumps({'subject': subject, 'text': body}).encode('utf-8')
+        request = Request(
+            self.url, data=data, headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=self.timeout):
+            pass
+
+
+class SmtpNotifier(object):
+
+    def __init__(
+            self, recipients, sender='opentrons@localhost', host='localhost',
+            port=25):
+        self.recipients = list(recipients)
+        self.sender = sender
+        self.host = host
+        self.port = port
+
+    def send(self, subject, body):
+        message = EmailMessage()
+        message['Subject'] = subject
+        message['From'] = self.sender
+        message['To'] = ', '.join(self.recipients)
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as server:
+            server.send_message(message)
+
+
+class DesktopNotifier(object):
+    """
+    notify-send, if installed (does nothing otherwise)
+    """
+
+    def send(self, subject, body):
+        if shutil.which('notify-send') is not None:
+            subprocess.call(['notify-send', subject, body])
+
+
+def make_notifiers(
+        webhook_url=None, email_to=(), smtp_host='localhost', smtp_port=25,
+        desktop=False):
+    """
+    Return the notifiers for the protocol parameters: always print, the
+    rest only if set
+    """
+    notifiers = [PrintNotifier()]
+    if webhook_url:
+        notifiers.append(WebhookNotifier(webhook_url))
+    if email_to:
+        notifiers.append(
+            SmtpNotifier(email_to, host=smtp_host, port=smtp_port))
+    if desktop:
+        notifiers.append(DesktopNotifier())
+    return notifiers
+
+
+def _send_all(notifiers, subject, body):
+    for notifier in notifiers:
+        try:
+            notifier.send(subject, body)
+        except Exception as err:
+            print('Notification through {} failed: {}'.format(
+                type(notifier).__name__, err))
+
+
+class PauseNotifier(object):
+    """
+    Notify pauses, ahead and when they happen, and log the time to resume
+    """
+
+    def __init__(
+            self, notifiers, telemetry=None, lead_seconds=300,
+            log_path=PAUSE_LOG_FILE, robot_name='OT-2'):
+        self.notifiers = list(notifiers)
+        self.telemetry = telemetry
+        self.lead_seconds = lead_seconds
+        self.log_path = log_path
+        self.robot_name = robot_name
+        self._paused_at = None
+        self._message = None
+        self._robot = None
+        self._n_commands = 0  # robot commands issued before the pause
+        self._eta_model = None
+        self._warned_pause = None  # step index of the pause warned about
+        if telemetry is not None:
+            telemetry.listeners.append(self)
+
+    def notify(self, subject, body, wait=False):
+        """
+        Send through all notifiers, in the background unless wait
+        """
+        if wait:
+            _send_all(self.notifiers, subject, body)
+            return
+        thread = threading.Thread(
+            target=_send_all, args=(self.notifiers, subject, body))
+        thread.daemon = True
+        thread.start()
+
+    def pause(self, robot, message=''):
+        """
+        Notify, then robot.pause(message)
+        """
+        self.notify(
+            '{} paused'.format(self.robot_name),
+            message or 'The robot is waiting for you')
+        self._paused_at = time.time()
+        self._message = message
+        if message:
+            robot.pause(message)
+        else:
+            robot.pause()
+        self._robot = robot
+        self._n_commands = len(robot.commands())
+
+    def step_done(self, n_steps=1, phase=None, seconds=None):
+        """
+        Same signature as Telemetry.step_done: the first call after a pause
+        marks the run as resumed; otherwise warn if a pause is close, or
+        will be by the next step
+        """
+        if self._paused_at is not None:
+            self.resumed()
+            return
+        if self.telemetry is None:
+            return
+        status = self.telemetry.snapshot()
+        to_pause = status['seconds_to_pause']
+        if not to_pause:
+            # unknown, or the pause itself, which pause() notifies
+            return
+        per_step = self.telemetry.seconds_per_step()
+        if to_pause > self.lead_seconds + per_step:
+            return
+        pause_step = status['step'] + round(to_pause / max(per_step, 1e-9))
+        if pause_step != self._warned_pause:
+            self._warned_pause = pause_step
+            self.notify(
+                '{} pausing soon'.format(self.robot_name),
+                'The robot will need you in about {:.0f} min'.format(
+                    to_pause / 60))
+
+    def busy_seconds(self):
+        """
+        Return the predicted seconds the robot took for the commands it
+        issued since the pause
+        """
+        if self._robot is None:
+            return 0.0
+        if self._eta_model is None:
+            self._eta_model = load_model(log_dir=None)
+        return predict_seconds(
+            self._robot.commands()[self._n_commands:], self._eta_model)
+
+    def resumed(self, busy_seconds=None):
+        """
+        Record that the run was resumed, busy_seconds ago (by default, the
+        time the robot took for what it did since the pause)
+        """
+        if self._paused_at is None:
+            return
+        if busy_seconds is None:
+            busy_seconds = self.busy_seconds()
+        ack_seconds = time.time() - busy_seconds - self._paused_at
+        row = {
+            'paused_at': datetime.datetime.fromtimestamp(
+                self._paused_at).strftime('%Y%m%d_%H%M%S'),
+            'message': self._message,
+            'warned_ahead': self._warned_pause is not None,
+            'ack_seconds': round(max(ack_seconds, 0), 1),
+            }
+        self._paused_at = None
+        self._robot = None
+        self._warned_pause = None
+        if self.log_path is None:
+            return
+        is_new = not os.path.exists(self.log_path)
+        with open(self.log_path, 'a', newline='') as fid:
+            writer = csv.DictWriter(fid, fieldnames=PAUSE_LOG_COLUMNS)
+            if is_new:
+                writer.writeheader()
+            writer.writerow(row)
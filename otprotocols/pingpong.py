@@ -0,0 +1,169 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Double buffered ("ping-pong") deck: the destination slots are split in two
+banks, the robot works on one while the operator swaps the plates of the
+other, and only waits if the swap is not done by the time it needs the bank.
+
+    banks = split_banks(stock_slots)
+    swaps = BankSwaps(banks, robot, notifier=pause_notifier)
+    swaps.attach(telemetry)  # swaps confirmed over http
+    ...
+    swaps.switch_to(bank)  # asks to swap the other bank, pauses for this one
+                           # if it is not swapped yet
+
+The operator confirms a swap from any computer on the robot network, with
+the token given in the swap notification:
+
+    python -m otprotocols.pingpong swapped A --token <token> --host <robot ip>
+
+If the robot needs a bank that is not swapped yet, it pauses like for any
+other operator action (not when simulating): the operator resumes from the
+app, or the confirmation resumes it.
+"""
+
+import argparse
+import threading
+
+from otprotocols.telemetry import TELEMETRY_PORT, post_action
+
+
+def split_banks(slots):
+    """
+    Return {'A': first half of slots, 'B': the rest}, in fill order
+    """
+    slots = list(slots)
+    half = (len(slots) + 1) // 2
+    return {'A': slots[:half], 'B': slots[half:]}
+
+
+def bank_of(banks, slot):
+    for bank, slots in banks.items():
+        if str(slot) in slots:
+            return bank
+    raise KeyError('slot {} is in no bank'.format(slot))
+
+
+class BankSwaps(object):
+    """
+    Which banks are loaded, in use, or waiting for the operator
+    """
+
+    def __init__(self, banks, robot, notifier=None):
+        self.banks = banks
+        self.robot = robot
+        self.notifier = notifier
+        # all banks are loaded at the start
+        self._swapped = {bank: threading.Event() for bank in banks}
+        for event in self._swapped.values():
+            event.set()
+        self._lock = threading.Lock()
+        self._waiting_for = None  # bank the robot is paused for
+        self.in_use = None
+        self.token = None  # of the telemetry taking the confirmations
+
+    def _notify(self, subject, body):
+        # without a notifier, a comment in the run log, as for the pauses
+        if self.notifier is not None:
+            self.notifier.notify(subject, body)
+        else:
+            self.robot.comment('{}: {}'.format(subject, body))
+
+    def release(self, bank):
+        """
+        The robot is done with bank: ask the operator to swap its plates
+        """
+        self._swapped[bank].clear()
+        if self.in_use == bank:
+            self.in_use = None
+        self._notify(
+            'Swap bank {}'.format(bank),
+            'Swap the plates in slots {}, then confirm with: python -m '
+            'otprotocols.pingpong swapped {} --token {}'.format(
+                ', '.join(self.banks[bank]), bank, self.token))
+
+    def confirm(self, bank):
+        """
+        The operator swapped the plates of bank: resume the robot if it is
+        paused for them
+        """
+        with self._lock:
+            self._swapped[bank].set()
+            if self._waiting_for != bank:
+                return
+            self._waiting_for = None
+        self.robot.resume()
+
+    def acquire(self, bank):
+        """
+        Use bank. If it was released and is not swapped yet, pause the robot
+        like any other pause (so the run can be cancelled): resuming from
+        the app, or confirming the swap, goes on.
+        """
+        with self._lock:
+            is_waiting = (not self._swapped[bank].is_set()
+                          and not self.robot.is_simulating())
+            if is_waiting:
+                self._waiting_for = bank
+        if is_waiting:
+            message = 'Swap the plates in slots {} (bank {}), then resume'
+            message = message.format(', '.join(self.banks[bank]), bank)
+            if self.notifier is not None:
+                self.notifier.pause(self.robot, message)
+            else:
+                self.robot.pause(message)
+            with self._lock:
+                # confirmed between the check and the pause
+                is_confirmed = self._waiting_for is None
+            if is_confirmed:
+                self.robot.resume()
+        # once resumed the plates are in
+        self._swapped[bank].set()
+        self.in_use = bank
+
+    def switch_to(self, bank):
+        """
+        Release the bank in use (if another one), and acquire bank
+        """
+        if self.in_use is not None and self.in_use != bank:
+            self.release(self.in_use)
+        self.acquire(bank)
+
+    def attach(self, telemetry):
+        """
+        Take swap confirmations as POST /swapped?bank=<bank> to telemetry
+        """
+        def _confirm(query):
+            bank = query.get('bank')
+            if bank not in self._swapped:
+                raise KeyError('unknown bank {}'.format(bank))
+            self.confirm(bank)
+            return {'bank': bank, 'swapped': True}
+        telemetry.post_handlers['/swapped'] = _confirm
+        self.token = telemetry.token
+
+
+def confirm_swap(
+        bank, token, host='127.0.0.1', port=TELEMETRY_PORT, timeout=5):
+    """
+    Tell the robot that the plates of bank are swapped
+    """
+    return post_action('/swapped', {'bank': bank}, token, host, port, timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Confirm that the plates of a bank were swapped')
+    parser.add_argument('action', choices=['swapped'])
+    parser.add_argument('bank')
+    parser.add_argument('--token', required=True,
+                        help='from the swap notification')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=TELEMETRY_PORT)
+    args = parser.parse_args()
+    print(confirm_swap(args.bank, args.token, args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Plan format shared by the protocols and the offline tools.
+
+A plan is a plain list of steps. Each step is a dict describing one
+liquid movement, e.g.:
+
+    {'phase': 'drugs',              # free text, used to group steps
+     'pipette': 'multi',            # key in the pipettes dict at execution
+     'n_channels': 8,
+     'volume': 10.0,
+     'source': ('5', 'A1'),         # (slot, well name)
+     'destination': ('11', 'A7'),
+     'source_offset': 1,            # mm from the bottom, None for default
+     'destination_offset': 1,
+     'options': {'new_tip': 'always', 'blow_out': True},
+     'replicate': 1,
+     'seed': 202011180}
+
+Optional keys ('compound', 'dose') annotate what is being moved, and only
+matter for the plate maps.
+Steps with a different 'chain' key are never executed by the same
+pipette.transfer call, so they never share a tip. Consecutive steps of the same
+chain with new_tip='once' share one tip, even if their options differ.
+Steps with the same 'aspiration' key are dispensed from one aspiration
+(pipette.distribute), plus their 'disposal_volume' that goes to the trash.
+
+The protocol builds the plan first, then executes it with execute_plan, so
+anything derived from the plan (printouts, plate maps) is by construction what
+the robot did.
+"""
+
+import time
+
+MULTI_CHANNEL_ROWS = 'ABCDEFGH'
+
+
+def transfer_options(options):
+    """
+    Return a copy of the options of a step with the name APIv1 transfer
+    knows: touch_tip (transfer silently ignores touch)
+    """
+    options = dict(options) if options is not None else {}
+    if 'touch' in options:
+        options.setdefault('touch_tip', options.pop('touch'))
+    return options
+
+
+def make_step(
+        phase, pipette, volume, source, destination,
+        n_channels=1, source_offset=None, destination_offset=None,
+        options=None, **annotations):
+    """
+    Return a plan step (a dict), see module docstring for the keys
+    """
+    step = {
+        'phase': phase,
+        'pipette': pipette,
+        'n_channels': n_channels,
+        'volume': float(volume),
+        'source': (str(source[0]), source[1]),
+        'destination': (str(destination[0]), destination[1]),
+        'source_offset': source_offset,
+        'destination_offset': destination_offset,
+        'options': transfer_options(options),
+        }
+    step.update(annotations)
+    return step
+
+
+def channel_wells(well_name, n_channels):
+    """
+    Return the names of the wells reached by each channel of a pipette
+    when its first channel is in well_name.
+    """
+    if n_channels == 1:
+        return [well_name]
+    row = MULTI_CHANNEL_ROWS.index(well_name[0])
+    assert row + n_channels <= len(MULTI_CHANNEL_ROWS), (
+        'Multichannel would be out of the plate from {}'.format(well_name))
+    col = well_name[1:]
+    return [r + col for r in MULTI_CHANNEL_ROWS[row:row+n_channels]]
+
+
+def shuffle_plan(
+        drugs_mapping, drugs_volume, pipette='multi', n_channels=8,
+        phase='drugs', source_offset=0, destination_offset=0, options=None,
+        seed=None, platemap=None):
+    """
+    Turn a drugs_mapping dict, as used in the shuffle protocols:
+        {(source slot, dest slot):(cols in source, cols in dest)}
+    into a plan. Columns are 0-indexed, as in the protocols.
+    Destinations are numbered as replicates in the order they appear.
+    If a platemap writer is given, steps are streamed to it as they are made.
+    """
+    plan = []
+    for replicate, (slots, cols) in enumerate(drugs_mapping.items(), 1):
+        src_slot, dst_slot = slots
+        src_cols, dst_cols = cols
+        for src_col, dst_col in zip(src_cols, dst_cols):
+            step = make_step(
+                phase, pipette, drugs_volume,
+                (src_slot, 'A{}'.format(int(src_col) + 1)),
+                (dst_slot, 'A{}'.format(int(dst_col) + 1)),
+                n_channels=n_channels,
+                source_offset=source_offset,
+                destination_offset=destination_offset,
+                options=options,
+                replicate=replicate,
+                seed=seed,
+                )
+            plan.append(step)
+            if platemap is not None:
+                platemap.write_step(step)
+    return plan
+
+
+def print_plan(plan):
+    """
+    Print a plan the way the shuffle protocols used to print their mapping
+    """
+    for step in plan:
+        print('{} {} -> {} {}'.format(
+            step['source'][0], step['source'][1],
+            step['destination'][0], step['destination'][1]))
+
+
+def _group_key(step):
+    # steps that can go in the same pipette.transfer call
+    return (
+        step['phase'], step['pipette'], step.get('chain'),
+        step.get('aspiration'),
+        step['source_offset'], step['destination_offset'],
+        sorted(step['options'].items()),
+        )
+
+
+def group_steps(plan):
+    """
+    Split a plan into runs of consecutive steps that can be executed by a
+    single pipette.transfer call. Keeping them together preserves the
+    meaning of new_tip='once'.
+    """
+    groups = []
+    for step in plan:
+        if groups and _group_key(groups[-1][-1]) == _group_key(step):
+            groups[-1].append(step)
+        else:
+            groups.append([step])
+    return groups
+
+
+def split_steps(group, new_tip):
+    """
+    Split a group into single steps if executing them one by one makes the
+    same moves: no tip picked up for the whole group (new_tip 'always' or
+    'never') and no shared aspiration. Used to report progress per step.
+    """
+    if new_tip in ('always', 'never') and group[0].get('aspiration') is None:
+        return [[step] for step in group]
+    return [group]
+
+
+def _location(plates, slot_well, offset):
+    # a well, or a position offset mm above its bottom
+    well = plates[slot_well[0]].wells(slot_well[1])
+    if offset is None:
+        return well
+    return well.bottom(offset)
+
+
+def _transfer(pipette, group, plates, options):
+    # one pipette.transfer (or distribute) call for a group of steps
+    first = group[0]
+    sources = [
+        _location(plates, s['source'], s['source_offset'])
+        for s in group]
+    destinations = [
+        _location(plates, s['destination'], s['destination_offset'])
+        for s in group]
+    volumes = [s['volume'] for s in group]
+    if len(set(volumes)) == 1:
+        volumes = volumes[0]
+    if first.get('aspiration') is not None:
+        # one aspiration, several dispenses
+        pipette.distribute(
+            volumes, sources[0], destinations,
+            disposal_vol=first['disposal_volume'], **options)
+    else:
+        pipette.transfer(volumes, sources, destinations, **options)
+
+
+def execute_plan(plan, pipettes, plates, telemetry=None):
+    """
+    Run a plan on the robot.
+    pipettes: dict {step['pipette']: opentrons pipette}
+    plates: dict {slot: opentrons labware}
+    telemetry: optional otprotocols.telemetry.Telemetry, told about each
+        step done (each group, where the steps share a tip or an aspiration)
+    """
+    held = None  # (pipette, chain) holding a tip across transfer calls
+    for group in group_steps(plan):
+        first = group[0]
+        pipette = pipettes[first['pipette']]
+        options = transfer_options(first['options'])
+        chain = first.get('chain')
+        if held is not None and held != (first['pipette'], chain):
+            pipettes[held[0]].drop_tip()
+            held = None
+        if chain is not None and options.get('new_tip') == 'once':
+            if held is None:
+                pipette.pick_up_tip()
+                held = (first['pipette'], chain)
+            options['new_tip'] = 'never'
+        if telemetry is None:
+            calls = [group]
+        else:
+            calls = split_steps(group, options.get('new_tip', 'once'))
+        for call in calls:
+            tic = time.time()
+            _transfer(pipette, call, plates, options)
+            if telemetry is not None:
+                telemetry.step_done(
+                    len(call), first['phase'], time.time() - tic)
+    if held is not None:
+        pipettes[held[0]].drop_tip()
+    return
+
+
+def count_plan_tips(plan):
+    """
+    Return a dict {pipette: number of tips} that executing the plan uses,
+    following the same grouping as execute_plan
+    """
+    tips = {}
+    held = None
+    for group in group_steps(plan):
+        first = group[0]
+        new_tip = first['options'].get('new_tip', 'once')
+        key = (first['pipette'], first.get('chain'))
+        if new_tip == 'always':
+            n_pickups = len(group)
+        elif new_tip == 'once':
+            if first.get('chain') is not None and key == held:
+                n_pickups = 0
+            else:
+                n_pickups = 1
+        else:
+            n_pickups = 0
+        held = key if new_tip == 'once' else None
+        tips[first['pipette']] = (
+            tips.get(first['pipette'], 0) + n_pickups * first['n_channels'])
+    return tips
@@ -0,0 +1,346 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Plan simulator that does not need opentrons.
+
+Runs a plan (see otprotocols.plan) against a minimal deck: labware per slot
+(geometry from otprotocols.deck), pipettes with their capacity and tip racks,
+and the volume in each well. It follows the same grouping, tip and
+distribute logic as execute_plan, and returns:
+    - the tips used by each pipette, and the number of each kind of command
+    - the final volume in every well
+    - a list of problems (out of tips, volume below the pipette minimum,
+        wells emptied or overflowing)
+    - optionally, the command stream, written like APIv1 writes it
+    - a rough duration, from the command counts
+
+Volumes are accounted for all steps at once with numpy: a shuffle plan of 48
+multichannel steps takes about 2 ms without the command stream (opentrons
+takes seconds), so it can be used inside optimisers and parameter sweeps.
+
+    deck = deck_model(
+        {'10': '96-well-plate-pcr-thermofisher', '1': '96-flat'},
+        {'multi': pipette_model('p10-Multi', ['3'])},
+        initial_volumes={'10': 100})
+    result = simulate_plan(plan, deck)
+"""
+
+import numpy as np
+
+from otprotocols.deck import LABWARE, TRASH_SLOT, ROWS
+from otprotocols.plan import (
+    group_steps, channel_wells, transfer_options, MULTI_CHANNEL_ROWS)
+from otprotocols.simcache import COMMAND_SECONDS
+
+# APIv1 pipette models: (min volume, max volume, channels)
+PIPETTE_MODELS = {
+    'p10-Single': (1, 10, 1),
+    'p10-Multi': (1, 10, 8),
+    'p50-Single': (5, 50, 1),
+    'p50-Multi': (5, 50, 8),
+    'p300-Single': (30, 300, 1),
+    'p300-Multi': (30, 300, 8),
+    'p1000-Single': (100, 1000, 1),
+    }
+
+TIPRACK_N_WELLS = 96
+
+
+def pipette_model(model, tiprack_slots, start_at=0):
+    """
+    Return the dict describing a pipette for deck_model.
+    start_at: index (column-major, like the robot) of the first tip to use
+    """
+    min_volume, max_volume, n_channels = PIPETTE_MODELS[model]
+    return {
+        'model': model,
+        'min_volume': min_volume,
+        'max_volume': max_volume,
+        'n_channels': n_channels,
+        'tipracks': [str(s) for s in tiprack_slots],
+        'start_at': start_at,
+        }
+
+
+def deck_model(labware, pipettes, initial_volumes=None):
+    """
+    Return the deck dict simulate_plan needs.
+    labware: {slot: labware type}, types in otprotocols.deck.LABWARE
+    pipettes: {name in the plan: pipette_model(...)}
+    initial_volumes: {slot: volume in each well, or an array (rows x cols)}.
+        Only these slots are checked for running out of liquid.
+    """
+    initial_volumes = initial_volumes or {}
+    volumes = {}
+    for slot, labware_type in labware.items():
+        n_cols, n_rows = LABWARE[labware_type]['grid']
+        volumes[str(slot)] = np.zeros((n_rows, n_cols))
+        if slot in initial_volumes:
+            volumes[str(slot)] += np.asarray(
+                initial_volumes[slot], dtype=float)
+    return {
+        'labware': {str(s): t for s, t in labware.items()},
+        'pipettes': pipettes,
+        'volumes': volumes,
+        'checked': [str(s) for s in initial_volumes],
+        }
+
+
+def _location(slot, well, n_channels):
+    if n_channels == 1:
+        return 'well {} in "{}"'.format(well, slot)
+    wells = channel_wells(well, n_channels)
+    return 'wells {}...{} in "{}"'.format(wells[0], wells[-1], slot)
+
+
+class _Tips(object):
+    """
+    Next available tip of each pipette, column-major through its racks
+    """
+
+    def __init__(self, pipettes):
+        self.pipettes = pipettes
+        self.next = {name: p['start_at'] for name, p in pipettes.items()}
+        self.used = {name: 0 for name in pipettes}
+
+    def pick_up(self, name):
+        pipette = self.pipettes[name]
+        n_channels = pipette['n_channels']
+        index = self.next[name]
+        if n_channels > 1 and index % len(MULTI_CHANNEL_ROWS):
+            # multichannel needs a whole column
+            index += len(MULTI_CHANNEL_ROWS) - index % len(MULTI_CHANNEL_ROWS)
+        rack = index // TIPRACK_N_WELLS
+        if rack >= len(pipette['tipracks']):
+            return None
+        self.next[name] = index + n_channels
+        self.used[name] += n_channels
+        well_index = index % TIPRACK_N_WELLS
+        well = MULTI_CHANNEL_ROWS[well_index % 8] + str(well_index // 8 + 1)
+        return pipette['tipracks'][rack], well
+
+
+def _volume_events(plan, deck):
+    """
+    Return arrays (slot, row, col, delta, order) of all the volume changes of
+    a plan, one per channel, in execution order
+    """
+    slots = sorted(deck['volumes'])
+    slot_index = {s: i for i, s in enumerate(slots)}
+    n_rows = np.array([deck['volumes'][s].shape[0] for s in slots])
+    events = []
+    for sc, step in enumerate(plan):
+        n_channels = step['n_channels']
+        disposal = 0.0
+        if step.get('aspiration') is not None and (
+                sc == 0 or plan[sc - 1].get('aspiration')
+                != step['aspiration']):
+            disposal = step['disposal_volume']
+        for end, sign, extra, order in [
+                ('source', -1, disposal, 2 * sc),
+                ('destination', 1, 0, 2 * sc + 1)]:
+            slot, well = step[end]
+            events.append((
+                slot_index[slot], ROWS.index(well[0]), int(well[1:]) - 1,
+                n_channels, sign * step['volume'], -extra, order))
+    if not events:
+        return [np.zeros(0, dtype=int)] * 3 + [np.zeros(0)] * 2
+    events = np.array(events, dtype=float)
+    # one event per channel
+    n_channels = events[:, 3].astype(int)
+    repeated = np.repeat(events, n_channels, axis=0)
+    channel = np.arange(len(repeated)) - np.repeat(
+        np.cumsum(n_channels) - n_channels, n_channels)
+    slot = repeated[:, 0].astype(int)
+    # single row labware (troughs): all channels in the same well
+    row = np.where(
+        n_rows[slot] > 1, repeated[:, 1] + channel, repeated[:, 1]
+        ).astype(int)
+    col = repeated[:, 2].astype(int)
+    # each channel also draws the disposal volume from the source
+    delta = repeated[:, 4] + repeated[:, 5]
+    return slot, row, col, delta, repeated[:, 6]
+
+
+def check_volumes(plan, deck):
+    """
+    Apply all the volume changes of a plan to the deck (in place).
+    Return a list of problems: wells of checked slots going below 0, wells
+    above the labware volume.
+    """
+    slots = sorted(deck['volumes'])
+    slot, row, col, delta, order = _volume_events(plan, deck)
+    problems = []
+    if len(delta) == 0:
+        return problems
+    # flat well index, and running volume of each well in execution order
+    n_wells = [deck['volumes'][s].size for s in slots]
+    first_well = np.concatenate([[0], np.cumsum(n_wells)[:-1]])
+    n_cols = np.array([deck['volumes'][s].shape[1] for s in slots])
+    flat = first_well[slot] + row * n_cols[slot] + col
+    start = np.concatenate([deck['volumes'][s].ravel() for s in slots])
+    by_well = np.lexsort((order, flat))
+    flat_sorted = flat[by_well]
+    running = np.cumsum(delta[by_well])
+    is_first = np.ones(len(flat_sorted), dtype=bool)
+    is_first[1:] = flat_sorted[1:] != flat_sorted[:-1]
+    offset = np.maximum.accumulate(
+        np.where(is_first, np.arange(len(running)), 0))
+    before = np.concatenate([[0], running])[offset]
+    running = running - before + start[flat_sorted]
+
+    capacity = np.array([
+        LABWARE[deck['labware'][s]]['volume'] for s in slots], dtype=float)
+    is_checked = np.isin(np.array(slots), deck['checked'])
+    sorted_slot = slot[by_well]
+    empty = (running < -1e-9) & is_checked[sorted_slot]
+    full = running > capacity[sorted_slot] + 1e-9
+    for mask, what in [(empty, 'runs out of liquid'),
+                       (full, 'overflows')]:
+        for ind in np.unique(flat_sorted[mask]):
+            s = np.searchsorted(first_well, ind, side='right') - 1
+            r, c = divmod(ind - first_well[s], n_cols[s])
+            problems.append('well {}{} in "{}" {}'.format(
+                ROWS[r], c + 1, slots[s], what))
+
+    final = np.bincount(flat, weights=delta, minlength=sum(n_wells))
+    final = start + final
+    for s, first, n in zip(slots, first_well, n_wells):
+        deck['volumes'][s] = final[first:first+n].reshape(
+            deck['volumes'][s].shape)
+    return problems
+
+
+def simulate_plan(plan, deck, emit_commands=False):
+    """
+    Run plan on deck (deck volumes are updated in place).
+    Return a dict with 'tips' {pipette: tips used}, 'counts' {command kind:
+    n}, 'aspirations', 'seconds', 'volumes', 'problems' and 'commands' (None
+    unless emit_commands).
+    """
+    pipettes = deck['pipettes']
+    tips = _Tips(pipettes)
+    counts = dict.fromkeys(COMMAND_SECONDS, 0)
+    commands = [] if emit_commands else None
+    problems = []
+    n_aspirations = 0
+
+    def _emit(kind, text):
+        counts[kind] += 1
+        if emit_commands:
+            commands.append(text)
+
+    def _mix(mix, where):
+        # mix = (repetitions, volume), as in pipette.transfer
+        repetitions, volume = mix
+        if emit_commands:
+            commands.append('Mixing {} times with a volume of {}ul'.format(
+                repetitions, volume))
+        for _ in range(repetitions):
+            _emit('Aspirating', 'Aspirating {} uL from {} at 1.0 '
+                  'speed'.format(volume, where))
+            _emit('Dispensing', 'Dispensing {} uL into {} at 1.0 '
+                  'speed'.format(volume, where))
+
+    def _pick_up(name):
+        tip = tips.pick_up(name)
+        if tip is None:
+            problems.append('{} is out of tips'.format(name))
+            tip = ('?', 'A1')
+        _emit('Picking up tip', 'Picking up tip ' + _location(
+            tip[0], tip[1], pipettes[name]['n_channels']))
+
+    def _drop(name):
+        _emit('Dropping tip', 'Dropping tip well A1 in "{}"'.format(
+            TRASH_SLOT))
+
+    held = None
+    for group in group_steps(plan):
+        first = group[0]
+        name = first['pipette']
+        pipette = pipettes[name]
+        options = transfer_options(first['options'])
+        new_tip = options.get('new_tip', 'once')
+        chain = first.get('chain')
+        if held is not None and held != (name, chain):
+            _drop(held[0])
+            held = None
+        hold = chain is not None and new_tip == 'once'
+        if new_tip == 'once' and not (hold and held is not None):
+            _pick_up(name)
+        if hold:
+            held = (name, chain)
+
+        for step in group:
+            if step['volume'] < pipette['min_volume']:
+                problems.append('{} ul is below the minimum of {}'.format(
+                    step['volume'], name))
+
+        if first.get('aspiration') is not None:
+            # distribute: one aspiration, several dispenses
+            total = sum(s['volume'] for s in group)
+            total += first['disposal_volume']
+            src = _location(*first['source'], n_channels=first['n_channels'])
+            if emit_commands:
+                commands.append('Distributing {} from {}'.format(
+                    first['volume'], src))
+            _emit('Aspirating', 'Aspirating {} uL from {} at 1.0 speed'.format(
+                total, src))
+            n_aspirations += 1
+            for step in group:
+                _emit('Dispensing', 'Dispensing {} uL into {} at 1.0 '
+                      'speed'.format(step['volume'], _location(
+                          *step['destination'],
+                          n_channels=step['n_channels'])))
+            if options.get('blow_out'):
+                _emit('Blowing out', 'Blowing out at well A1 in "{}"'.format(
+                    TRASH_SLOT))
+        else:
+            for step in group:
+                src = _location(*step['source'], n_channels=step['n_channels'])
+                dst = _location(
+                    *step['destination'], n_channels=step['n_channels'])
+                if new_tip == 'always':
+                    _pick_up(name)
+                if emit_commands:
+                    commands.append('Transferring {} from {} to {}'.format(
+                        step['volume'], src, dst))
+                # APIv1 splits volumes above the capacity in equal parts
+                n_parts = int(np.ceil(step['volume'] / pipette['max_volume']))
+                part = step['volume'] / n_parts
+                n_aspirations += n_parts
+                for _ in range(n_parts):
+                    if options.get('mix_before'):
+                        _mix(options['mix_before'], src)
+                    _emit('Aspirating', 'Aspirating {} uL from {} at 1.0 '
+                          'speed'.format(part, src))
+                    if options.get('touch_tip'):
+                        _emit('Touching tip', 'Touching tip')
+                    _emit('Dispensing', 'Dispensing {} uL into {} at 1.0 '
+                          'speed'.format(part, dst))
+                    if options.get('mix_after'):
+                        _mix(options['mix_after'], dst)
+                    if options.get('blow_out'):
+                        _emit('Blowing out', 'Blowing out at ' + dst)
+                    if options.get('touch_tip'):
+                        _emit('Touching tip', 'Touching tip')
+                if new_tip == 'always':
+                    _drop(name)
+        if new_tip == 'once' and not hold:
+            _drop(name)
+    if held is not None:
+        _drop(held[0])
+
+    problems += check_volumes(plan, deck)
+    seconds = sum(counts[kind] * COMMAND_SECONDS[kind] for kind in counts)
+    return {
+        'tips': tips.used,
+        'counts': counts,
+        'aspirations': n_aspirations,
+        'seconds': seconds,
+        'volumes': deck['volumes'],
+        'problems': problems,
+        'commands': commands,
+        }
+
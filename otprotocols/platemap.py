@@ -0,0 +1,167 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Machine readable plate maps, written from the same plan the robot executes.
+
+One row per destination well reached by a step (so a multichannel step gives
+8 rows). Rows are streamed to disk as steps come in, in batches, so building
+the maps for thousands of plates never holds them all in memory.
+
+CSV is always available, Parquet needs pyarrow.
+"""
+
+import os
+import csv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from otprotocols.plan import channel_wells
+
+PLATEMAP_COLUMNS = [
+    'plate_id', 'slot', 'well', 'compound', 'dose', 'replicate', 'seed',
+    'source_plate_id', 'source_well', 'volume', 'phase', 'step',
+    ]
+
+
+def step_to_records(step, step_index, plate_name_dict=None):
+    """
+    Return a list of rows (dicts with PLATEMAP_COLUMNS keys), one per
+    destination well of the step.
+    If the step has no 'compound', the compound is named after its source
+    plate and well, which is what the imaging analysis needs to go back to the
+    library.
+    """
+    plate_name_dict = plate_name_dict or {}
+    src_slot, src_well = step['source']
+    dst_slot, dst_well = step['destination']
+    src_plate_id = plate_name_dict.get(src_slot, src_slot)
+    dst_plate_id = plate_name_dict.get(dst_slot, dst_slot)
+    src_wells = channel_wells(src_well, step['n_channels'])
+    dst_wells = channel_wells(dst_well, step['n_channels'])
+    compounds = step.get('compound')
+    if compounds is None:
+        compounds = ['{}_{}'.format(src_plate_id, w) for w in src_wells]
+    elif isinstance(compounds, str):
+        compounds = [compounds] * len(dst_wells)
+    doses = step.get('dose')
+    if not isinstance(doses, (list, tuple)):
+        doses = [doses] * len(dst_wells)
+    records = []
+    for sw, dw, compound, dose in zip(src_wells, dst_wells, compounds, doses):
+        records.append({
+            'plate_id': dst_plate_id,
+            'slot': dst_slot,
+            'well': dw,
+            'compound': compound,
+            'dose': dose,
+            'replicate': step.get('replicate'),
+            'seed': step.get('seed'),
+            'source_plate_id': src_plate_id,
+            'source_well': sw,
+            'volume': step['volume'],
+            'phase': step['phase'],
+            'step': step_index,
+            })
+    return records
+
+
+class PlateMapWriter(object):
+    """
+    Stream plan steps into a plate map file.
+    The format is guessed from the extension (.csv or .parquet).
+
+    with PlateMapWriter('maps.csv', plate_name_dict) as writer:
+        plan = shuffle_plan(drugs_mapping, 10, platemap=writer)
+    """
+
+    def __init__(self, path, plate_name_dict=None, batch_size=4096):
+        self.path = str(path)
+        self.plate_name_dict = plate_name_dict or {}
+        self.batch_size = batch_size
+        self.n_steps = 0
+        self.n_rows = 0
+        self._batch = []
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        if self.path.endswith('.parquet'):
+            if pa is None:
+                raise ImportError('pyarrow is needed to write parquet files')
+            self.format = 'parquet'
+            self._schema = pa.schema([
+                ('plate_id', pa.string()),
+                ('slot', pa.string()),
+                ('well', pa.string()),
+                ('compound', pa.string()),
+                ('dose', pa.float64()),
+                ('replicate', pa.int32()),
+                ('seed', pa.int64()),
+                ('source_plate_id', pa.string()),
+                ('source_well', pa.string()),
+                ('volume', pa.float64()),
+                ('phase', pa.string()),
+                ('step', pa.int64()),
+                ])
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        elif self.path.endswith('.csv'):
+            self.format = 'csv'
+            self._fid = open(self.path, 'w', newline='')
+            self._writer = csv.DictWriter(
+                self._fid, fieldnames=PLATEMAP_COLUMNS)
+            self._writer.writeheader()
+        else:
+            raise ValueError(
+                'Unknown plate map format for {}'.format(self.path))
+
+    def write_step(self, step):
+        records = step_to_records(step, self.n_steps, self.plate_name_dict)
+        self._batch.extend(records)
+        self.n_steps += 1
+        self.n_rows += len(records)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def write_plan(self, plan):
+        for step in plan:
+            self.write_step(step)
+
+    def flush(self):
+        if not self._batch:
+            return
+        if self.format == 'csv':
+            self._writer.writerows(self._batch)
+        else:
+            columns = {
+                name: [r[name] for r in self._batch]
+                for name in PLATEMAP_COLUMNS}
+            self._writer.write_table(
+                pa.Table.from_pydict(columns, schema=self._schema))
+        self._batch = []
+
+    def close(self):
+        self.flush()
+        if self.format == 'csv':
+            self._fid.close()
+        else:
+            self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def export_plan(plan, path, plate_name_dict=None):
+    """
+    Write the plate map of a whole plan in one go, return the number of rows
+    """
+    with PlateMapWriter(path, plate_name_dict) as writer:
+        writer.write_plan(plan)
+    return writer.n_rows
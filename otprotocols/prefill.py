@@ -0,0 +1,240 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Plate-wide solvent (and controls) pre-fill.
+
+Give it what each well of a plate needs, as two 8x12 arrays (volume and
+liquid name), and it works out:
+    - columns where all 8 wells need the same liquid: one multichannel
+        dispense of the smallest volume in the column, from the trough lane of
+        that liquid, plus single channel top-ups where a well needs more
+    - everything else: single channel, one liquid at a time
+If no multichannel is available everything is single channel, but still one
+tip per liquid for the whole plate rather than one per row.
+
+estimate_fill_seconds gives a rough time to compare the options, and
+
+    python -m otprotocols.prefill bench
+
+compares them on the prestwick serial dilution plate.
+"""
+
+import argparse
+
+import numpy as np
+
+from otprotocols.plan import make_step, MULTI_CHANNEL_ROWS, count_plan_tips
+
+# rough times, in seconds
+SECONDS_PER_ASPIRATE_DISPENSE = 4.0
+SECONDS_PER_PICK_DROP = 9.0
+
+
+def uniform_columns(volumes, liquids):
+    """
+    Return a boolean array, True for the columns where every well needs some
+    of the same liquid
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    liquids = np.asarray(liquids)
+    needs = volumes > 0
+    same_liquid = (liquids == liquids[:1, :]).all(axis=0)
+    return needs.all(axis=0) & same_liquid
+
+
+def serial_dilution_layout(
+        high_wells, control_wells, solvent_volume, control_volume,
+        n_dilutions=2, solvent='DMSO'):
+    """
+    Return (volumes, liquids, is_control), the 8x12 arrays of what each well
+    of a serial dilution plate needs before the dilutions: solvent_volume of
+    solvent in the n_dilutions wells to the right of each high concentration
+    well, and control_volume in the control wells.
+    control_wells: dict {liquid: list of wells}
+    """
+    n_rows = len(MULTI_CHANNEL_ROWS)
+    volumes = np.zeros((n_rows, 12))
+    liquids = np.full((n_rows, 12), '', dtype=object)
+    is_control = np.zeros((n_rows, 12), dtype=bool)
+    for well in high_wells:
+        row = MULTI_CHANNEL_ROWS.index(well[0])
+        col = int(well[1:]) - 1
+        volumes[row, col+1:col+1+n_dilutions] = solvent_volume
+        liquids[row, col+1:col+1+n_dilutions] = solvent
+    for liquid, wells in control_wells.items():
+        for well in wells:
+            row_col = (MULTI_CHANNEL_ROWS.index(well[0]), int(well[1:]) - 1)
+            volumes[row_col] = control_volume
+            liquids[row_col] = liquid
+            is_control[row_col] = True
+    return volumes, liquids, is_control
+
+
+def prefill_plan(
+        volumes, liquids, plate_slot, trough_slot, trough_wells,
+        multi=None, single='single', phase='prefill', options=None,
+        offset=None, blow_out=None):
+    """
+    Return a plan filling a plate with what volumes/liquids (8x12 arrays)
+    say. trough_wells: dict {liquid: trough well}.
+    multi, single: names of the pipettes in the plan (multi=None if there is
+    no multichannel).
+    blow_out: optional 8x12 boolean array, the wells that get a blow out
+    (a multichannel blows out if any well of the column does), otherwise
+    options decide.
+    Multichannel steps come first, then the single channel ones, grouped by
+    liquid so that each pipette uses one tip (set) per liquid.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    liquids = np.asarray(liquids)
+    options = dict(options) if options is not None else {}
+    options.setdefault('new_tip', 'once')
+
+    def _options(wells_blow_out):
+        if blow_out is None:
+            return options
+        return dict(options, blow_out=bool(np.any(wells_blow_out)))
+
+    left = volumes.copy()
+    multi_steps = []
+    if multi is not None:
+        for col in np.flatnonzero(uniform_columns(volumes, liquids)):
+            liquid = liquids[0, col]
+            col_volume = volumes[:, col].min()
+            multi_steps.append(make_step(
+                phase, multi, col_volume,
+                (trough_slot, trough_wells[liquid]),
+                (plate_slot, 'A{}'.format(col + 1)),
+                n_channels=len(MULTI_CHANNEL_ROWS),
+                destination_offset=offset,
+                options=_options(blow_out[:, col] if blow_out is not None
+                                 else None),
+                compound=str(liquid),
+                chain=(phase, multi, str(liquid)),
+                ))
+            left[:, col] -= col_volume
+    single_steps = []
+    for liquid in sorted(set(liquids[left > 0].tolist())):
+        rows, cols = np.nonzero((left > 0) & (liquids == liquid))
+        # column by column, like the robot reads plates
+        for rc in np.lexsort((rows, cols)):
+            well = MULTI_CHANNEL_ROWS[rows[rc]] + str(cols[rc] + 1)
+            single_steps.append(make_step(
+                phase, single, left[rows[rc], cols[rc]],
+                (trough_slot, trough_wells[liquid]),
+                (plate_slot, well),
+                destination_offset=offset,
+                options=_options(blow_out[rows[rc], cols[rc]]
+                                 if blow_out is not None else None),
+                compound=str(liquid),
+                chain=(phase, single, str(liquid)),
+                ))
+    return multi_steps + single_steps
+
+
+def estimate_fill_seconds(plan, max_volumes):
+    """
+    Return a rough duration of a plan: one aspirate/dispense per
+    max_volumes[pipette] ul moved, and a pick up/drop per tip set.
+    """
+    n_ops = sum(
+        np.ceil(step['volume'] / max_volumes[step['pipette']])
+        for step in plan)
+    n_pickups = sum(
+        n_tips // max(1, n_channels)
+        for n_tips, n_channels in _tips_and_channels(plan))
+    return (n_ops * SECONDS_PER_ASPIRATE_DISPENSE
+            + n_pickups * SECONDS_PER_PICK_DROP)
+
+
+def _tips_and_channels(plan):
+    n_channels = {step['pipette']: step['n_channels'] for step in plan}
+    return [
+        (n_tips, n_channels[pipette])
+        for pipette, n_tips in count_plan_tips(plan).items()]
+
+
+# prestwick serial dilution plate: high concentration drugs every third
+# column, controls in one row
+PRESTWICK_HIGH_COLS = ['1', '4', '7', '10']
+PRESTWICK_CONTROLS = {
+    # DMSO in 4:8, water in 9:12
+    'blocks': {'DMSO': ['4', '5', '6', '7', '8'],
+               'water': ['9', '10', '11', '12']},
+    # water in the high concentration columns (and 12), so that the
+    # solvent columns are DMSO in every row
+    'interleaved': {'DMSO': ['5', '6', '8', '9', '11'],
+                    'water': ['4', '7', '10', '12']},
+    }
+
+
+def prestwick_layout(control_layout, control_row='A', solvent_volume=36,
+                     control_volume=40):
+    """
+    Return serial_dilution_layout of the prestwick plate with the controls
+    of PRESTWICK_CONTROLS[control_layout] in control_row
+    """
+    controls = {
+        liquid: [control_row + col for col in cols]
+        for liquid, cols in PRESTWICK_CONTROLS[control_layout].items()}
+    control_wells = sum(controls.values(), [])
+    high_wells = [
+        row + col for row in MULTI_CHANNEL_ROWS for col in PRESTWICK_HIGH_COLS
+        if row + col not in control_wells]
+    return serial_dilution_layout(
+        high_wells, controls, solvent_volume, control_volume)
+
+
+def _plan_counts(plan, max_volumes):
+    n_ops = {}
+    for step in plan:
+        n_ops[step['pipette']] = n_ops.get(step['pipette'], 0) + int(
+            np.ceil(step['volume'] / max_volumes[step['pipette']]))
+    return n_ops, count_plan_tips(plan)
+
+
+def bench(control_row='A'):
+    """
+    Return {(control_layout, mode): (aspirations, tips, seconds)} of the
+    pre-fill of the prestwick plate, per pipette for aspirations and tips.
+    'rows' is the fill before the pre-fill: one tip per row of solvent, one
+    per control liquid.
+    """
+    max_volumes = {'p50': 50, 'p50 multi': 50, 'p10': 10}
+    out = {}
+    for control_layout in PRESTWICK_CONTROLS:
+        volumes, liquids, is_control = prestwick_layout(
+            control_layout, control_row)
+        trough_wells = {'DMSO': 'A2', 'water': 'A1'}
+        rows_ops = int((volumes > 0).sum())
+        rows_tips = int((volumes > 0).any(axis=1).sum()) + len(trough_wells)
+        out[control_layout, 'rows'] = (
+            {'p50': rows_ops}, {'p50': rows_tips},
+            rows_ops * SECONDS_PER_ASPIRATE_DISPENSE
+            + rows_tips * SECONDS_PER_PICK_DROP)
+        for mode, multi, single in [('single', None, 'p50'),
+                                    ('multi', 'p50 multi', 'p10')]:
+            plan = prefill_plan(
+                volumes, liquids, '6', '9', trough_wells, multi=multi,
+                single=single, blow_out=is_control)
+            n_ops, n_tips = _plan_counts(plan, max_volumes)
+            out[control_layout, mode] = (
+                n_ops, n_tips, estimate_fill_seconds(plan, max_volumes))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the ways of pre-filling a plate')
+    parser.add_argument('action', choices=['bench'])
+    parser.add_argument('--control-row', default='A')
+    args = parser.parse_args()
+    for (control_layout, mode), (n_ops, n_tips, seconds) in bench(
+            args.control_row).items():
+        print('{:<12}{:<8}{:>5.0f} s  aspirations {}  tips {}'.format(
+            control_layout, mode, seconds, n_ops, n_tips))
+
+
+if __name__ == '__main__':
+    main()
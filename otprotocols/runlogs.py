@@ -0,0 +1,261 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Runlogs: writing them, and an index to search them.
+
+The protocols dump robot.commands() at the end of a real run into
+/data/user_storage/opentrons_data/protocols_logs/<end time>[_name]_runlog.txt.
+write_runlog does the same, with a short header of '#' lines (protocol name,
+start time) so that runs can be identified and timed later.
+
+index_runlogs parses the runlogs into a SQLite database, only the files that
+are new or changed since the last time. Each run is stored once, with what it
+did to each well aggregated (not one row per command), so the queries don't
+read any text:
+
+    python -m otprotocols.runlogs index
+    python -m otprotocols.runlogs touched 10 D4
+    python -m otprotocols.runlogs tips-per-month
+    python -m otprotocols.runlogs runs prestwick
+"""
+
+import os
+import re
+import glob
+import sqlite3
+import argparse
+import datetime
+from collections import Counter
+
+RUNLOG_DIR = '/data/user_storage/opentrons_data/protocols_logs/'
+RUNLOG_SUFFIX = '_runlog.txt'
+TIME_FORMAT = '%Y%m%d_%H%M%S'
+FNAME_REGEX = re.compile(r'^(\d{8}_\d{6})_?(.*)' + re.escape(RUNLOG_SUFFIX))
+LOCATION_REGEX = re.compile(r'wells? ([A-P])(\d{1,2})(\.\.\.)?\S* in "(\d+)"')
+MULTI_CHANNEL_ROWS = 'ABCDEFGH'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE,
+    mtime REAL,
+    size INTEGER,
+    protocol TEXT,
+    started TEXT,
+    finished TEXT,
+    month TEXT,
+    n_commands INTEGER,
+    n_tips INTEGER
+);
+CREATE TABLE IF NOT EXISTS touches (
+    run_id INTEGER,
+    slot TEXT,
+    well TEXT,
+    actions TEXT,
+    n INTEGER
+);
+CREATE INDEX IF NOT EXISTS touches_slot_well ON touches (slot, well);
+CREATE INDEX IF NOT EXISTS runs_protocol ON runs (protocol);
+"""
+
+
+def write_runlog(
+        commands, protocol_name=None, started=None, log_dir=RUNLOG_DIR):
+    """
+    Write robot.commands() to a runlog, with a header. started: datetime of
+    the start of the run. Return the path of the runlog.
+    """
+    finished = datetime.datetime.now()
+    fname = finished.strftime(TIME_FORMAT)
+    if protocol_name:
+        fname += '_' + protocol_name
+    path = os.path.join(log_dir, fname + RUNLOG_SUFFIX)
+    with open(path, 'w') as fid:
+        if protocol_name:
+            print('# protocol: {}'.format(protocol_name), file=fid)
+        if started is not None:
+            print('# started: {}'.format(started.strftime(TIME_FORMAT)),
+                  file=fid)
+        print('# finished: {}'.format(fname[:15]), file=fid)
+        for command in commands:
+            print(command, file=fid)
+    return path
+
+
+def read_runlog(path):
+    """
+    Return (header dict, list of commands) of a runlog. The header has at
+    least 'protocol' (from the file name if not in the header, '' if
+    unknown), 'started' (None if unknown) and 'finished'.
+    """
+    match = FNAME_REGEX.match(os.path.basename(path))
+    header = {'protocol': '', 'started': None, 'finished': None}
+    if match is not None:
+        header['finished'], header['protocol'] = match.groups()
+    commands = []
+    with open(path) as fid:
+        for line in fid:
+            line = line.rstrip('\n')
+            if line.startswith('# ') and ':' in line:
+                key, _, value = line[2:].partition(':')
+                header[key.strip()] = value.strip()
+            elif line:
+                commands.append(line)
+    return header, commands
+
+
+def well_touches(commands):
+    """
+    Return a dict {(slot, well): (actions, n)} of the wells reached by the
+    commands (all 8 wells for multichannel commands), with the sorted,
+    comma separated actions ('aspirating', 'picking'...) and how many
+    commands reached them; and the number of tips picked up.
+    """
+    # count identical locations first, runlogs repeat them a lot
+    locations = Counter()
+    for command in commands:
+        action = command.split(' ', 1)[0].lower()
+        if action in ('transferring', 'distributing', 'consolidating'):
+            continue
+        match = LOCATION_REGEX.search(command)
+        if match is not None:
+            locations[(action,) + match.groups()] += 1
+    touches = {}
+    n_tips = 0
+    for (action, row, col, is_multi, slot), n in locations.items():
+        rows = MULTI_CHANNEL_ROWS[MULTI_CHANNEL_ROWS.index(row):] \
+            if is_multi else row
+        for r in rows:
+            actions, n_well = touches.get((slot, r + col), (set(), 0))
+            actions.add(action)
+            touches[(slot, r + col)] = (actions, n_well + n)
+        if action == 'picking':
+            n_tips += n * len(rows)
+    touches = {
+        key: (','.join(sorted(actions)), n)
+        for key, (actions, n) in touches.items()}
+    return touches, n_tips
+
+
+def _month(timestamp):
+    return '{}-{}'.format(timestamp[:4], timestamp[4:6]) if timestamp else None
+
+
+def connect(db_path):
+    db = sqlite3.connect(db_path)
+    db.executescript(SCHEMA)
+    return db
+
+
+def index_runlogs(log_dir=RUNLOG_DIR, db_path=None):
+    """
+    Add new or changed runlogs of log_dir to the database (default
+    runlogs.sqlite in log_dir). Return the number of runlogs indexed.
+    """
+    db = connect(db_path or os.path.join(log_dir, 'runlogs.sqlite'))
+    known = {
+        path: (mtime, size) for path, mtime, size in
+        db.execute('SELECT path, mtime, size FROM runs')}
+    n_indexed = 0
+    paths = sorted(glob.glob(os.path.join(log_dir, '*' + RUNLOG_SUFFIX)))
+    with db:
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            if path in known:
+                run_id, = db.execute(
+                    'SELECT run_id FROM runs WHERE path = ?', (path,)
+                    ).fetchone()
+                db.execute('DELETE FROM touches WHERE run_id = ?', (run_id,))
+                db.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+            header, commands = read_runlog(path)
+            touches, n_tips = well_touches(commands)
+            cursor = db.execute(
+                'INSERT INTO runs (path, mtime, size, protocol, started, '
+                'finished, month, n_commands, n_tips) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (path, stat.st_mtime, stat.st_size, header['protocol'],
+                 header['started'], header['finished'],
+                 _month(header['finished']), len(commands), n_tips))
+            db.executemany(
+                'INSERT INTO touches VALUES (?, ?, ?, ?, ?)',
+                [(cursor.lastrowid, slot, well, actions, n)
+                 for (slot, well), (actions, n) in touches.items()])
+            n_indexed += 1
+    db.close()
+    return n_indexed
+
+
+def runs_touching(db, slot, well, action=None):
+    """
+    Return [(path, protocol, finished, actions, n)] of the runs that reached
+    a well (with action, e.g. 'dispensing', only if they did that there)
+    """
+    query = ('SELECT runs.path, runs.protocol, runs.finished, '
+             'touches.actions, touches.n FROM touches JOIN runs '
+             'USING (run_id) WHERE touches.slot = ? AND touches.well = ?')
+    args = [str(slot), well]
+    if action is not None:
+        query += ' AND touches.actions LIKE ?'
+        args.append('%' + action + '%')
+    return db.execute(query + ' ORDER BY runs.finished', args).fetchall()
+
+
+def tips_per_month(db):
+    """
+    Return [(month, tips, runs)]
+    """
+    return db.execute(
+        'SELECT month, SUM(n_tips), COUNT(*) FROM runs '
+        'GROUP BY month ORDER BY month').fetchall()
+
+
+def runs_of_protocol(db, name):
+    """
+    Return [(path, protocol, started, finished, n_commands, n_tips)] of the
+    runs whose protocol name contains name
+    """
+    return db.execute(
+        'SELECT path, protocol, started, finished, n_commands, n_tips '
+        'FROM runs WHERE protocol LIKE ? ORDER BY finished',
+        ('%' + name + '%',)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index and search runlogs')
+    parser.add_argument('--log-dir', default=RUNLOG_DIR)
+    parser.add_argument('--db', default=None)
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('index')
+    touched_parser = subparsers.add_parser('touched')
+    touched_parser.add_argument('slot')
+    touched_parser.add_argument('well')
+    subparsers.add_parser('tips-per-month')
+    runs_parser = subparsers.add_parser('runs')
+    runs_parser.add_argument('protocol')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.log_dir, 'runlogs.sqlite')
+    if args.action == 'index':
+        n_indexed = index_runlogs(args.log_dir, db_path)
+        print('{} runlogs indexed'.format(n_indexed))
+        return
+    if args.action is None:
+        parser.print_help()
+        return
+    db = connect(db_path)
+    if args.action == 'touched':
+        rows = runs_touching(db, args.slot, args.well)
+    elif args.action == 'tips-per-month':
+        rows = tips_per_month(db)
+    else:
+        rows = runs_of_protocol(db, args.protocol)
+    for row in rows:
+        print('\t'.join(str(value) for value in row))
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Split a library campaign across several robots.
+
+A campaign is a list of jobs (one protocol run each):
+
+    {'name': 'dilution_L01',
+     'duration': 60,              # minutes on the robot
+     'setup': 10,                 # minutes of operator time to load the deck
+     'depends_on': []}            # names of jobs that must be finished first
+
+Operator time is a shared resource: one person loads one deck at a time, and
+only when they are in the lab (operator_windows, in minutes from the start
+of the campaign).
+Jobs are list-scheduled by longest remaining path first, each one going to the
+robot where it can start the earliest.
+
+Run as a script for the Prestwick campaign:
+    python -m otprotocols.scheduler --robots 2
+"""
+
+import argparse
+
+import numpy as np
+
+
+def prestwick_campaign_jobs(
+        n_dilution_plates=9, n_shuffle_plates=10,
+        dilution_minutes=60, shuffle_minutes=25, setup_minutes=10):
+    """
+    Return the jobs of a full Prestwick campaign: each shuffle plate can only
+    be done after the serial dilution of the library plate with the same
+    number (if there is one).
+    Durations are rough guesses, pass better ones if you have them.
+    """
+    jobs = []
+    for pc in range(1, n_dilution_plates + 1):
+        jobs.append({
+            'name': 'dilution_L{:02d}'.format(pc),
+            'duration': dilution_minutes,
+            'setup': setup_minutes,
+            'depends_on': [],
+            })
+    for pc in range(1, n_shuffle_plates + 1):
+        depends_on = []
+        if pc <= n_dilution_plates:
+            depends_on.append('dilution_L{:02d}'.format(pc))
+        jobs.append({
+            'name': 'shuffle_L{:02d}'.format(pc),
+            'duration': shuffle_minutes,
+            'setup': setup_minutes,
+            'depends_on': depends_on,
+            })
+    return jobs
+
+
+def _check_jobs(jobs):
+    names = [job['name'] for job in jobs]
+    assert len(set(names)) == len(names), 'Job names must be unique'
+    for job in jobs:
+        for dep in job['depends_on']:
+            assert dep in names, '{} depends on unknown job {}'.format(
+                job['name'], dep)
+
+
+def critical_path_lengths(jobs):
+    """
+    Return a dict {job name: longest time from its start to the end of the
+    campaign, following dependencies}
+    """
+    by_name = {job['name']: job for job in jobs}
+    children = {job['name']: [] for job in jobs}
+    for job in jobs:
+        for dep in job['depends_on']:
+            children[dep].append(job['name'])
+    lengths = {}
+
+    def _length(name, visiting=()):
+        if name in lengths:
+            return lengths[name]
+        assert name not in visiting, 'Circular dependency at {}'.format(name)
+        job = by_name[name]
+        tail = max(
+            [_length(c, visiting + (name,)) for c in children[name]],
+            default=0)
+        lengths[name] = job['setup'] + job['duration'] + tail
+        return lengths[name]
+
+    for job in jobs:
+        _length(job['name'])
+    return lengths
+
+
+def next_operator_time(t, duration, operator_windows):
+    """
+    Return the first time >= t at which the operator can work for duration
+    minutes without leaving. None if never.
+    """
+    if operator_windows is None:
+        return t
+    for start, end in sorted(operator_windows):
+        t0 = max(t, start)
+        if t0 + duration <= end:
+            return t0
+    return None
+
+
+def schedule_campaign(jobs, n_robots, operator_windows=None):
+    """
+    Assign jobs to robots.
+    Return a list of dicts {'name', 'robot', 'setup_start', 'start', 'end'}
+    (times in minutes), sorted by start time.
+    """
+    _check_jobs(jobs)
+    priority = critical_path_lengths(jobs)
+    by_name = {job['name']: job for job in jobs}
+    robot_free = np.zeros(n_robots)
+    operator_free = 0.0
+    finished = {}
+    schedule = []
+    pending = set(by_name)
+    while pending:
+        ready = [
+            name for name in pending
+            if all(dep in finished for dep in by_name[name]['depends_on'])]
+        # longest path first, then name so that ties are reproducible
+        name = sorted(ready, key=lambda n: (-priority[n], n))[0]
+        job = by_name[name]
+        deps_done = max(
+            [finished[dep] for dep in job['depends_on']], default=0.0)
+        best = None
+        for rc in range(n_robots):
+            earliest = max(robot_free[rc], deps_done, operator_free)
+            setup_start = next_operator_time(
+                earliest, job['setup'], operator_windows)
+            if setup_start is None:
+                continue
+            if best is None or setup_start < best[1]:
+                best = (rc, setup_start)
+        assert best is not None, (
+            'No operator time left to set up {}'.format(name))
+        rc, setup_start = best
+        start = setup_start + job['setup']
+        end = start + job['duration']
+        robot_free[rc] = end
+        operator_free = start
+        finished[name] = end
+        pending.remove(name)
+        schedule.append({
+            'name': name,
+            'robot': 'robot_{}'.format(rc + 1),
+            'setup_start': setup_start,
+            'start': start,
+            'end': end,
+            })
+    schedule.sort(key=lambda s: (s['setup_start'], s['robot']))
+    return schedule
+
+
+def makespan(schedule):
+    return max(s['end'] for s in schedule)
+
+
+def simulate_campaign(schedule, jobs, durations):
+    """
+    Replay a schedule on stand-in robots, with the actual durations
+    ({job name: minutes}), keeping the order of the jobs on each robot and the
+    dependencies. Setup is assumed to happen as soon as possible.
+    Return the actual makespan.
+    """
+    by_name = {job['name']: job for job in jobs}
+    robot_free = {}
+    finished = {}
+    # jobs in order of planned start, so dependencies are always done before
+    for s in sorted(schedule, key=lambda s: s['start']):
+        job = by_name[s['name']]
+        deps_done = max(
+            [finished[dep] for dep in job['depends_on']], default=0.0)
+        start = max(robot_free.get(s['robot'], 0.0), deps_done) + job['setup']
+        end = start + durations.get(s['name'], job['duration'])
+        robot_free[s['robot']] = end
+        finished[s['name']] = end
+    return max(finished.values())
+
+
+def gantt_chart(schedule, minutes_per_char=5):
+    """
+    Return a text Gantt chart, one line per robot.
+    '.' is setup, a letter is a job (see legend), ' ' is idle.
+    """
+    robots = sorted(set(s['robot'] for s in schedule))
+    n_chars = int(np.ceil(makespan(schedule) / minutes_per_char))
+    symbols = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    lines = []
+    legend = []
+    for rc, robot in enumerate(robots):
+        line = [' '] * n_chars
+        for jc, s in enumerate(
+                [s for s in schedule if s['robot'] == robot]):
+            symbol = symbols[(rc * 26 + jc) % len(symbols)]
+            legend.append('{} {}: {} ({:.0f}-{:.0f} min)'.format(
+                robot, symbol, s['name'], s['start'], s['end']))
+            t0 = int(s['setup_start'] // minutes_per_char)
+            t1 = int(s['start'] // minutes_per_char)
+            t2 = int(np.ceil(s['end'] / minutes_per_char))
+            line[t0:t1] = '.' * (t1 - t0)
+            line[t1:t2] = symbol * (t2 - t1)
+        lines.append('{:>8} |{}|'.format(robot, ''.join(line)))
+    header = '{:>8}  each character is {} min, makespan {:.0f} min'.format(
+        '', minutes_per_char, makespan(schedule))
+    return '\n'.join([header] + lines + [''] + legend)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Schedule a Prestwick campaign on several robots')
+    parser.add_argument('--robots', type=int, default=2)
+    parser.add_argument('--dilution-minutes', type=float, default=60)
+    parser.add_argument('--shuffle-minutes', type=float, default=25)
+    parser.add_argument('--setup-minutes', type=float, default=10)
+    parser.add_argument(
+        '--operator-hours', type=float, nargs=2, default=None,
+        metavar=('FROM', 'TO'),
+        help='hours of the day the operator is around, e.g. 9 18')
+    args = parser.parse_args()
+
+    jobs = prestwick_campaign_jobs(
+        dilution_minutes=args.dilution_minutes,
+        shuffle_minutes=args.shuffle_minutes,
+        setup_minutes=args.setup_minutes)
+    operator_windows = None
+    if args.operator_hours is not None:
+        # campaign starts at FROM on day one, plan a week ahead
+        start, end = args.operator_hours
+        operator_windows = [
+            (day * 24 * 60, day * 24 * 60 + (end - start) * 60)
+            for day in range(7)]
+    one_robot = makespan(schedule_campaign(jobs, 1, operator_windows))
+    schedule = schedule_campaign(jobs, args.robots, operator_windows)
+    print(gantt_chart(schedule))
+    print('')
+    print('makespan with 1 robot: {:.0f} min, with {}: {:.0f} min'.format(
+        one_robot, args.robots, makespan(schedule)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Column shuffles with constraints, for the replicate (shuffled) stock plates.
+
+Instead of np.random.shuffle on each destination independently, all the
+replicates of a source plate are drawn together so that:
+    - a source column never lands in the same destination column twice
+        (e.g. across SH01, SH02, SH03)
+    - control columns are never on the edge of the plate
+    - no source column is on the edge more often than the others
+    - columns of the same compound (e.g. the 3 doses of a drug) are never
+        next to each other in the destination
+
+Each replicate is drawn by vectorised rejection sampling (a batch of random
+permutations is generated and checked at once). If that fails, because the
+constraints left very few valid layouts, a randomised backtracking search
+takes over. Both only use a RandomState seeded once, so the result is the same
+for the same seed.
+"""
+
+import numpy as np
+
+
+def _valid_permutations(
+        perms, used, edge_count, max_edge, edge_mask, control_cols, groups):
+    """
+    Return a boolean array, True for rows of perms (batch x n_columns,
+    perms[k, i] = destination column of source column i) that satisfy all the
+    constraints
+    """
+    n_columns = perms.shape[1]
+    src_cols = np.arange(n_columns)
+    # same destination as a previous replicate
+    valid = ~used[src_cols, perms].any(axis=1)
+    # edge balance and controls on edge
+    on_edge = edge_mask[perms]
+    valid &= ((edge_count[None, :] + on_edge) <= max_edge).all(axis=1)
+    if len(control_cols) > 0:
+        valid &= ~on_edge[:, control_cols].any(axis=1)
+    # same compound in neighbouring destination columns
+    if groups is not None:
+        dst_to_src = perms.argsort(axis=1)
+        dst_groups = groups[dst_to_src]
+        valid &= ~(dst_groups[:, 1:] == dst_groups[:, :-1]).any(axis=1)
+    return valid
+
+
+def _backtrack_permutation(
+        used, edge_count, max_edge, edge_mask, control_cols, groups, rs):
+    """
+    Fill destination columns left to right, trying source columns in random
+    order and going back when stuck. Return a permutation or None.
+    """
+    n_columns = used.shape[0]
+    is_control = np.zeros(n_columns, dtype=bool)
+    is_control[list(control_cols)] = True
+    allowed = ~used.T  # allowed[dst, src]
+    for dst in np.flatnonzero(edge_mask):
+        allowed[dst] &= ~is_control
+        allowed[dst] &= edge_count < max_edge
+    dst_to_src = -np.ones(n_columns, dtype=int)
+    taken = np.zeros(n_columns, dtype=bool)
+    orders = [rs.permutation(n_columns) for _ in range(n_columns)]
+
+    def _fill(dst):
+        if dst == n_columns:
+            return True
+        for src in orders[dst]:
+            if taken[src] or not allowed[dst, src]:
+                continue
+            if (groups is not None and dst > 0
+                    and groups[src] == groups[dst_to_src[dst - 1]]):
+                continue
+            taken[src] = True
+            dst_to_src[dst] = src
+            if _fill(dst + 1):
+                return True
+            taken[src] = False
+        dst_to_src[dst] = -1
+        return False
+
+    if not _fill(0):
+        return None
+    return dst_to_src.argsort()
+
+
+def constrained_column_shuffles(
+        n_replicates, n_columns=12, seed=None, control_cols=(),
+        edge_cols=None, compound_groups=None, max_edge_per_column=None,
+        batch_size=1024, max_batches=8, max_restarts=20):
+    """
+    Return an int array (n_replicates x n_columns), where out[r, i] is the
+    destination column of source column i in replicate r (0-indexed, same as
+    dst_cols in the shuffle protocols).
+    control_cols: source columns that cannot go on the edge
+    edge_cols: destination columns on the edge, default first and last
+    compound_groups: one label per source column, columns with the same label
+        are never neighbours in the destination
+    max_edge_per_column: how many times a source column can be on the edge,
+        default is as even as possible
+    """
+    assert n_replicates <= n_columns, (
+        'Cannot avoid repeating a destination column with more replicates '
+        'than columns')
+    rs = np.random.RandomState(seed)
+    if edge_cols is None:
+        edge_cols = (0, n_columns - 1)
+    edge_mask = np.zeros(n_columns, dtype=bool)
+    edge_mask[list(edge_cols)] = True
+    control_cols = np.array(control_cols, dtype=int)
+    groups = None
+    if compound_groups is not None:
+        groups = np.asarray(compound_groups)
+        assert len(groups) == n_columns
+    if max_edge_per_column is None:
+        max_edge_per_column = int(np.ceil(
+            n_replicates * edge_mask.sum()
+            / float(n_columns - len(control_cols))))
+
+    # drawing replicates one after the other can paint us into a corner,
+    # if so start again (still deterministic, the RandomState carries on)
+    for _ in range(max_restarts):
+        out = _draw_replicates(
+            n_replicates, n_columns, rs, control_cols, edge_mask, groups,
+            max_edge_per_column, batch_size, max_batches)
+        if out is not None:
+            return out
+    raise ValueError(
+        'No valid layout for {} replicates, relax the constraints'.format(
+            n_replicates))
+
+
+def _draw_replicates(
+        n_replicates, n_columns, rs, control_cols, edge_mask, groups,
+        max_edge_per_column, batch_size, max_batches):
+    """
+    Draw the replicates one at a time, return None if stuck
+    """
+    used = np.zeros((n_columns, n_columns), dtype=bool)  # [src, dst]
+    edge_count = np.zeros(n_columns, dtype=int)
+    out = np.zeros((n_replicates, n_columns), dtype=int)
+    for rc in range(n_replicates):
+        perm = None
+        constraints = (
+            used, edge_count, max_edge_per_column, edge_mask, control_cols,
+            groups)
+        for _ in range(max_batches):
+            perms = rs.rand(batch_size, n_columns).argsort(axis=1)
+            valid = _valid_permutations(perms, *constraints)
+            if valid.any():
+                perm = perms[np.argmax(valid)]
+                break
+        if perm is None:
+            perm = _backtrack_permutation(*constraints, rs=rs)
+        if perm is None:
+            return None
+        out[rc] = perm
+        used[np.arange(n_columns), perm] = True
+        edge_count += edge_mask[perm]
+    return out
+
+
+def constrained_drugs_mapping(
+        source_slot, destination_slots, n_columns=12, seed=None, **kwargs):
+    """
+    Return a drugs_mapping dict, as used in the shuffle protocols:
+        {(source slot, dest slot):(cols in source, cols in dest)}
+    with one constrained shuffle of source_slot per destination slot.
+    Keyword arguments go to constrained_column_shuffles.
+    """
+    shuffles = constrained_column_shuffles(
+        len(destination_slots), n_columns=n_columns, seed=seed, **kwargs)
+    src_cols = np.arange(n_columns)
+    drugs_mapping = {}
+    for ds, dst_cols in zip(destination_slots, shuffles):
+        drugs_mapping[(source_slot, ds)] = (src_cols, dst_cols)
+    return drugs_mapping
@@ -0,0 +1,428 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Cache of simulation results.
+
+An entry is keyed by a hash of everything the simulation depends on:
+    - the protocol source
+    - the source of the local modules it imports (e.g. otprotocols.plan),
+        followed recursively
+    - the definition of every custom labware it loads or creates. As the
+        protocols only call labware.create if the name is not in the robot
+        database yet, the definition used is not necessarily the one in the
+        protocol: all labware.create calls of the protocols in the folder are
+        hashed, by labware name, so changing any of them busts every entry
+        that uses that labware
+    - the parameters overridden (see otprotocols.simserver)
+    - the contents of the files the protocols read at run time: the tip
+        state and the agar calibration (INPUT_FILES), and any file named by
+        a top level string constant of the protocol or by a parameter. A
+        missing file hashes differently from any content
+    - the version of opentrons (the simserver is local, so it is the one
+        installed here)
+It stores the command stream, tip counts and a rough duration estimate:
+a time per kind of command, plus the travel between the locations of
+consecutive commands at the gantry speed. Moves ('Moving to', e.g. the arcs
+of otprotocols.microops) only cost their travel, and blow outs without a
+location go to the trash.
+Entries are json files in a folder; the oldest are evicted past max_age_days,
+and the least recently used past max_bytes.
+
+    python -m otprotocols.simcache prestwick_library_serial_dilution_plate*.py
+
+simulates (through a running otprotocols.simserver) only what changed.
+"""
+
+import os
+import re
+import ast
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import functools
+
+import numpy as np
+
+from otprotocols.agar import AGAR_CALIBRATION_FILE
+from otprotocols.deck import well_xy, GANTRY_SPEED, TRASH_SLOT
+from otprotocols.tipstate import TIP_STATE_FILE
+
+SIMCACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'otprotocols', 'simcache')
+
+# rough duration of each kind of command, in seconds
+COMMAND_SECONDS = {
+    'Picking up tip': 4.5,
+    'Dropping tip': 4.5,
+    'Aspirating': 3.0,
+    'Dispensing': 3.0,
+    'Blowing out': 1.5,
+    'Touching tip': 2.0,
+    # a move only costs its travel
+    'Moving to': 0.0,
+    }
+DELAY_REGEX = re.compile(r'Delaying for (\d+)m (\d+(?:\.\d+)?)s')
+LOCATION_REGEX = re.compile(r'wells? ([A-P]\d{1,2})(?:\.\.\.\S+)? in "(\d+)"')
+HEADER_PREFIXES = ('Transferring', 'Distributing', 'Consolidating')
+# files the protocols read at run time, hashed by content
+INPUT_FILES = (TIP_STATE_FILE, AGAR_CALIBRATION_FILE)
+# bumped when the entries change, so that old ones are not used
+ENTRY_VERSION = 4
+
+
+def travel_mm(commands):
+    """
+    Return the distance (mm) between consecutive locations of the commands
+    (transfer headers are not moves, blow outs without a location are in
+    the trash)
+    """
+    xy = []
+    for command in commands:
+        if command.startswith(HEADER_PREFIXES):
+            continue
+        found = LOCATION_REGEX.findall(command)[:1]
+        if not found and command.startswith('Blowing out'):
+            found = [('A1', TRASH_SLOT)]
+        xy.extend(well_xy(slot, well) for well, slot in found)
+    if len(xy) < 2:
+        return 0.0
+    return float(np.linalg.norm(np.diff(np.array(xy), axis=0), axis=1).sum())
+
+
+def estimate_seconds(commands, command_seconds=None, speed=GANTRY_SPEED):
+    """
+    Return a rough duration (s) of a command stream: the time of each
+    command, plus the travel at speed (mm/s, None to leave travel out, e.g.
+    for commands that do not follow each other)
+    """
+    command_seconds = command_seconds or COMMAND_SECONDS
+    total = 0.0 if speed is None else travel_mm(commands) / speed
+    for command in commands:
+        match = DELAY_REGEX.search(command)
+        if match is not None:
+            total += 60 * int(match.group(1)) + float(match.group(2))
+            continue
+        for prefix, seconds in command_seconds.items():
+            if command.startswith(prefix):
+                total += seconds
+                break
+    return total
+
+
+def _parse(path):
+    with open(path) as fid:
+        source = fid.read()
+    return source, ast.parse(source, filename=path)
+
+
+def _is_labware_call(node, method):
+    # labware.<method>(...)
+    return (isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == method
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == 'labware')
+
+
+def _top_level_constants(tree):
+    # {name: value} of the `name = literal` assignments of a module
+    constants = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Constant)):
+            constants[node.targets[0].id] = node.value.value
+    return constants
+
+
+def _labware_name(node, constants):
+    # first argument of a labware call, None if it can't be told statically
+    if not node.args:
+        return None
+    arg = node.args[0]
+    if isinstance(arg, ast.Constant):
+        return arg.value
+    if isinstance(arg, ast.Name):
+        return constants.get(arg.id)
+    return None
+
+
+def labware_definitions(folder):
+    """
+    Return a dict {labware name: [ast dumps of its labware.create calls]}
+    from all the protocols in folder
+    """
+    definitions = {}
+    for path in sorted(glob.glob(os.path.join(folder, '*.py'))):
+        try:
+            _, tree = _parse(path)
+        except (SyntaxError, UnicodeDecodeError):
+            continue
+        constants = _top_level_constants(tree)
+        for node in ast.walk(tree):
+            if _is_labware_call(node, 'create'):
+                name = _labware_name(node, constants)
+                definitions.setdefault(name, set()).add(ast.dump(node))
+    return {name: sorted(dumps) for name, dumps in definitions.items()}
+
+
+def labware_names(tree):
+    """
+    Return the set of labware names loaded or created in a module, as far
+    as they are literals or simple top level variables
+    """
+    constants = _top_level_constants(tree)
+    names = set()
+    for node in ast.walk(tree):
+        if _is_labware_call(node, 'load') or _is_labware_call(node, 'create'):
+            # None: can't tell which one, depends on all of them
+            names.add(_labware_name(node, constants))
+    return names
+
+
+def local_imports(path, root=None):
+    """
+    Return the sorted list of files of the modules imported by path that
+    live under root (default: the folder of path), followed recursively
+    """
+    root = root or os.path.dirname(os.path.abspath(path))
+    found = set()
+    todo = [os.path.abspath(path)]
+    while todo:
+        _, tree = _parse(todo.pop())
+        names = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names.extend(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                names.append(node.module)
+                names.extend(
+                    node.module + '.' + alias.name for alias in node.names)
+        for name in names:
+            parts = name.split('.')
+            # the module itself and the packages it is in
+            for n_parts in range(1, len(parts) + 1):
+                base = os.path.join(root, *parts[:n_parts])
+                for candidate in (base + '.py',
+                                  os.path.join(base, '__init__.py')):
+                    if os.path.isfile(candidate) and candidate not in found:
+                        found.add(candidate)
+                        todo.append(candidate)
+    return sorted(found)
+
+
+def input_files(tree, parameters=None):
+    """
+    Return the sorted list of files a protocol reads at run time:
+    INPUT_FILES, plus the top level string constants and parameters that
+    name an existing file
+    """
+    values = list(_top_level_constants(tree).values())
+    values += list((parameters or {}).values())
+    named = {v for v in values if isinstance(v, str) and os.path.isfile(v)}
+    return sorted(set(INPUT_FILES) | named)
+
+
+def _hash_file(sha, path):
+    sha.update(path.encode('utf-8'))
+    try:
+        with open(path, 'rb') as fid:
+            sha.update(hashlib.sha256(fid.read()).digest())
+    except IOError:
+        sha.update(b'missing')
+
+
+@functools.lru_cache(maxsize=None)
+def opentrons_version():
+    """
+    Return the version of opentrons, without importing the API if it is not
+    imported yet (that is what the simserver saves us), None if it is not
+    installed
+    """
+    if 'opentrons' in sys.modules:
+        return sys.modules['opentrons'].__version__
+    try:
+        import pkg_resources
+    except ImportError:
+        return None
+    try:
+        return pkg_resources.get_distribution('opentrons').version
+    except pkg_resources.DistributionNotFound:
+        return None
+
+
+def cache_key(path, parameters=None, definitions=None, extra=None):
+    """
+    Return the hex hash of everything the simulation of path depends on.
+    definitions: output of labware_definitions, computed if not given
+    extra: anything else to hash in, on top of the opentrons version
+    """
+    path = os.path.abspath(path)
+    folder = os.path.dirname(path)
+    if definitions is None:
+        definitions = labware_definitions(folder)
+    sha = hashlib.sha256()
+    files = [path] + local_imports(path)
+    names = set()
+    for fname in files:
+        source, tree = _parse(fname)
+        sha.update(os.path.relpath(fname, folder).encode('utf-8'))
+        sha.update(source.encode('utf-8'))
+        names |= labware_names(tree)
+        if fname == path:
+            for input_file in input_files(tree, parameters):
+                _hash_file(sha, input_file)
+    # parameters can swap a labware type
+    names |= {v for v in (parameters or {}).values() if isinstance(v, str)}
+    if None in names:
+        names = set(definitions)
+    for name in sorted(names, key=str):
+        if name in definitions:
+            sha.update(json.dumps([name, definitions[name]]).encode('utf-8'))
+    sha.update(json.dumps(parameters or {}, sort_keys=True).encode('utf-8'))
+    sha.update(json.dumps(extra, sort_keys=True).encode('utf-8'))
+    sha.update(str(opentrons_version()).encode('utf-8'))
+    sha.update(str(ENTRY_VERSION).encode('utf-8'))
+    return sha.hexdigest()
+
+
+class SimulationCache(object):
+    """
+    Folder of json entries, one per cache key
+    """
+
+    def __init__(
+            self, folder=SIMCACHE_DIR, max_bytes=200 * 2**20,
+            max_age_days=30):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.json')
+
+    def get(self, key):
+        """
+        Return the stored entry, or None
+        """
+        path = self._path(key)
+        try:
+            with open(path) as fid:
+                entry = json.load(fid)
+        except (IOError, ValueError):
+            return None
+        # mtime is the last use, for the eviction
+        os.utime(path, None)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store an entry (a json serialisable dict), then evict
+        """
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fid:
+            json.dump(entry, fid)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove entries older than max_age_days, then the least recently
+        used ones until the folder is below max_bytes
+        """
+        now = time.time()
+        entries = []
+        for path in glob.glob(os.path.join(self.folder, '*.json')):
+            stat = os.stat(path)
+            if now - stat.st_mtime > self.max_age_days * 24 * 3600:
+                os.remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.folder, '*.json')):
+            os.remove(path)
+
+
+def make_entry(path, reply):
+    """
+    Build a cache entry from a simulation reply (see otprotocols.simserver)
+    """
+    return {
+        'protocol': os.path.basename(path),
+        'created': time.time(),
+        'commands': reply['commands'],
+        'metrics': reply['metrics'],
+        'deck': reply.get('deck', {}),
+        'seconds_estimate': estimate_seconds(reply['commands']),
+        }
+
+
+def cached_simulate(
+        path, parameters=None, cache=None, simulate=None, definitions=None):
+    """
+    Return (entry, is_hit). On a miss, simulate(path, parameters) is called
+    (default: otprotocols.simserver.simulate) and its reply stored, unless
+    the protocol failed.
+    """
+    if cache is None:
+        cache = SimulationCache()
+    if simulate is None:
+        from otprotocols.simserver import simulate
+    key = cache_key(path, parameters, definitions)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry, True
+    reply = simulate(path, parameters)
+    if reply['error'] is not None:
+        raise RuntimeError(reply['error'])
+    entry = make_entry(path, reply)
+    cache.put(key, entry)
+    return entry, False
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate protocols, reusing results of unchanged ones')
+    parser.add_argument('protocols', nargs='+')
+    parser.add_argument('--cache-dir', default=SIMCACHE_DIR)
+    parser.add_argument('--clear', action='store_true')
+    args = parser.parse_args()
+
+    cache = SimulationCache(args.cache_dir)
+    if args.clear:
+        cache.clear()
+    definitions = {}
+    failed = False
+    for path in args.protocols:
+        folder = os.path.dirname(os.path.abspath(path))
+        if folder not in definitions:
+            definitions[folder] = labware_definitions(folder)
+        try:
+            entry, is_hit = cached_simulate(
+                path, cache=cache, definitions=definitions[folder])
+        except RuntimeError as err:
+            print('{}: FAILED\n{}'.format(path, err), file=sys.stderr)
+            failed = True
+            continue
+        print('{}: {} commands, {} tips, ~{:.0f} min {}'.format(
+            path, entry['metrics']['n_commands'], entry['metrics']['n_tips'],
+            entry['seconds_estimate'] / 60, '(cached)' if is_hit else ''))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
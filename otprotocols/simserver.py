@@ -0,0 +1,259 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Warm simulation server.
+
+Simulating a protocol with opentrons_simulate imports the API, opens the
+labware database and checks every labware.create from scratch, which for
+small scripts takes much longer than the protocol itself. This keeps one
+python process with opentrons imported, and simulates protocols sent to it
+over a local socket:
+
+    python -m otprotocols.simserver serve &
+    python -m otprotocols.simserver run iheartworms.py
+    python -m otprotocols.simserver run syngenta_library_to_stock_plates.py \
+        --param control_volume=8 --param "stock_slots=['1', '2']"
+
+Parameters replace the value of top level assignments of the protocol (the
+"user intuitive parameters"), without editing the file.
+Between jobs the robot is reset, and the shared modules next to the protocol
+(e.g. otprotocols) are imported again, so edits to them are picked up.
+
+Requests and replies are one json object per line:
+    -> {"protocol": path, "parameters": {name: value}}
+    <- {"commands": [...], "metrics": {...}, "deck": {slot: labware type},
+        "stdout": str, "error": str}
+"""
+
+import io
+import os
+import ast
+import sys
+import json
+import time
+import socket
+import argparse
+import traceback
+import contextlib
+import socketserver
+
+from otprotocols.tipstate import picked_up_tips
+
+SIMSERVER_HOST = '127.0.0.1'
+SIMSERVER_PORT = 48888
+
+
+def apply_parameters(source, parameters=None, filename='<protocol>'):
+    """
+    Compile a protocol source, replacing the value of the top level
+    assignments `name = ...` with the ones in the dict parameters.
+    Return the code object. Raise KeyError if a parameter is never assigned.
+    """
+    parameters = parameters or {}
+    tree = ast.parse(source, filename=filename)
+    found = set()
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1:
+            continue
+        target = node.targets[0]
+        if isinstance(target, ast.Name) and target.id in parameters:
+            value = ast.parse(repr(parameters[target.id]), mode='eval').body
+            node.value = ast.copy_location(value, node.value)
+            found.add(target.id)
+    missing = set(parameters) - found
+    if missing:
+        raise KeyError('Not assigned in {}: {}'.format(
+            filename, ', '.join(sorted(missing))))
+    ast.fix_missing_locations(tree)
+    return compile(tree, filename, 'exec')
+
+
+def _forget_local_modules(protocol_dir):
+    # drop modules imported from the protocol folder, so they are reloaded
+    protocol_dir = os.path.abspath(protocol_dir)
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if name in ('__main__', __name__) or not path:
+            continue
+        if os.path.abspath(path).startswith(protocol_dir + os.sep):
+            del sys.modules[name]
+
+
+def _cache_labware_list(labware):
+    """
+    Make labware.list() read the database once, and only again after a
+    labware.create
+    """
+    if getattr(labware, '_simserver_cached', False):
+        return
+    list_labware = labware.list
+    create_labware = labware.create
+    cache = {}
+
+    def cached_list(*args, **kwargs):
+        if 'names' not in cache:
+            cache['names'] = list_labware(*args, **kwargs)
+        return cache['names']
+
+    def create(*args, **kwargs):
+        cache.pop('names', None)
+        return create_labware(*args, **kwargs)
+
+    labware.list = cached_list
+    labware.create = create
+    labware._simserver_cached = True
+
+
+def tip_metrics(commands):
+    """
+    Return a dict with pick ups and tips used, from robot.commands()
+    """
+    pick_ups = picked_up_tips(commands)
+    return {
+        'n_pick_ups': len(pick_ups),
+        'n_tips': sum(len(wells) for _, wells in pick_ups),
+        }
+
+
+def deck_labware(robot):
+    """
+    Return a dict {slot: labware type} of what is loaded on the deck
+    """
+    return {
+        container.get_parent().get_name(): container.get_type()
+        for container in robot.get_containers()}
+
+
+def run_protocol(path, parameters=None):
+    """
+    Simulate a protocol in this process (opentrons must be importable).
+    Return a dict with the commands, metrics, deck labware, printed output
+    and error (None if the protocol ran to the end).
+    """
+    from opentrons import robot, labware
+    _cache_labware_list(labware)
+
+    path = os.path.abspath(path)
+    protocol_dir = os.path.dirname(path)
+    if protocol_dir not in sys.path:
+        sys.path.insert(0, protocol_dir)
+    _forget_local_modules(protocol_dir)
+    robot.reset()
+
+    tic = time.time()
+    stdout = io.StringIO()
+    error = None
+    try:
+        with open(path) as fid:
+            code = apply_parameters(fid.read(), parameters, filename=path)
+        with contextlib.redirect_stdout(stdout):
+            exec(code, {'__name__': '__main__', '__file__': path})
+    except Exception:
+        error = traceback.format_exc()
+    commands = list(robot.commands())
+    metrics = {
+        'n_commands': len(commands),
+        'wall_seconds': time.time() - tic,
+        }
+    metrics.update(tip_metrics(commands))
+    return {
+        'commands': commands,
+        'metrics': metrics,
+        'deck': deck_labware(robot),
+        'stdout': stdout.getvalue(),
+        'error': error,
+        }
+
+
+class SimulationHandler(socketserver.StreamRequestHandler):
+    """
+    One json request per connection, one json reply
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            reply = run_protocol(
+                request['protocol'], request.get('parameters'))
+        except Exception:
+            reply = {'commands': [], 'metrics': {}, 'deck': {},
+                     'stdout': '', 'error': traceback.format_exc()}
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+def serve(host=SIMSERVER_HOST, port=SIMSERVER_PORT):
+    """
+    Import opentrons once and serve simulations until interrupted.
+    Jobs run one at a time, as the robot is a global.
+    """
+    from opentrons import robot, labware  # noqa: F401, pay the import now
+    _cache_labware_list(labware)
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.TCPServer((host, port), SimulationHandler) as server:
+        print('Simulation server on {}:{}'.format(host, port))
+        server.serve_forever()
+
+
+def simulate(
+        path, parameters=None, host=SIMSERVER_HOST, port=SIMSERVER_PORT,
+        timeout=600):
+    """
+    Send a protocol to a running server, return its reply (a dict, see
+    run_protocol)
+    """
+    request = {'protocol': os.path.abspath(path),
+               'parameters': parameters or {}}
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as fid:
+            return json.loads(fid.readline().decode('utf-8'))
+
+
+def parse_param(text):
+    # name=value, value as a python literal (or a plain string)
+    name, _, value = text.partition('=')
+    try:
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        pass
+    return name.strip(), value
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Simulate protocols on a warm simulation server')
+    parser.add_argument('--host', default=SIMSERVER_HOST)
+    parser.add_argument('--port', type=int, default=SIMSERVER_PORT)
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.add_parser('serve')
+    run_parser = subparsers.add_parser('run')
+    run_parser.add_argument('protocol')
+    run_parser.add_argument(
+        '--param', action='append', default=[], type=parse_param,
+        help='name=value, replaces a top level assignment of the protocol')
+    run_parser.add_argument(
+        '--commands', action='store_true', help='print the commands too')
+    args = parser.parse_args()
+
+    if args.action == 'serve':
+        serve(args.host, args.port)
+        return
+    if args.action != 'run':
+        parser.print_help()
+        return
+    reply = simulate(
+        args.protocol, dict(args.param), host=args.host, port=args.port)
+    print(reply['stdout'], end='')
+    if args.commands:
+        for command in reply['commands']:
+            print(command)
+    if reply['error'] is not None:
+        print(reply['error'], file=sys.stderr)
+    print(json.dumps(reply['metrics'], sort_keys=True))
+    if reply['error'] is not None:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
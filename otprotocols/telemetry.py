@@ -0,0 +1,254 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Live progress of a run, over local HTTP.
+
+The protocol creates a Telemetry, tells it how many steps the run has and
+before which steps the robot pauses, and passes it to execute_plan, which
+reports each group of steps done and how long it took. Anyone on the robot
+network can then ask:
+
+    curl http://<robot ip>:48889/status
+    python -m otprotocols.telemetry watch --host <robot ip>
+
+and get json with the current phase, step index, percent complete, tips left
+per rack, seconds to the next operator pause and the ETA.
+
+Reporting a step only stores a few numbers; all the arithmetic is done when
+someone asks, in the server thread, so the robot loop is not slowed down.
+Time spent in pauses does not count towards the speed of the robot.
+Objects in telemetry.listeners get each step_done call too (e.g. a
+otprotocols.notify.PauseNotifier, to warn ahead of pauses). Functions in
+telemetry.post_handlers answer POST <path>?<query> (e.g. the swap
+confirmations of otprotocols.pingpong), see post_action. A POST needs the
+token of the telemetry (random, or given), as token=<token> in the query.
+
+APIv1 runs protocols, and simulates them on upload, inside the robot server
+process, so the HTTP server outlives a run: there is one per host and port
+per process, and each start() points it at the new Telemetry. Protocols only
+start it when not simulating, and stop() it at the end of the run.
+"""
+
+import hmac
+import json
+import time
+import secrets
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from urllib.request import Request, urlopen
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+TELEMETRY_HOST = '0.0.0.0'
+TELEMETRY_PORT = 48889
+
+# {(host, port): HTTPServer} of this process, see Telemetry.start
+_SERVERS = {}
+
+
+class Telemetry(object):
+    """
+    Progress of a run. Call start() to serve it on host:port.
+    token: needed by POST requests, random if None
+    """
+
+    def __init__(self, host=TELEMETRY_HOST, port=TELEMETRY_PORT, token=None):
+        self.host = host
+        self.port = port
+        self.token = token or secrets.token_urlsafe(8)
+        self._server = None
+        self.n_steps = 0
+        self.pause_before = []
+        self.step_seconds = None
+        self.steps_done = 0
+        self.active_seconds = 0.0
+        self.phase = None
+        self.tips_left = {}
+        self.started = time.time()
+        self.updated = self.started
+        self.listeners = []
+        self.post_handlers = {}
+
+    def set_plan(self, n_steps, pause_before=(), step_seconds=None):
+        """
+        n_steps: steps in the whole run
+        pause_before: indices of the steps the robot pauses before
+        step_seconds: expected seconds per step, used until some steps are
+            done
+        """
+        self.n_steps = n_steps
+        self.pause_before = sorted(pause_before)
+        self.step_seconds = step_seconds
+
+    def step_done(self, n_steps=1, phase=None, seconds=None):
+        """
+        Report n_steps more steps done, in seconds of robot time
+        """
+        self.steps_done += n_steps
+        if seconds is not None:
+            self.active_seconds += seconds
+        if phase is not None:
+            self.phase = phase
+        self.updated = time.time()
+        for listener in self.listeners:
+            listener.step_done(n_steps, phase, seconds)
+
+    def set_tips_left(self, tips_left):
+        """
+        tips_left: dict {rack or pipette: tips left}
+        """
+        self.tips_left = dict(tips_left)
+
+    def seconds_per_step(self):
+        if self.steps_done > 0 and self.active_seconds > 0:
+            return self.active_seconds / self.steps_done
+        return self.step_seconds
+
+    def snapshot(self):
+        """
+        Return the progress as a dict
+        """
+        steps_done = self.steps_done
+        per_step = self.seconds_per_step()
+        steps_left = max(self.n_steps - steps_done, 0)
+        next_pause = [s for s in self.pause_before if s >= steps_done]
+        out = {
+            'phase': self.phase,
+            'step': steps_done,
+            'n_steps': self.n_steps,
+            'percent': (100.0 * steps_done / self.n_steps
+                        if self.n_steps else None),
+            'tips_left': self.tips_left,
+            'seconds_to_pause': None,
+            'eta_seconds': None,
+            'elapsed_seconds': time.time() - self.started,
+            'seconds_since_update': time.time() - self.updated,
+            }
+        if per_step is not None:
+            out['eta_seconds'] = steps_left * per_step
+            if next_pause:
+                steps_to_pause = next_pause[0] - steps_done
+                out['seconds_to_pause'] = steps_to_pause * per_step
+        return out
+
+    def start(self):
+        """
+        Serve the snapshot on http://host:port/status, in a daemon thread,
+        reusing the server of this process on host:port if there is one
+        """
+        key = (self.host, self.port)
+        if key not in _SERVERS:
+            server = HTTPServer(key, _Handler)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            _SERVERS[key] = server
+        self._server = _SERVERS[key]
+        self._server.telemetry = self
+        return self
+
+    def stop(self):
+        """
+        Shut the server down, if it still serves this telemetry
+        """
+        server = self._server
+        self._server = None
+        if server is None or getattr(server, 'telemetry', None) is not self:
+            return
+        _SERVERS.pop((self.host, self.port), None)
+        server.shutdown()
+        server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    GET /status, and POST to the post_handlers of server.telemetry
+    """
+
+    def _send_json(self, out):
+        body = json.dumps(out).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/status'):
+            self.send_error(404)
+            return
+        self._send_json(self.server.telemetry.snapshot())
+
+    def do_POST(self):
+        telemetry = self.server.telemetry
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        token = query.pop('token', '')
+        if not hmac.compare_digest(token, telemetry.token):
+            self.send_error(403, 'wrong or missing token')
+            return
+        handler = telemetry.post_handlers.get(url.path.rstrip('/'))
+        if handler is None:
+            self.send_error(404)
+            return
+        try:
+            out = handler(query)
+        except (KeyError, ValueError) as err:
+            self.send_error(400, str(err))
+            return
+        self._send_json(out)
+
+    def log_message(self, *args):
+        # keep the protocol output clean
+        pass
+
+
+def fetch_status(host='127.0.0.1', port=TELEMETRY_PORT, timeout=5):
+    """
+    Return the status served by a Telemetry, as a dict
+    """
+    url = 'http://{}:{}/status'.format(host, port)
+    with urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def post_action(
+        path, params=None, token='', host='127.0.0.1', port=TELEMETRY_PORT,
+        timeout=5):
+    """
+    POST to one of the post_handlers of a Telemetry, return its answer
+    """
+    params = dict(params or {}, token=token)
+    url = 'http://{}:{}{}?{}'.format(host, port, path, urlencode(params))
+    with urlopen(Request(url, data=b'', method='POST'),
+                 timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def format_status(status):
+    def _minutes(seconds):
+        return '?' if seconds is None else '{:.0f} min'.format(seconds / 60)
+    percent = status['percent']
+    return '{} step {}/{} ({}) ETA {}, next pause in {}, tips left {}'.format(
+        status['phase'], status['step'], status['n_steps'],
+        '?' if percent is None else '{:.0f}%'.format(percent),
+        _minutes(status['eta_seconds']),
+        _minutes(status['seconds_to_pause']),
+        status['tips_left'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch the progress of a run')
+    parser.add_argument('action', choices=['watch'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=TELEMETRY_PORT)
+    parser.add_argument('--every', type=float, default=10, help='seconds')
+    args = parser.parse_args()
+    while True:
+        print(format_status(fetch_status(args.host, args.port)))
+        time.sleep(args.every)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tip inventory, persisted across runs.
+
+The state is a json file with one entry per physical tip rack:
+
+    {'p10_rack_03': {'used': ['A1', 'B1', ...],
+                     'audited': '20261019_101500',
+                     'updated': '20261019_113000'}}
+
+Racks are identified by whatever is written on them (rack_id), not by slot,
+as the same rack moves around the deck between runs.
+Tips are used column by column, A1 to H1 then A2 to H2 etc, like the robot
+does, so a rack state is fully described by the set of used wells.
+"""
+
+import os
+import re
+import json
+import datetime
+
+TIP_STATE_FILE = '/data/user_storage/opentrons_data/tip_state.json'
+
+TIPRACK_ROWS = 'ABCDEFGH'
+TIPRACK_WELLS = [
+    row + str(col) for col in range(1, 13) for row in TIPRACK_ROWS]
+
+# e.g. 'Picking up tip well A1 in "5"' or 'Picking up tip wells A1...H1 in "3"'
+PICK_UP_REGEX = re.compile(
+    r'Picking up tip (wells?) ([A-H]\d{1,2})(?:\S*)? in "(\d+)"')
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def load_tip_state(path=TIP_STATE_FILE):
+    """
+    Return the tip state dict, empty if the file does not exist yet
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as fid:
+        return json.load(fid)
+
+
+def save_tip_state(state, path=TIP_STATE_FILE):
+    """
+    Write the tip state to file. Write to a temporary file first and then
+    rename it, so a crash halfway never leaves a corrupted state behind.
+    """
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fid:
+        json.dump(state, fid, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def get_rack(state, rack_id):
+    """
+    Return the entry of a rack, creating a full rack if unknown
+    """
+    if rack_id not in state:
+        state[rack_id] = {'used': [], 'audited': None, 'updated': _now()}
+    return state[rack_id]
+
+
+def reset_rack(state, rack_id):
+    """
+    Mark a rack as full, e.g. after refilling it
+    """
+    state[rack_id] = {'used': [], 'audited': None, 'updated': _now()}
+    return state[rack_id]
+
+
+def mark_tips_used(state, rack_id, wells):
+    """
+    Add wells to the used tips of a rack
+    """
+    rack = get_rack(state, rack_id)
+    used = set(rack['used']) | set(wells)
+    rack['used'] = [w for w in TIPRACK_WELLS if w in used]
+    rack['updated'] = _now()
+    return rack
+
+
+def available_tips(state, rack_id, n_channels=1):
+    """
+    Return the list of tip positions a pipette with n_channels can pick up
+    from, in the order the robot would use them.
+    For a multichannel that's the top well of the fully available columns.
+    """
+    used = set(get_rack(state, rack_id)['used'])
+    if n_channels == 1:
+        return [w for w in TIPRACK_WELLS if w not in used]
+    out = []
+    for col in range(1, 13):
+        column = [row + str(col) for row in TIPRACK_ROWS[:n_channels]]
+        if not used.intersection(column):
+            out.append(column[0])
+    return out
+
+
+def first_available_tip(state, rack_id, n_channels=1):
+    """
+    Return the first tip position available in a rack, None if empty
+    """
+    tips = available_tips(state, rack_id, n_channels)
+    return tips[0] if tips else None
+
+
+def tips_left(state, rack_id, n_channels=1):
+    """
+    Return how many pick ups are left in a rack for a pipette
+    """
+    return len(available_tips(state, rack_id, n_channels))
+
+
+def picked_up_tips(commands):
+    """
+    Parse robot.commands() and return a list of (slot, [wells]) with the tips
+    that were picked up. Multichannel pick ups are expanded to the whole
+    column.
+    """
+    out = []
+    for command in commands:
+        match = PICK_UP_REGEX.search(command)
+        if match is None:
+            continue
+        well_or_wells, first_well, slot = match.groups()
+        if well_or_wells == 'wells':
+            col = first_well[1:]
+            row = TIPRACK_ROWS.index(first_well[0])
+            wells = [r + col for r in TIPRACK_ROWS[row:]]
+        else:
+            wells = [first_well]
+        out.append((slot, wells))
+    return out
+
+
+def update_from_commands(state, commands, rack_ids_by_slot):
+    """
+    Mark as used all tips picked up in robot.commands().
+    rack_ids_by_slot: dict {slot: rack_id} of the racks on the deck.
+    Slots not in the dict (e.g. tipracks handled by hand) are ignored.
+    """
+    for slot, wells in picked_up_tips(commands):
+        if slot in rack_ids_by_slot:
+            mark_tips_used(state, rack_ids_by_slot[slot], wells)
+    return state
+
+
+def start_at_first_available(pipette, tipracks, rack_ids, state):
+    """
+    Tell the pipette to start from the first available tip, looking through
+    the racks in order. Return (rack_id, tip position) or None if all the
+    racks are empty.
+    tipracks and rack_ids are lists in the same order as the pipette's
+    tip_racks.
+    """
+    n_channels = 8 if pipette.type == 'multi' else 1
+    for tiprack, rack_id in zip(tipracks, rack_ids):
+        tip = first_available_tip(state, rack_id, n_channels)
+        if tip is None:
+            continue
+        if n_channels == 1:
+            pipette.start_at_tip(tiprack.wells(tip))
+        else:
+            pipette.start_at_tip(tiprack.cols(tip[1:]))
+        print('TIP STATE: starting from {} in rack {}'.format(tip, rack_id))
+        return rack_id, tip
+    print('TIP STATE: all racks are empty')
+    return None
+
+
+def reachable_tips(state, rack_ids, n_channels=1):
+    """
+    Return how many pick ups the robot can make across several racks before
+    reaching a used tip. APIv1 starts at the given tip of the first rack
+    that has one (as start_at_first_available does), goes on in order to
+    the end of that rack and then into the next racks from A1, whether the
+    tips there are used or not: tips after the first used one do not count.
+    rack_ids: in the same order as the pipette's tip_racks.
+    """
+    if n_channels == 1:
+        positions = TIPRACK_WELLS
+    else:
+        positions = [TIPRACK_ROWS[0] + str(col) for col in range(1, 13)]
+    n_reachable = 0
+    is_started = False
+    for rack_id in rack_ids:
+        available = available_tips(state, rack_id, n_channels)
+        if not is_started:
+            if not available:
+                continue
+            start = positions.index(available[0])
+            is_started = True
+        else:
+            start = 0
+        available = set(available)
+        for position in positions[start:]:
+            if position not in available:
+                return n_reachable
+            n_reachable += 1
+    return n_reachable
+
+
+def checkpoint_tip_state(
+        state, commands, rack_ids_by_slot, n_seen=0, path=TIP_STATE_FILE):
+    """
+    Update the state with the commands issued since the last checkpoint and
+    save it, so that the next run knows where to start from even if this one
+    is stopped halfway.
+    Return the number of commands seen so far, to pass to the next call:
+
+        n_seen = checkpoint_tip_state(state, robot.commands(), racks, n_seen)
+    """
+    commands = list(commands)
+    update_from_commands(state, commands[n_seen:], rack_ids_by_slot)
+    if path is not None:
+        save_tip_state(state, path)
+    return len(commands)
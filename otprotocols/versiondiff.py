@@ -0,0 +1,134 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Compare two versions of a protocol, phase by phase.
+
+    python -m otprotocols.versiondiff prestwick_library_serial_dilution.py \
+        prestwick_library_serial_dilution_faster.py
+
+Both are simulated (through otprotocols.simcache) and their command streams
+split into phases by what the pipette moves from where to where: every
+transfer is labelled by its source and destination slots (e.g. '11 -> 10',
+trough to library plate), and pauses are a phase of their own. Phases with
+the same label are added up, so they line up across versions even if the
+order changed. For each phase it reports tips, aspirations, travel (mm, from
+the well positions in otprotocols.deck) and estimated seconds (command times
+plus travel at the gantry speed, see otprotocols.simcache.estimate_seconds).
+
+If the name of the second version claims to be faster, and it is not, the
+tool says so and exits with an error.
+"""
+
+import os
+import sys
+import argparse
+
+from otprotocols.deck import GANTRY_SPEED
+from otprotocols.simcache import (
+    estimate_seconds, cached_simulate, travel_mm, LOCATION_REGEX,
+    HEADER_PREFIXES)
+
+PAUSE_PREFIX = 'Pausing'
+
+
+def split_phases(commands):
+    """
+    Return a dict {phase label: [commands]}, labels in order of appearance.
+    Tip pick ups go with the transfer that follows them, if one does.
+    """
+    phases = {}
+    label = 'start'
+    pending = []
+    for command in commands:
+        if command.startswith('Picking up tip'):
+            pending.append(command)
+            continue
+        if command.startswith(HEADER_PREFIXES):
+            slots = [slot for _, slot in LOCATION_REGEX.findall(command)]
+            if slots:
+                label = '{} -> {}'.format(slots[0], slots[-1])
+        elif command.startswith(PAUSE_PREFIX):
+            phases.setdefault(label, []).extend(pending)
+            pending = []
+            phases.setdefault('pause', []).append(command)
+            continue
+        phases.setdefault(label, []).extend(pending + [command])
+        pending = []
+    if pending:
+        phases.setdefault(label, []).extend(pending)
+    return phases
+
+
+def phase_metrics(commands, speed=GANTRY_SPEED):
+    """
+    Return a dict of tips, aspirations, travel_mm and seconds of a list of
+    commands
+    """
+    n_tips = 0
+    for command in commands:
+        if command.startswith('Picking up tip wells'):
+            n_tips += 8
+        elif command.startswith('Picking up tip'):
+            n_tips += 1
+    return {
+        'tips': n_tips,
+        'aspirations': sum(c.startswith('Aspirating') for c in commands),
+        'travel_mm': travel_mm(commands),
+        'seconds': estimate_seconds(commands, speed=speed),
+        }
+
+
+def compare_versions(commands_a, commands_b):
+    """
+    Return a list of (phase, metrics a, metrics b), plus a 'total' row
+    """
+    phases_a = split_phases(commands_a)
+    phases_b = split_phases(commands_b)
+    labels = list(phases_a) + [p for p in phases_b if p not in phases_a]
+    rows = [
+        (label, phase_metrics(phases_a.get(label, [])),
+         phase_metrics(phases_b.get(label, [])))
+        for label in labels]
+    rows.append(
+        ('total', phase_metrics(commands_a), phase_metrics(commands_b)))
+    return rows
+
+
+def print_comparison(rows, name_a='a', name_b='b'):
+    print('{} vs {}'.format(name_a, name_b))
+    print('{:<12} {:>14} {:>14} {:>16} {:>16}'.format(
+        'phase', 'tips', 'aspirations', 'travel (m)', 'time (min)'))
+    for label, a, b in rows:
+        print('{:<12} {:>14} {:>14} {:>16} {:>16}'.format(
+            label,
+            '{}->{}'.format(a['tips'], b['tips']),
+            '{}->{}'.format(a['aspirations'], b['aspirations']),
+            '{:.1f}->{:.1f}'.format(
+                a['travel_mm'] / 1000, b['travel_mm'] / 1000),
+            '{:.1f}->{:.1f}'.format(a['seconds'] / 60, b['seconds'] / 60)))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare tips, aspirations, travel and time of two '
+                    'versions of a protocol, phase by phase')
+    parser.add_argument('protocol_a')
+    parser.add_argument('protocol_b')
+    args = parser.parse_args()
+
+    entry_a, _ = cached_simulate(args.protocol_a)
+    entry_b, _ = cached_simulate(args.protocol_b)
+    rows = compare_versions(entry_a['commands'], entry_b['commands'])
+    print_comparison(rows, args.protocol_a, args.protocol_b)
+    _, total_a, total_b = rows[-1]
+    claims_faster = ('faster' in os.path.basename(args.protocol_b)
+                     and 'faster' not in os.path.basename(args.protocol_a))
+    if claims_faster and total_b['seconds'] >= total_a['seconds']:
+        print('WARNING: {} is not faster than {}'.format(
+            args.protocol_b, args.protocol_a))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,22 +2,32 @@
 @author lferiani
 @date Nov 4th, 2020
 
-Both pipettes: a p10 single and a p50 single
+Both pipettes: a p10 single and a p50 multi (or single)
 
 Small protocol that deals with one plate at a time
 Start with library 96WPs, with drugs in every third well, starting with 45ul
 
-First step is to put control in row H:
-Water in H4:H7
-DMSO in H8:H12
+First step is to put the controls in control_row:
+water and DMSO, in blocks (or interleaved, see control wells below)
+
+Then put solvent in the two wells to the right of each high concentration
+drug, for the whole plate at once (together with the controls)
 
 For each well starting with high concentration drug,
-    add solvent to the two wells to its right
     serially dilute
 
+With a p50 single (the default) the whole pre-fill is single channel, one tip
+per liquid. With a p50 multichannel, columns that need the same liquid in
+every well are filled with one multichannel dispense, and the p10 single does
+the rest, control row included. That only pays off with the controls
+interleaved (water in the high concentration columns, 7 of the 8 solvent
+columns uniform), which moves the controls: with the controls in blocks the
+p10 fills 3 solvent columns and the multi is slower than the p50 single, so
+the protocol warns
+
 
-Tip rack for p10 single (to change) in 5
-Tip rack for p50 single (to change) in 8
+Tip racks for p10 single in 5, 2
+Tip rack for p50 multi (or single) in 8
 Trough for water and DMSO in 9
 Library 96WPs in 6
 
@@ -25,26 +35,50 @@ Library 96WPs in 6
 
 Each protocol shohuld use fewer tips than in two tipracks
 
+Tip racks do not need to be full: which tips are left in each physical rack is
+read from /data/user_storage/opentrons_data/tip_state.json and kept up to date
+during the run, so the next plate starts where this one stopped.
+Just write the rack ids on the racks, and list refilled racks in new_racks.
+
 """
-import pdb
+import datetime
 import numpy as np
 from opentrons import labware, instruments, robot
+from otprotocols.tipstate import (
+    TIP_STATE_FILE, load_tip_state, reset_rack, start_at_first_available,
+    reachable_tips, checkpoint_tip_state)
+from otprotocols.plan import execute_plan, count_plan_tips
+from otprotocols.microops import execute_plan_ops
+from otprotocols.arcs import loaded_heights
+from otprotocols.runlogs import write_runlog
+from otprotocols.prefill import (
+    PRESTWICK_CONTROLS, serial_dilution_layout, prefill_plan,
+    estimate_fill_seconds)
+from otprotocols.dilution import (
+    dilution_chain_plan, carryover_error, tip_mode_report)
+from otprotocols.doseresponse import design_dilutions
+
+# start time of the run, for the runlog
+run_started = datetime.datetime.now()
 
 ####################### user intuitive parameters
 
 # single channel pipette parameters and tipracks for drugs dilution
 drugs_pipette_type = 'p10-Single'
 drugs_pipette_mount = 'left'
-tiprack_drugs_slots = ['5']
+tiprack_drugs_slots = ['5', '2']
+tiprack_drugs_ids = ['p10_rack_01', 'p10_rack_02']  # written on the racks
 tiprack_drugs_type = 'opentrons-tiprack-10ul'
-tiprack_drugs_startfrom = '1'
 
-# single channel pipette parameters and tipracks
-solvent_pipette_type = 'p50-Single'
+# pipette parameters and tipracks for solvent and controls
+solvent_pipette_type = 'p50-Single'  # or 'p50-Multi'
 solvent_pipette_mount = 'right'
 tiprack_solvent_slots = ['8']
+tiprack_solvent_ids = ['p300_rack_01']  # written on the racks
 tiprack_solvent_type = 'opentrons-tiprack-300ul'
-tiprack_solvent_startfrom = '1'
+
+# ids of the racks that have just been refilled, e.g. ['p10_rack_02']
+new_racks = []
 
 # trough
 trough_slot = '9'
@@ -59,13 +93,43 @@ library_frombottom_off = +1 # mm from bottom of library wells
 
 # volumes
 control_volume = 40  # volume in H4:H12
-solvent_volume = 36  # volume of solvent in dilution wells
-drugs_volume_for_dilution = 4  # volume of drug (or diluted drug) to transfer
-
-# control wells
+dilution_factor = 10  # between consecutive doses
+dilution_well_volume = 40  # volume in a dilution well, drug and solvent
+# volume of solvent in dilution wells (36), and of drug (or diluted drug) to
+# transfer (4)
+dose_design = design_dilutions(
+    1, [1, 1 / dilution_factor, 1 / dilution_factor ** 2],
+    dilution_well_volume, in_place=True)
+solvent_volume = float(dose_design['solvent'][0, 1])
+drugs_volume_for_dilution = float(dose_design['transfer'][0, 1])
+
+# 'always' uses a new tip for each step, as this protocol always did. 'series'
+# does a whole high->mid->low chain with one tip, as liquid only moves towards
+# lower concentrations; its carry-over estimate rests on assumed, unmeasured
+# constants (see otprotocols.dilution.carryover_error)
+dilution_tip_mode = 'always'
+pre_rinse_cycles = 0  # extra mixing in the mid well before aspirating from it
+# False: transfer(), as this protocol always did. True: run the dilutions as
+# bare aspirate/dispense/mix, blowing out at the top of the well instead of
+# going to the trash like transfer() does. Not tried on the robot yet
+# (python -m otprotocols.microops bench for the time saved)
+dilution_micro_ops = False
+# True: with dilution_micro_ops, move between labware through arcs only as
+# high as the loaded labware under the way needs (otprotocols.arcs), instead
+# of above the tallest labware on the deck. Not tried on the robot yet
+low_arcs = False
+
+# control wells: 'blocks' has DMSO in 4:8 and water in 9:12, as all the
+# plates of the campaign. 'interleaved' has water in 4, 7, 10, 12 and DMSO in
+# 5, 6, 8, 9, 11, so that all the solvent columns but 12 are DMSO in every row
+# and a p50 multi fills them, but the plates no longer match the blocks ones
+# (python -m otprotocols.prefill bench)
 control_row = 'A'
-DMSO_wells = [control_row + col for col in ['4', '5', '6', '7', '8']]
-H2O_wells = [control_row + col for col in ['9', '10', '11', '12']]
+control_layout = 'blocks'
+DMSO_wells = [control_row + col
+              for col in PRESTWICK_CONTROLS[control_layout]['DMSO']]
+H2O_wells = [control_row + col
+             for col in PRESTWICK_CONTROLS[control_layout]['water']]
 
 # we dilute across 2 times so we always have 3 doses
 # wells with the high concentration of drugs are only every 3rd column,
@@ -78,6 +142,61 @@ drug_wells = [[w for w in r if w not in (DMSO_wells + H2O_wells)]
               for r in drug_wells]
 assert len([w for r in drug_wells for w in r]) == 8+7*3
 
+# what each well needs before the dilutions: solvent and controls
+prefill_volumes, prefill_liquids, prefill_is_control = serial_dilution_layout(
+    [w for r in drug_wells for w in r],
+    {'DMSO': DMSO_wells, 'water': H2O_wells},
+    solvent_volume, control_volume)
+trough_wells = {'DMSO': DMSO_source_well, 'water': H2O_source_well}
+# plate-wide pre-fill: one tip (set) per liquid. Controls get a blow out,
+# the solvent in the dilution wells does not (as when it was filled by row)
+prefill_kwargs = dict(
+    options={'blow_out': False, 'new_tip': 'once'},
+    blow_out=prefill_is_control)
+if solvent_pipette_type == 'p50-Multi':
+    solvent_prefill_plan = prefill_plan(
+        prefill_volumes, prefill_liquids, library_slot, trough_slot,
+        trough_wells, multi='solvent', single='drugs', **prefill_kwargs)
+else:
+    solvent_prefill_plan = prefill_plan(
+        prefill_volumes, prefill_liquids, library_slot, trough_slot,
+        trough_wells, multi=None, single='solvent', **prefill_kwargs)
+prefill_tips = count_plan_tips(solvent_prefill_plan)
+prefill_seconds = estimate_fill_seconds(
+    solvent_prefill_plan, {'solvent': 50, 'drugs': 10})
+print('PRE-FILL: about {:.0f} s'.format(prefill_seconds))
+if solvent_pipette_type == 'p50-Multi':
+    # the p10 fills the columns the multi cannot: check it still pays off
+    single_prefill_seconds = estimate_fill_seconds(
+        prefill_plan(
+            prefill_volumes, prefill_liquids, library_slot, trough_slot,
+            trough_wells, multi=None, single='solvent', **prefill_kwargs),
+        {'solvent': 50})
+    if single_prefill_seconds < prefill_seconds:
+        print('WARNING: with control_layout {!r} the p50-Multi pre-fill '
+              '(about {:.0f} s) is slower than a p50-Single one ({:.0f} s)'
+              .format(control_layout, prefill_seconds,
+                      single_prefill_seconds))
+
+# tips needed: 1 or 2 per drug for dilution (depends on dilution_tip_mode),
+# plus what the pre-fill needs
+n_drugs = len([w for r in drug_wells for w in r])
+dilution_tips_report = tip_mode_report(n_drugs, 2)
+if dilution_tip_mode == 'series':
+    n_drugs_tips_needed = dilution_tips_report['tips_series']
+    print('DILUTION CARRY-OVER: mid and low wells {} more concentrated'.format(
+        carryover_error(
+            [drugs_volume_for_dilution]*2,
+            [solvent_volume + drugs_volume_for_dilution]*2,
+            pre_rinse_cycles=pre_rinse_cycles)))
+else:
+    n_drugs_tips_needed = dilution_tips_report['tips_always']
+n_drugs_tips_needed += prefill_tips.get('drugs', 0)
+# counted in pick ups, so a multichannel needs one column per tip set
+n_solvent_tips_needed = prefill_tips.get('solvent', 0)
+if solvent_pipette_type == 'p50-Multi':
+    n_solvent_tips_needed //= 8
+
 ############################# define custom multiwell plates
 
 if '48-well-plate-sarsted' not in labware.list():
@@ -137,25 +256,54 @@ if drugs_pipette_type == 'p10-Single': # this is mostly a check
         mount=drugs_pipette_mount,
         tip_racks=tiprackdrugs
         )
-pipette_drugs.start_at_tip(tiprackdrugs[0].well(tiprack_drugs_startfrom))
 pipette_drugs.plunger_positions['drop_tip'] = -6
 
 
-# single channel
+# single or multi channel
+tipracksolvent = [
+    labware.load(tiprack_solvent_type, tiprack_slot)
+    for tiprack_slot in tiprack_solvent_slots
+    ]
 if solvent_pipette_type == 'p50-Single': # this is mostly a type check
-    tipracksolvent = [
-        labware.load(tiprack_solvent_type, tiprack_slot)
-        for tiprack_slot in tiprack_solvent_slots
-        ]
     pipette_solvent = instruments.P50_Single(
         mount=solvent_pipette_mount,
         tip_racks=tipracksolvent
         )
-pipette_solvent.start_at_tip(tipracksolvent[0].well(tiprack_solvent_startfrom))
+elif solvent_pipette_type == 'p50-Multi':
+    pipette_solvent = instruments.P50_Multi(
+        mount=solvent_pipette_mount,
+        tip_racks=tipracksolvent
+        )
 pipette_solvent.plunger_positions['drop_tip'] = -6
-# pdb.set_trace()
 
 
+# start from the first available tip of (possibly partial) tipracks
+tip_state = load_tip_state()
+for rack_id in new_racks:
+    reset_rack(tip_state, rack_id)
+rack_ids_by_slot = dict(
+    zip(tiprack_drugs_slots + tiprack_solvent_slots,
+        tiprack_drugs_ids + tiprack_solvent_ids))
+start_at_first_available(
+    pipette_drugs, tiprackdrugs, tiprack_drugs_ids, tip_state)
+start_at_first_available(
+    pipette_solvent, tipracksolvent, tiprack_solvent_ids, tip_state)
+# check there are enough tips for the whole plate before starting
+for rack_ids, n_needed, n_channels in [
+        (tiprack_drugs_ids, n_drugs_tips_needed, 1),
+        (tiprack_solvent_ids, n_solvent_tips_needed,
+         8 if solvent_pipette_type == 'p50-Multi' else 1)]:
+    # only the tips the robot reaches in order, before a used one
+    n_left = reachable_tips(tip_state, rack_ids, n_channels)
+    print('TIP STATE: {} tips reachable in {}, {} needed'.format(
+        n_left, rack_ids, n_needed))
+    assert n_left >= n_needed, (
+        'Not enough tips in {}, refill a rack and add it to new_racks'.format(
+            rack_ids))
+# only write the tip state file when running for real
+tip_state_path = None if robot.is_simulating() else TIP_STATE_FILE
+n_commands_seen = 0
+
 # container for controls
 ctrl_src_container = labware.load(trough_type, trough_slot)
 dmso_src_well = ctrl_src_container.wells(DMSO_source_well)
@@ -164,6 +312,9 @@ water_src_well = ctrl_src_container.wells(H2O_source_well)
 # define library plate
 lib_plate = labware.load(library_type, library_slot)
 
+# heights of the loaded labware, for low arcs between wells
+deck_heights = loaded_heights(robot) if low_arcs else None
+
 # define destination for controls:
 dmso_dst_wells = lib_plate.wells(*[DMSO_wells])
 water_dst_wells = lib_plate.wells(*[H2O_wells])
@@ -172,7 +323,6 @@ water_dst_wells = lib_plate.wells(*[H2O_wells])
 all_high_conc_drugs_wells = [lib_plate.wells(*[drug_wells_in_row])
                              for drug_wells_in_row in drug_wells]
 
-# pdb.set_trace()
 ################### functions
 
 # stupid function to measure how many tips got used
@@ -193,24 +343,6 @@ def count_used_tips(is_print=True):
         print('TIP COUNT: Single = {}, Multi = {}'.format(stc, mtc))
     return stc, mtc
 
-def get_well_to_the_right_of(well):
-    """
-    Return the well (object) to the right of the input well (object)
-    """
-    plate = well.get_parent()
-    well_name = well.get_name()
-    # create name for next well, checking for out of bounds
-    row_name = well_name[0]
-    col_number = int(well_name[1:])
-    next_col_number = col_number + 1
-    assert next_col_number <= len(plate.cols()), (
-        "Next well's column would be out of bounds"
-    )
-    next_well_name = row_name + str(col_number + 1)
-    # make the well object
-    next_well = plate.wells(next_well_name)
-    return next_well
-
 def my_get_path(well_or_wellseries):
     """
     Return slot on the robot deck, and position in the plate, of an input object
@@ -219,89 +351,26 @@ def my_get_path(well_or_wellseries):
     return (slot, pos)
 
 
-def dispense_controls():
-
-    pipette_solvent.transfer(
-        control_volume,
-        dmso_src_well,
-        dmso_dst_wells,
-        blow_out=True,
-        new_tip='once'
-        )
-    pipette_solvent.transfer(
-        control_volume,
-        water_src_well,
-        water_dst_wells,
-        blow_out=True,
-        new_tip='once'
-        )
-
-    return
-
-def put_solvent_in_row(high_wells):
-    wells_for_solvent = []
-    for high_well in high_wells:
-        # get the two wells we need to dilute in
-        middle_well = get_well_to_the_right_of(high_well)
-        low_well = get_well_to_the_right_of(middle_well)
-        wells_for_solvent.append(middle_well)
-        wells_for_solvent.append(low_well)
-    # now dispense
-    pipette_solvent.transfer(
-        solvent_volume,
-        dmso_src_well,
-        wells_for_solvent,
-        blow_out=False,
-        new_tip='once'
-        )
-    return
-
 def serially_dilute_well_drugonly(high_well):
-    # get the two wells we need to dilute in
-    middle_well = get_well_to_the_right_of(high_well)
-    low_well = get_well_to_the_right_of(middle_well)
-
-    # and do the dilution
-    pipette_drugs.transfer(
-        drugs_volume_for_dilution,
-        [high_well, middle_well],
-        [middle_well, low_well],
-        blow_out=True,
+    # dilute into the two wells to the right, one or two tips
+    dilution_plan = dilution_chain_plan(
+        library_slot,
+        high_well.get_name(),
+        [drugs_volume_for_dilution] * 2,
+        tip_mode=dilution_tip_mode,
+        pre_rinse_cycles=pre_rinse_cycles,
         mix_before=(2, 10), # mix 2x with 10 uL before
         mix_after=(2, 10), # mix 2x with 10 uL after
-        touch=True,
-        new_tip='always'
-    )
-
-
-def serially_dilute_well(high_well):
-    # get the two wells we need to dilute in
-    middle_well = get_well_to_the_right_of(high_well)
-    low_well = get_well_to_the_right_of(middle_well)
-
-    # now dispense all the dmso first
-    pipette_solvent.transfer(
-        solvent_volume,
-        dmso_src_well,
-        [middle_well, low_well],
         blow_out=True,
-        new_tip='once'
-        )
-
-    # and do the dilution
-    pipette_drugs.transfer(
-        drugs_volume_for_dilution,
-        [high_well, middle_well],
-        [middle_well, low_well],
-        blow_out=True,
-        mix_before=(2, 10), # mix 2x with 10 uL before
-        mix_after=(2, 10), # mix 2x with 10 uL after
         touch=True,
-        new_tip='always'
-    )
-
-    return
-
+        )
+    if dilution_micro_ops:
+        execute_plan_ops(
+            dilution_plan, {'drugs': pipette_drugs}, {library_slot: lib_plate},
+            heights=deck_heights)
+    else:
+        execute_plan(
+            dilution_plan, {'drugs': pipette_drugs}, {library_slot: lib_plate})
 
 
 ################### actions
@@ -310,31 +379,38 @@ def serially_dilute_well(high_well):
 pipette_solvent.drop_tip()
 pipette_drugs.drop_tip()
 
-# controls
-dispense_controls()
+# controls and solvent, whole plate
+execute_plan(
+    solvent_prefill_plan,
+    {'solvent': pipette_solvent, 'drugs': pipette_drugs},
+    {library_slot: lib_plate, trough_slot: ctrl_src_container})
 count_used_tips()
+n_commands_seen = checkpoint_tip_state(
+    tip_state, robot.commands(), rack_ids_by_slot,
+    n_seen=n_commands_seen, path=tip_state_path)
 
 # dilute
 for high_conc_drugs_wells in all_high_conc_drugs_wells:
     # deal with one row being a well and not a wellseries
     if len(high_conc_drugs_wells) == 0:
         high_conc_drugs_wells = [high_conc_drugs_wells]
-    put_solvent_in_row(high_conc_drugs_wells)
     for well in high_conc_drugs_wells:
         serially_dilute_well_drugonly(well)
+    # save tip state after each row
+    n_commands_seen = checkpoint_tip_state(
+        tip_state, robot.commands(), rack_ids_by_slot,
+        n_seen=n_commands_seen, path=tip_state_path)
 
 # tips used:
-# 2 tips for controls
-# 1 tip for each row to put solvent => 28 tips
-# 2 tips per drug to dilute => 58 tips
-# total is 68 tips (58 10ul tips and 10 200ul tips)
+# 2 tips of the p50 single for the pre-fill (one per liquid)
+# 2 tips per drug to dilute => 58 tips (29 in series mode)
+# total is 58 10ul tips and 2 200ul tips
+# (with the p50 multi: 1 column of 200ul tips for the multichannel columns,
+# and 2 more 10ul tips for the rest of the pre-fill)
 count_used_tips()
 
-#write out robot commands
+#write out robot commands, with the start time for the ETA model
 if not robot.is_simulating():
-    import datetime
-    out_fname = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")+'_runlog.txt'
-    out_fname = '/data/user_storage/opentrons_data/protocols_logs/' + out_fname
-    with open(out_fname,'w') as fid:
-        for command in robot.commands():
-            print(command,file=fid)
+    write_runlog(
+        robot.commands(), 'prestwick_library_serial_dilution',
+        started=run_started)
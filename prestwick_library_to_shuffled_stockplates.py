@@ -16,10 +16,25 @@ Times 3 (number of shufflings)
 Notation:
     Source = library
     Destination = stock
+
+The plate maps (which library well ended up where) are written as csv in
+/data/user_storage/opentrons_data/plate_maps/, from the same plan that the
+robot executes.
 """
 
+import datetime
 import numpy as np
 from opentrons import labware, instruments, robot
+from otprotocols.plan import shuffle_plan, execute_plan, print_plan
+from otprotocols.platemap import PlateMapWriter
+from otprotocols.shuffle import constrained_drugs_mapping
+from otprotocols.runlogs import write_runlog
+from otprotocols.telemetry import Telemetry
+from otprotocols.notify import PauseNotifier, make_notifiers
+from otprotocols.pingpong import split_banks, bank_of, BankSwaps
+
+# start time of the run, for the runlog
+run_started = datetime.datetime.now()
 
 ####################### user intuitive parameters
 
@@ -46,19 +61,30 @@ destination_type = '96-well-plate-pcr-thermofisher'
 
 n_columns = 12
 
+# operator notifications, ahead of (5 min) and at each pause
+notify_webhook_url = None  # e.g. a chat incoming webhook
+notify_email_to = []  # e.g. ['someone@example.com'], via smtp on localhost
+
+# True: don't pause after each plate. The destination slots are split in two
+# banks, the operator takes the plates of a bank away while the robot works
+# on the other one (see otprotocols.pingpong)
+double_buffered = False
+
 # create mapping from sources to destination.
 # it is a dict, with:
 # {(source slot, dest slot):(cols in source, cols in dest)}
-drugs_mapping = {}
+# the 3 shuffles are drawn together so that no library column lands in the
+# same stock column twice, and the 3 doses of a drug (e.g. cols 1, 2, 3) are
+# never next to each other
 seed = int(str(date) + str(plate_number)) # for reproducibility. Let's use the experimental date for the actual experiment and the plate number, something else for debugging
 print(seed)
-np.random.seed(seed)
-src_cols = np.arange(n_columns) # array of column numbers
-for ds in destination_slots:
-    # create entry in dict
-    dst_cols = src_cols.copy() # array of column numbers to be shuffled
-    np.random.shuffle(dst_cols) # shuffle columns in destination. This acts in place!!
-    drugs_mapping[(drugs_source_slot, ds)] = (src_cols, dst_cols)
+compound_groups = np.arange(n_columns) // 3  # high, mid, low dose of a drug
+drugs_mapping = constrained_drugs_mapping(
+    drugs_source_slot,
+    destination_slots,
+    n_columns=n_columns,
+    seed=seed,
+    compound_groups=compound_groups)
 
 # print out drugs_mapping:
 for key, value in drugs_mapping.items():
@@ -90,6 +116,36 @@ sorted_instructions = sorted(instructions_list)
 for instruction in sorted_instructions:
     print(instruction)
 
+# turn the mapping into the plan the robot will execute.
+# when running for real, the plate maps for the imaging analysis are written
+# from this very same plan, while it's built
+transfer_options = {
+    'new_tip': 'always',
+    'mix_before': (3, 10),
+    'blow_out': True,
+    }
+platemap_writer = None
+if not robot.is_simulating():
+    platemap_fname = (
+        datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        + '_prestwick_library_shuffling'
+        + '_plate' + str(plate_number)
+        + '_platemap.csv'
+        )
+    platemap_fname = (
+        '/data/user_storage/opentrons_data/plate_maps/' + platemap_fname)
+    platemap_writer = PlateMapWriter(platemap_fname, plate_name_dict)
+drugs_plan = shuffle_plan(
+    drugs_mapping,
+    drugs_volume,
+    source_offset=frombottom_off,
+    destination_offset=frombottom_off,
+    options=transfer_options,
+    seed=seed,
+    platemap=platemap_writer)
+if platemap_writer is not None:
+    platemap_writer.close()
+
 
 ############################# define custom multiwell plates
 
@@ -123,27 +179,31 @@ pipette_multi.plunger_positions['drop_tip'] = -6
 # faster dispense
 pipette_multi.set_speed(dispense=pipette_multi.speeds['dispense']*4)
 
-# translate the drugs mapping dict in robot language
-# load source plate first
-src_plate = labware.load(drugs_source_type, drugs_source_slot)
-src_wells = [well.bottom(frombottom_off) for well in src_plate.rows('A')]
-wells_mapping = {}
-for key, value in drugs_mapping.items():
-    # unpack slots
-    _src_slot, _dst_slot = key
-    _src_cols, _dst_cols = value
-    # load labware for dst
-    dst_plate = labware.load(destination_type,  _dst_slot)
-    # create list of wells with the right bottom offset
-    # NOT YET FOLLOWING THE ORDER WE WANT
-    dst_wells = [well.bottom(frombottom_off) for well in dst_plate.rows('A')]
-    # these are normal lists though so should be reshufflable
-    src_wells_copy = [src_wells[wi] for wi in _src_cols]
-    dst_wells = [dst_wells[wi] for wi in _dst_cols]
-    # store in wells_mapping
-    wells_mapping[(src_plate, dst_plate)] = (src_wells_copy, dst_wells)
-
-# print(wells_mapping)
+# translate the slots in the plan in robot language
+plates = {drugs_source_slot: labware.load(drugs_source_type, drugs_source_slot)}
+for _dst_slot in destination_slots:
+    plates[_dst_slot] = labware.load(destination_type, _dst_slot)
+
+# live progress, on http://<robot ip>:48889/status during real runs.
+# the robot pauses after each destination plate, unless double buffered
+plate_n_steps = [
+    sum(step['destination'][0] == _dst_slot for step in drugs_plan)
+    for _dst_slot in destination_slots]
+telemetry = Telemetry()
+telemetry.set_plan(
+    len(drugs_plan),
+    pause_before=[] if double_buffered else np.cumsum(plate_n_steps))
+if not robot.is_simulating():
+    telemetry.start()
+    pause_notifier = PauseNotifier(
+        make_notifiers(notify_webhook_url, notify_email_to),
+        telemetry=telemetry)
+else:
+    pause_notifier = PauseNotifier(
+        make_notifiers(), telemetry=telemetry, log_path=None)
+destination_banks = split_banks(destination_slots)
+bank_swaps = BankSwaps(destination_banks, robot, notifier=pause_notifier)
+bank_swaps.attach(telemetry)
 
 ################### actions
 # safety command
@@ -158,46 +218,43 @@ def count_used_tips():
         elif 'Picking up tip well' in c: # note the lack of s in well
             tc+=1
     print('Tips used so far: {}'.format(tc))
-    return
+    return tc
 
 
 count_used_tips() # should be 0
 
-# first put water, then drugs in plates
-for plates_tuple, wells_tuple in wells_mapping.items():
-    # unpack
-    src_plate, dst_plate = plates_tuple
-    src_wells, dst_wells = wells_tuple
-
-    # drug transfer
-    pipette_multi.transfer(
-        drugs_volume,
-        src_wells,
-        dst_wells,
-        new_tip='always',
-        mix_before=(3, 10),
-        blow_out=True)
-
-    for s,d in zip(src_wells, dst_wells):
-        print('{} {} -> {} {}'.format(
-            src_plate.parent, s[0], dst_plate.parent, d[0]))
-
-    count_used_tips()
-    robot.pause()
-    # each time we fill up a 96wp => expecting 96 tips every plate
-    # so 96, 192, 288
-
-
-#write out robot commands
+# one destination plate at a time
+# (the telemetry server lives in the robot server process, stop it after)
+try:
+    for _dst_slot in destination_slots:
+        if double_buffered:
+            bank_swaps.switch_to(bank_of(destination_banks, _dst_slot))
+        plate_plan = [
+            step for step in drugs_plan
+            if step['destination'][0] == _dst_slot]
+
+        # drug transfer
+        execute_plan(
+            plate_plan, {'multi': pipette_multi}, plates, telemetry=telemetry)
+        print_plan(plate_plan)
+
+        tips_used = count_used_tips()
+        telemetry.set_tips_left(
+            {'multi': 96 * len(tiprackdrugs) - tips_used})
+        if not double_buffered:
+            pause_notifier.pause(
+                robot, 'Plate in slot {} done, swap it'.format(_dst_slot))
+        # each time we fill up a 96wp => expecting 96 tips every plate
+        # so 96, 192, 288
+    if double_buffered:
+        bank_swaps.release(bank_swaps.in_use)
+finally:
+    telemetry.stop()
+
+
+#write out robot commands, with the start time for the ETA model
 if not robot.is_simulating():
-    import datetime
-    out_fname = (
-        datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        + '_prestwick_library_shuffling'
-        + '_plate' + str(plate_number)
-        + '_runlog.txt'
-        )
-    out_fname = '/data/user_storage/opentrons_data/protocols_logs/' + out_fname
-    with open(out_fname,'w') as fid:
-        for command in robot.commands():
-            print(command,file=fid)
+    write_runlog(
+        robot.commands(),
+        'prestwick_library_shuffling_plate' + str(plate_number),
+        started=run_started)
@@ -14,10 +14,14 @@ Tip rack for single (to change) in 3
 Library 96WPs in 1, 4, 7, 10, 6
 Stock 96WPs in 2, 5, 8, 11, 9
 
+The library plates are identical, so each stock well can take its strain from
+any of them (see replica_mode)
+
 """
 import pdb
 import numpy as np
 from opentrons import labware, instruments, robot
+from otprotocols.cherrypick import assign_replica_sources, travel_report
 
 ####################### user intuitive parameters
 
@@ -32,6 +36,14 @@ tiprack_single_startfrom = 'A1'
 library_slots = library_slots = ['6','10','7','4','1']
 library_type = '96-flat'
 bacterial_volume = 75
+# 'travel': take each strain from the closest library plate with enough left
+# 'balance': spread the draws of each strain evenly across library plates
+# None: library plate in library_slots[i] only serves stock_slots[i]
+replica_mode = None
+# ul in each library well at the start, as filled for this run: needed by
+# replica_mode, which can draw a well as often as this allows
+library_well_volume = None
+library_dead_volume = 20  # ul that can't be aspirated
 
 # stock plates
 stock_slots = ['9','11','8','5','2']
@@ -94,6 +106,40 @@ for pc, stock_wells in enumerate(all_dst_wells):
 print(len(mapping_dict))
 print(len([v for vv in mapping_dict.values() for v in vv]))
 
+# choose which library plate serves each stock well, all at once
+if replica_mode is not None:
+    if library_well_volume is None:
+        raise ValueError(
+            'replica_mode needs library_well_volume, the volume in the '
+            'library wells')
+    demands = [(lib_well, lib_slot, stock_slot, stock_well)
+               for (lib_slot, lib_well), v in mapping_dict.items()
+               for stock_slot, stock_well in v]
+    src_wells, fixed_slots, dst_slots, dst_wells = zip(*demands)
+    chosen_slots = assign_replica_sources(
+        src_wells,
+        dst_slots,
+        dst_wells,
+        library_slots,
+        bacterial_volume,
+        library_well_volume,
+        dead_volume=library_dead_volume,
+        mode=replica_mode,
+        tiprack_slot=tiprack_single_slots[0])
+    travel_report(
+        src_wells, dst_slots, dst_wells, chosen_slots, fixed_slots,
+        tiprack_slot=tiprack_single_slots[0])
+    # rebuild the mapping, keeping the order of the library wells
+    mapping_dict = {}
+    for lib_well, lib_slot, stock_slot, stock_well in sorted(
+            zip(src_wells, chosen_slots, dst_slots, dst_wells),
+            key=lambda x: (library_slots.index(x[1]), x[0])):
+        key = (lib_slot, lib_well)
+        if key not in mapping_dict.keys():
+            mapping_dict[key] = [(stock_slot, stock_well)]
+        else:
+            mapping_dict[key].append((stock_slot, stock_well))
+
 ############################# define custom multiwell plates
 
 if '48-well-plate-sarsted' not in labware.list():
@@ -163,16 +209,14 @@ stk_plates = [labware.load(stock_type, slot) for slot in stock_slots]
 
 
 # translate mapping dictionary into robot terms
+# (a library well can now serve more than one stock plate, so the
+# destinations are a list of wells)
 robot_mapping = {}
 for k, v in mapping_dict.items():
     lib_slot, lib_well = k
     src_well = lib_plates[library_slots.index(lib_slot)].well(lib_well)
-    stk_slot = v[0][0]
-    if len(v) > 1:
-        stk_wells = [w for _,w in v]
-        dst_wells = stk_plates[stock_slots.index(stk_slot)].wells(stk_wells)
-    else:
-        dst_wells = stk_plates[stock_slots.index(stk_slot)].wells(v[0][1])
+    dst_wells = [stk_plates[stock_slots.index(stk_slot)].wells(stk_well)
+                 for stk_slot, stk_well in v]
     robot_mapping[src_well] = dst_wells
 
 print(len(robot_mapping))
@@ -182,10 +226,7 @@ print(len(robot_mapping))
 # print to check
 cc=0
 for k, v in robot_mapping.items():
-    if v.get_type()=='Well':
-        cc+=1
-    else:
-        cc+=len(v)
+    cc+=len(v)
 print(cc)
 
 # pdb.set_trace()
@@ -321,13 +362,7 @@ is_always_change = True
 tc = 0
 for src_well, dst in robot_mapping.items():
     if is_always_change:
-        # deal with wells not being iterable while wellseries are
-        if dst.get_type() == 'Well':
-            dst_wells = [dst]
-        else:
-            dst_wells = dst
-
-        for dst_well in dst_wells:
+        for dst_well in dst:
             if (tc % 96 == 0) and (tc != 0):
                 print('used {} tips so far'.format(tc))
                 pipette_single.reset_tip_tracking()
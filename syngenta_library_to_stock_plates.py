@@ -23,8 +23,21 @@ Will need to change stock plates 4 times
 
 """
 import pdb
+import time
+import datetime
 import numpy as np
 from opentrons import labware, instruments, robot
+from otprotocols.dilution import carryover_error, tip_mode_report
+from otprotocols.doseresponse import (
+    design_dilutions, chain_volumes, chain_counters, block_of)
+from otprotocols.plan import make_step, execute_plan
+from otprotocols.runlogs import write_runlog
+from otprotocols.notify import PauseNotifier, make_notifiers
+from otprotocols.pingpong import split_banks, BankSwaps
+from otprotocols.telemetry import Telemetry
+
+# start time of the run, for the runlog
+run_started = datetime.datetime.now()
 
 ####################### user intuitive parameters
 
@@ -49,6 +62,10 @@ DMSO_source_well = 'A1'
 H2O_source_well = 'A2'
 control_volume = 10  # volume in the left and rightmost columns of stock
 
+# operator notifications when the robot pauses
+notify_webhook_url = None  # e.g. a chat incoming webhook
+notify_email_to = []  # e.g. ['someone@example.com'], via smtp on localhost
+
 # library plate
 library_slot = '10'
 library_type = '96-well-plate-pcr-thermofisher'
@@ -59,25 +76,43 @@ drugs_volume_from_library = 11
 stock_slots = ['1', '2', '4', '5', '7', '8']
 stock_type = '96-well-plate-pcr-thermofisher'
 stock_frombottom_off = +0.5 # mm from bottom of stock wells
+# True: the stock slots are split in two banks (1, 2, 4 and 5, 7, 8), the
+# operator swaps the plates of a bank while the robot works on the other one,
+# and confirms with `python -m otprotocols.pingpong swapped A --token <token>
+# --host <robot>` (the token is in the swap notification). No drug spans two
+# banks. False: the robot pauses after the whole set of stock plates
+double_buffered = False
 
 # we dilute across n times so we have n+1 doses
+# doses in mM, each drug gets those up to its library concentration
+doses = [100, 30, 10, 3, 1]
+volume_pre_next_dilution = 11
 drug_groups = []
-# drugs with 5 doses:
+# drugs at 100mM, 5 doses:
 # this is nice as it is 2 drugs per plate
 drug_groups.append(
     {'number_of_drugs' : 41,
-     'number_of_doses' : 5,
-     'drugs_volumes_for_dilutions' : [3.3, 3.67, 3.3, 3.67]}
+     'library_concentration' : 100}
     )
-# drugs with 4 doses:
+# drugs at 30mM, 4 doses:
 # 5 drugs span 2 plates
 drug_groups.append(
     {'number_of_drugs' : 6,
-     'number_of_doses' : 4,
-     'drugs_volumes_for_dilutions' : [3.67, 3.3, 3.67]}
+     'library_concentration' : 30}
     )
+# dilution volumes ([3.3, 3.67, 3.3, 3.67] and [3.67, 3.3, 3.67])
+dose_design = design_dilutions(
+    [drug_group['library_concentration'] for drug_group in drug_groups],
+    doses, volume_pre_next_dilution)
+for dgc, drug_group in enumerate(drug_groups):
+    drug_group['number_of_doses'] = int(dose_design['used'][dgc].sum())
+    drug_group['drugs_volumes_for_dilutions'] = chain_volumes(dose_design, dgc)
 
-volume_pre_next_dilution = 11
+# 'always' uses new tips at each step, as this protocol always did. 'series'
+# does the whole dilution of a drug with one set of tips, as liquid only moves
+# towards lower concentrations; its carry-over estimate rests on assumed,
+# unmeasured constants (see otprotocols.dilution.carryover_error)
+dilution_tip_mode = 'always'
 
 # control columns
 DMSO_col = '1'
@@ -87,6 +122,19 @@ H2O_col = '12'
 n_columns = 12
 n_useful_columns = 10
 
+# report tips saved, and carry-over introduced, by the dilution tip mode
+for drug_group in drug_groups:
+    tip_mode_report(
+        drug_group['number_of_drugs'],
+        len(drug_group['drugs_volumes_for_dilutions']),
+        n_channels=8)
+    if dilution_tip_mode == 'series':
+        print('DILUTION CARRY-OVER: {}'.format(carryover_error(
+            drug_group['drugs_volumes_for_dilutions'],
+            [volume_pre_next_dilution] * len(
+                drug_group['drugs_volumes_for_dilutions']),
+            mix_cycles=5)))
+
 
 ############################# define custom multiwell plates
 
@@ -178,9 +226,81 @@ lib_plate = labware.load(library_type, library_slot)
 # define stock plate
 stock_plates = [labware.load(stock_type, slot) for slot in stock_slots]
 
-# define destination for controls:
-dmso_dst_cols = [stock_plate.cols(DMSO_col) for stock_plate in stock_plates]
-water_dst_cols = [stock_plate.cols(H2O_col) for stock_plate in stock_plates]
+# stock plates are refilled all together, or one bank at a time
+if double_buffered:
+    stock_banks = split_banks(stock_slots)
+else:
+    stock_banks = {'all': list(stock_slots)}
+
+# first column of each drug: the doses of a drug never span two banks (or
+# two rounds of stock plates), as the plates of the other bank are swapped
+# while the drug is being diluted. A block is a bank (or a round) of plates
+bank_names = list(stock_banks)
+bank_columns = [
+    n_useful_columns * len(stock_banks[bank]) for bank in bank_names]
+drugs_volumes = [
+    drug_group['drugs_volumes_for_dilutions']
+    for drug_group in drug_groups
+    for _ in range(drug_group['number_of_drugs'])]
+drug_counters = chain_counters(
+    [len(volumes) + 1 for volumes in drugs_volumes], bank_columns)
+drug_blocks = [block_of(counter, bank_columns)[0] for counter in drug_counters]
+n_empty_columns = (
+    drug_counters[-1] + len(drugs_volumes[-1]) + 1
+    - sum(len(volumes) + 1 for volumes in drugs_volumes))
+if n_empty_columns > 0:
+    print('LAYOUT: {} columns left empty, so no drug spans two banks'.format(
+        n_empty_columns))
+
+
+def counter_to_slot_well(counter):
+    """
+    Return (slot, first well of the column) of a counter, as
+    counter_to_platecolumn
+    """
+    col_name = str(counter % n_useful_columns + 2)
+    plate_ind = (counter // n_useful_columns) % len(stock_slots)
+    return stock_slots[plate_ind], 'A' + col_name
+
+
+# what the robot does when it gets a block of stock plates, one tip for each
+# liquid: DMSO controls and the DMSO of all the dilutions of the block, then
+# water controls
+block_plans = {}
+for block in sorted(set(drug_blocks)):
+    bank_slots = stock_banks[bank_names[block % len(bank_names)]]
+    controls_plan = {
+        liquid: [
+            make_step(
+                'controls', 'multi', control_volume,
+                (trough_slot, src_well), (stock_slot, 'A' + dst_col),
+                n_channels=8,
+                options={'blow_out': True, 'new_tip': 'once'},
+                compound=liquid,
+                chain=('controls', liquid),
+                )
+            for stock_slot in bank_slots]
+        for liquid, src_well, dst_col in [
+            ('DMSO', DMSO_source_well, DMSO_col),
+            ('WATER', H2O_source_well, H2O_col)]}
+    solvent_plan = [
+        make_step(
+            'solvent', 'multi', volume_pre_next_dilution - dil_vol,
+            (trough_slot, DMSO_source_well),
+            counter_to_slot_well(counter + 1 + vc),
+            n_channels=8,
+            options={'blow_out': True, 'new_tip': 'once'},
+            compound='DMSO',
+            chain=('controls', 'DMSO'),
+            )
+        for counter, drug_block, volumes in zip(
+            drug_counters, drug_blocks, drugs_volumes)
+        if drug_block == block
+        for vc, dil_vol in enumerate(volumes)]
+    block_plans[block] = (
+        controls_plan['DMSO'] + solvent_plan + controls_plan['WATER'])
+controls_plates = {trough_slot: ctrl_src_container}
+controls_plates.update(zip(stock_slots, stock_plates))
 # pdb.set_trace()
 ################### functions
 
@@ -229,18 +349,34 @@ def is_tiprack_empty(pipette):
         raise Exception('Unknown pipette type')
 
 
+def update_tips_left():
+    """
+    Tell the telemetry how many tips are left in each tiprack, by slot.
+    Counts the tips picked up as is_tiprack_empty does: the racks of a
+    pipette are used in order, and are all empty until they are changed.
+    """
+    stc, mtc = count_used_tips(is_print=False)
+    tips_left = {}
+    for slots, n_used in [(tiprack_multi_slots, mtc),
+                          (tiprack_single_slots, stc)]:
+        n_tips = 96 * len(slots)
+        if n_used % n_tips or n_used == 0:
+            n_used = n_used % n_tips
+        else:
+            n_used = n_tips
+        for rc, slot in enumerate(slots):
+            tips_left[slot] = min(96, max(0, 96 * (rc + 1) - n_used))
+    telemetry.set_tips_left(tips_left)
+
+
 def counter_to_platecolumn(counter):
     """
     Take a counter 0...Inf, return a WellSeries object (a column).
     Loop between columns '2' to '11' across the plates listed in stock_plates.
     After stock_plates[-1].cols('11') restart from stock_plates[0].cols('2')
     """
-    # get column name
-    col_name = str(counter % n_useful_columns + 2)
-    # get plate index
-    plate_ind = (counter // n_useful_columns) % len(stock_plates)
-    # get plate and column
-    out = stock_plates[plate_ind].cols(col_name)
+    slot, well = counter_to_slot_well(counter)
+    out = stock_plates[stock_slots.index(slot)].cols(well[1:])
     # print(out)
     return out
 
@@ -253,26 +389,13 @@ def my_get_path(well_or_wellseries):
     return (slot, pos)
 
 
-def is_new_set_stock_plates(counter):
-    """
-    Return True if the counter points to column '2' of the first stock plate,
-    as this means that counter_to_platecolumn has looped around.
-    """
-    platecol = counter_to_platecolumn(counter)
-    slot, _, col = platecol.get_path()
-    if slot == stock_slots[0] and col == '2':
-        return True
-    else:
-        return False
-
-
 def print_new_round_splash():
     print('###################################################')
     print('#             NEW SET OF STOCK PLATES             #')
     print('#             DISPENSE WATER AND DMSO             #')
     print('#             AFTER RESUMING PROTOCOL             #')
     print('###################################################')
-    robot.pause()
+    pause_notifier.pause(robot, 'New set of stock plates')
 
 
 def print_change_tiprack(pipette):
@@ -284,7 +407,7 @@ def print_change_tiprack(pipette):
     else:
         raise Exception('unknown pipette type')
     print('###################################################')
-    robot.pause()
+    pause_notifier.pause(robot, 'Change {} tiprack'.format(pipette.type))
 
 
 def print_action(what, from_where, to_where):
@@ -295,41 +418,50 @@ def print_action(what, from_where, to_where):
     print(message)
 
 
-def dispense_controls(pipette):
-
-    # safe tip pick up
-    safely_pick_up_tip(pipette)
-    # now dispense all the dmso
-    for dmso_dst_col in dmso_dst_cols:
-        print_action('DMSO', dmso_src_well, dmso_dst_col)
-        pipette.transfer(
-            control_volume,
-            dmso_src_well,
-            dmso_dst_col,
-            blow_out=True,
-            new_tip='never'
-            )
-    pipette.drop_tip()
-
-    # safe tip pick up
-    safely_pick_up_tip(pipette)
-    # now dispense all the water
-    for water_dst_col in water_dst_cols:
-        print_action('WATER', water_src_well, water_dst_col)
-        pipette.transfer(
-            control_volume,
-            water_src_well,
-            water_dst_col,
-            blow_out=True,
-            new_tip='never'
-            )
-    pipette.drop_tip()
+def dispense_controls(pipette, block=0):
+    """
+    Dispense the controls and the DMSO of the dilutions of a block of stock
+    plates, one tip for each liquid
+    """
+    for liquid in ['DMSO', 'WATER']:
+        liquid_plan = [
+            step for step in block_plans[block]
+            if step['compound'] == liquid]
+        for step in liquid_plan:
+            print_action(
+                liquid,
+                controls_plates[step['source'][0]].wells(step['source'][1]),
+                controls_plates[step['destination'][0]].cols(
+                    step['destination'][1][1:]))
+        # check tips before the plan picks them up
+        if is_tiprack_empty(pipette):
+            print_change_tiprack(pipette)
+            pipette.reset_tip_tracking()
+        # the first step done after a pause marks it as acknowledged
+        execute_plan(
+            liquid_plan, {'multi': pipette}, controls_plates,
+            telemetry=telemetry)
+        update_tips_left()
 
     return
 
-def new_round_actions(pipette):
-    print_new_round_splash()
-    dispense_controls(pipette)
+def new_round_actions(pipette, block):
+    # the operator loads the deck before the first round, and swaps the
+    # stock plates before the others if not double buffered
+    if block == 0 or not double_buffered:
+        print_new_round_splash()
+    if not double_buffered:
+        dispense_controls(pipette, block)
+        return
+    # only pause if the operator has not swapped the plates of this bank yet
+    bank = bank_names[block % len(bank_names)]
+    bank_swaps.switch_to(bank)
+    print('###################################################')
+    print('#   STOCK PLATES {:<32} #'.format(
+        ', '.join(stock_banks[bank])))
+    print('#             DISPENSE WATER AND DMSO             #')
+    print('###################################################')
+    dispense_controls(pipette, block)
 
 
 def safely_pick_up_tip(pipette):
@@ -347,7 +479,10 @@ def safely_pick_up_tip(pipette):
         # tell robot that we changed the tipracks
         pipette_multi.reset_tip_tracking()
     # proceed to pick up the tips as intended
-    return pipette.pick_up_tip()
+    out = pipette.pick_up_tip()
+    # (if it paused, the run was resumed less a pick up ago)
+    pause_notifier.resumed()
+    return out
 
 
 def safely_transfer(pipette, volume, source, destination, **kwargs):
@@ -365,6 +500,37 @@ def safely_transfer(pipette, volume, source, destination, **kwargs):
         )
 
 
+# live progress, on http://<robot ip>:48889/status during real runs: a block
+# of stock plates starts with its controls and DMSO, then each drug is a
+# library transfer and its dilutions. The robot needs the operator to load
+# the deck before the first block, and when a block reuses stock slots (if
+# double buffered, only if not swapped by then)
+n_steps = 0
+pause_before = []
+for dc, drug_volumes in enumerate(drugs_volumes):
+    block = drug_blocks[dc]
+    if dc == 0 or block != drug_blocks[dc - 1]:
+        if block == 0 or block >= (len(bank_names) if double_buffered else 1):
+            pause_before.append(n_steps)
+        n_steps += len(block_plans[block])
+    n_steps += 1 + len(drug_volumes)
+telemetry = Telemetry()
+telemetry.set_plan(n_steps, pause_before=pause_before)
+
+# tell the operator when the robot needs them, and ahead of it
+if not robot.is_simulating():
+    telemetry.start()
+    pause_notifier = PauseNotifier(
+        make_notifiers(notify_webhook_url, notify_email_to),
+        telemetry=telemetry)
+else:
+    pause_notifier = PauseNotifier(
+        make_notifiers(), telemetry=telemetry, log_path=None)
+
+# swaps of the banks of stock plates, confirmed over http
+bank_swaps = BankSwaps(stock_banks, robot, notifier=pause_notifier)
+bank_swaps.attach(telemetry)
+update_tips_left()
 
 
 ################### actions
@@ -380,10 +546,8 @@ lib_wells_list = [well
 
 # counters
 start_druglib_well = 0
-column_counter = 0  # needed to keep track of which column as drugs span multiple plates
-
-if is_new_set_stock_plates(column_counter):
-    new_round_actions(pipette_multi)
+drug_counter = 0  # index of the drug in drug_counters, drug_blocks
+current_block = None
 
 for dgc, drug_group in enumerate(drug_groups):
 
@@ -398,9 +562,18 @@ for dgc, drug_group in enumerate(drug_groups):
     # for loop on library drugs of this group
     for drug_well in group_lib_wells_list:
 
+        # all the columns of a drug are in one block of stock plates, which
+        # already has its controls and the DMSO of the dilutions
+        column_counter = drug_counters[drug_counter]
+        if drug_blocks[drug_counter] != current_block:
+            current_block = drug_blocks[drug_counter]
+            new_round_actions(pipette_multi, current_block)
+        drug_counter += 1
+
         # first we put drug in every well of a new column
         stock_column = counter_to_platecolumn(column_counter)
         print_action('drug', drug_well, stock_column)
+        tic = time.time()
         safely_transfer(
             pipette_single,
             drugs_volume_from_library,
@@ -408,81 +581,66 @@ for dgc, drug_group in enumerate(drug_groups):
             stock_column,
             blow_out=True
             )
+        telemetry.step_done(1, 'library', time.time() - tic)
+        update_tips_left()
         column_counter += 1
-        if is_new_set_stock_plates(column_counter):
-            new_round_actions(pipette_multi)
 
         # now we do the serial dilution:
-        # use multichannel to dispense all the dmso first, to save on tips
-        dmso_column_counter = column_counter
-
-        # pick up tip here
-        safely_pick_up_tip(pipette_multi)
-
-        # now dispense DMSO
-        for vc, dil_vol in enumerate(drugs_volumes_for_dilutions):
-            current_column = counter_to_platecolumn(dmso_column_counter)
-            # add dmso to this column first
-            dmso_dil_vol = volume_pre_next_dilution - dil_vol
-            print_action('DMSO', dmso_src_well, current_column)
-            pipette_multi.transfer(
-                dmso_dil_vol,
-                dmso_src_well,
-                current_column,
-                blow_out=True,
-                new_tip='never'
-                )
-            # prepare variables for next column
-            dmso_column_counter += 1
-            # problem if next column of dmso is in new set of stock plates
-            if is_new_set_stock_plates(dmso_column_counter):
-                # doesn't matter if we finished the doses as then dmso column
-                # counter will be overwritten
-                if vc < len(drugs_volumes_for_dilutions)-1:
-                    print('DILUTION IS SPLIT ACROSS ROUNDS OF STOCK PLATES!!!')
-
-        # done, drop tip
-        pipette_multi.drop_tip()
-
-        # continue serial dilution:
         # use multichannel to dispense from one col to the next
+        # in series mode, the same tips for the whole dilution
+        if dilution_tip_mode == 'series':
+            safely_pick_up_tip(pipette_multi)
         previous_column = stock_column
-        for dil_vol in drugs_volumes_for_dilutions:
+        for vc, dil_vol in enumerate(drugs_volumes_for_dilutions):
 
             current_column = counter_to_platecolumn(column_counter)
             if previous_column.get_path()[0] != current_column.get_path()[0]:
                 print('PREVIOUS AND CURRENT ON TWO DIFFERENT PLATES')
             print_action('drug', previous_column, current_column)
-            safely_transfer(
-                pipette_multi,
-                dil_vol,
-                previous_column.bottom(stock_frombottom_off),
-                current_column,
-                mix_before=(2, 10), # mix 2x with 10 uL before
-                mix_after=(3, 10), # mix 2x with 10 uL after
-                blow_out=True
-                )
+            tic = time.time()
+            if dilution_tip_mode == 'series':
+                # tips already on, no need to check the tipracks
+                pipette_multi.transfer(
+                    dil_vol,
+                    previous_column.bottom(stock_frombottom_off),
+                    current_column,
+                    mix_before=(2, 10), # mix 2x with 10 uL before
+                    mix_after=(3, 10), # mix 2x with 10 uL after
+                    blow_out=True,
+                    new_tip='never'
+                    )
+            else:
+                safely_transfer(
+                    pipette_multi,
+                    dil_vol,
+                    previous_column.bottom(stock_frombottom_off),
+                    current_column,
+                    mix_before=(2, 10), # mix 2x with 10 uL before
+                    mix_after=(3, 10), # mix 2x with 10 uL after
+                    blow_out=True
+                    )
+
+            telemetry.step_done(1, 'dilution', time.time() - tic)
+            update_tips_left()
 
             # update columns
             previous_column = current_column
             column_counter += 1
-            if is_new_set_stock_plates(column_counter):
-                new_round_actions(pipette_multi)
+        if dilution_tip_mode == 'series':
+            pipette_multi.drop_tip()
 
     # update start_druglib_well
     start_druglib_well = stop_druglib_well
 
 
 count_used_tips()
+telemetry.stop()
 robot.pause(60)
 # each time we add water and fill up a 96wp => expecting 104 tips every plate
 # so 104, 208, 312, 416
 
-#write out robot commands
+#write out robot commands, with the start time for the ETA model
 if not robot.is_simulating():
-    import datetime
-    out_fname = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")+'_runlog.txt'
-    out_fname = '/data/user_storage/opentrons_data/protocols_logs/' + out_fname
-    with open(out_fname,'w') as fid:
-        for command in robot.commands():
-            print(command,file=fid)
+    write_runlog(
+        robot.commands(), 'syngenta_library_to_stock_plates',
+        started=run_started)
@@ -0,0 +1,74 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.cherrypick
+"""
+
+import numpy as np
+import pytest
+
+from otprotocols.cherrypick import assign_replica_sources, travel_costs
+
+REPLICA_SLOTS = ['1', '4', '7']
+
+
+def _layout(n_draws_per_well=4):
+    # every library well is drawn n times, into two destination plates
+    library = ['A{}'.format(c) for c in range(1, 13)]
+    source_wells = library * n_draws_per_well
+    dst_slots = ['3' if i % 2 else '6' for i in range(len(source_wells))]
+    dst_wells = [
+        'ABCDEFGH'[(i // 12) % 8] + str(i % 12 + 1)
+        for i in range(len(source_wells))]
+    return source_wells, dst_slots, dst_wells
+
+
+def _draws(source_wells, chosen):
+    counts = {}
+    for well, slot in zip(source_wells, chosen):
+        counts[(well, slot)] = counts.get((well, slot), 0) + 1
+    return counts
+
+
+def test_travel_unlimited_volume_takes_closest():
+    source_wells, dst_slots, dst_wells = _layout()
+    chosen = assign_replica_sources(
+        source_wells, dst_slots, dst_wells, REPLICA_SLOTS, draw_volume=3,
+        well_volume=1000)
+    cost = travel_costs(source_wells, dst_slots, dst_wells, REPLICA_SLOTS)
+    closest = np.array(REPLICA_SLOTS)[cost.argmin(axis=1)]
+    assert np.array_equal(chosen, closest)
+
+
+@pytest.mark.parametrize('mode', ['travel', 'balance'])
+def test_capacity(mode):
+    source_wells, dst_slots, dst_wells = _layout()
+    # 2 draws of 3 ul per library well (7 ul, 1 ul dead)
+    chosen = assign_replica_sources(
+        source_wells, dst_slots, dst_wells, REPLICA_SLOTS, draw_volume=3,
+        well_volume=7, dead_volume=1, mode=mode, tiprack_slot='9')
+    assert len(chosen) == len(source_wells)
+    assert set(chosen) <= set(REPLICA_SLOTS)
+    assert max(_draws(source_wells, chosen).values()) <= 2
+
+
+def test_balance_spreads_draws():
+    source_wells, dst_slots, dst_wells = _layout(n_draws_per_well=3)
+    chosen = assign_replica_sources(
+        source_wells, dst_slots, dst_wells, REPLICA_SLOTS, draw_volume=3,
+        well_volume=100, mode='balance')
+    assert set(_draws(source_wells, chosen).values()) == {1}
+
+
+def test_not_enough_volume():
+    source_wells, dst_slots, dst_wells = _layout()
+    for mode in ['travel', 'balance']:
+        with pytest.raises(AssertionError):
+            assign_replica_sources(
+                source_wells, dst_slots, dst_wells, REPLICA_SLOTS,
+                draw_volume=3, well_volume=4, mode=mode)
+    with pytest.raises(ValueError):
+        assign_replica_sources(
+            source_wells, dst_slots, dst_wells, REPLICA_SLOTS,
+            draw_volume=3, well_volume=100, mode='random')
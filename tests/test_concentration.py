@@ -0,0 +1,77 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.concentration
+"""
+
+import numpy as np
+
+from otprotocols.plan import make_step
+from otprotocols.concentration import pipette_errors, track_concentrations
+
+LABWARE = {
+    '6': '96-well-plate-pcr-thermofisher', '1': '96-flat',
+    '9': 'trough-12row'}
+INITIAL = {'6': (45, 10.0), '9': (20000, 0)}
+MODELS = {'drugs': 'p10-Single', 'solvent': 'p50-Single',
+          'multi': 'p10-Multi'}
+
+
+def _plan():
+    return [
+        make_step('drugs', 'drugs', 5, ('6', 'A1'), ('1', 'A1')),
+        make_step('solvent', 'solvent', 5, ('9', 'A1'), ('1', 'A1')),
+        make_step('drugs', 'drugs', 2, ('1', 'A1'), ('1', 'A2')),
+        ]
+
+
+def test_pipette_errors():
+    accuracy, precision = pipette_errors('p10-Multi', [0.5, 1, 10, 20])
+    np.testing.assert_allclose(accuracy, [0.12, 0.12, 0.015, 0.015])
+    np.testing.assert_allclose(precision, [0.08, 0.08, 0.008, 0.008])
+    accuracy, _ = pipette_errors('p10-Single', [np.sqrt(10)])
+    np.testing.assert_allclose(accuracy, (0.12 + 0.015) / 2)
+
+
+def test_nominal():
+    out = track_concentrations(
+        _plan(), LABWARE, INITIAL, MODELS, n_samples=0, residual_volume=0)
+    assert out['volume']['6'].shape == (8, 12)
+    assert out['volume']['9'].shape == (1, 12)
+    assert out['volume']['6'][0, 0] == 40
+    assert out['volume']['6'][0, 1] == 45
+    assert out['volume']['9'][0, 0] == 19995
+    np.testing.assert_allclose(out['volume']['1'][0, :2], [8, 2])
+    np.testing.assert_allclose(out['conc']['1'][0, :2], [5, 5])
+    assert out['conc']['1'][1:].sum() == 0
+    np.testing.assert_allclose(out['low']['1'], out['conc']['1'])
+
+
+def test_multichannel_from_trough():
+    plan = [make_step('water', 'multi', 5, ('9', 'A1'), ('1', 'A3'),
+                      n_channels=8)]
+    out = track_concentrations(
+        plan, LABWARE, INITIAL, MODELS, n_samples=0, residual_volume=0)
+    np.testing.assert_allclose(out['volume']['1'][:, 2], 5)
+    assert out['volume']['9'][0, 0] == 20000 - 40
+
+
+def test_errors_and_state():
+    out = track_concentrations(
+        _plan(), LABWARE, INITIAL, MODELS, n_samples=500, seed=0)
+    conc, low, high = (out[k]['1'][0, 1] for k in ['conc', 'low', 'high'])
+    assert low < conc < high
+    again = track_concentrations(
+        _plan(), LABWARE, INITIAL, MODELS, n_samples=500, seed=0)
+    assert np.array_equal(out['high']['1'], again['high']['1'])
+    # carrying on from the state is the same as running the plans in one go
+    first = track_concentrations(
+        _plan()[:2], LABWARE, INITIAL, MODELS, n_samples=0)
+    rest = track_concentrations(
+        _plan()[2:], LABWARE, {}, MODELS, n_samples=0,
+        state=first['state'])
+    whole = track_concentrations(
+        _plan(), LABWARE, INITIAL, MODELS, n_samples=0)
+    np.testing.assert_allclose(rest['volume']['1'], whole['volume']['1'])
+    np.testing.assert_allclose(rest['conc']['1'], whole['conc']['1'])
@@ -0,0 +1,80 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.doseresponse
+"""
+
+import numpy as np
+import pytest
+
+from otprotocols.doseresponse import (
+    SYNGENTA_DOSES, design_dilutions, chain_volumes, block_of,
+    chain_counters, stock_layout)
+
+
+def test_design_dilutions():
+    design = design_dilutions([100, 30], SYNGENTA_DOSES, 11)
+    assert design['used'].tolist() == [[True] * 5, [False] + [True] * 4]
+    np.testing.assert_allclose(
+        design['transfer'][0], [11, 3.3, 3.67, 3.3, 3.67])
+    assert np.isnan(design['transfer'][1, 0])
+    np.testing.assert_allclose(
+        design['transfer'] + design['solvent'], design['working'])
+    np.testing.assert_allclose(
+        design['conc'][0], SYNGENTA_DOSES, rtol=2e-3)
+    assert design['ok'].all()
+    assert chain_volumes(design, 1) == [3.67, 3.3, 3.67]
+
+
+def test_design_min_volume():
+    # 10x dilution of 5 ul would need 0.5 ul, the working volume goes up
+    design = design_dilutions([10], [10, 1], 5, min_volume=1)
+    np.testing.assert_allclose(design['transfer'][0], [5, 1])
+    np.testing.assert_allclose(design['working'][0], [5, 10])
+    design = design_dilutions([10], [10, 1], 5, min_volume=1, max_volume=8)
+    assert not design['ok'][0]
+
+
+def test_design_min_left():
+    design = design_dilutions([100], SYNGENTA_DOSES, 11, min_left=9)
+    assert design['ok'][0]
+    assert (design['final'][0] >= 9 - 1e-9).all()
+    assert (design['working'][0, :-1] > 11).all()
+
+
+def test_design_in_place():
+    design = design_dilutions([100], [100, 30, 10], 11, in_place=True)
+    assert design['transfer'][0, 0] == 0
+    assert design['solvent'][0, 0] == 0
+    with pytest.raises(AssertionError):
+        design_dilutions([100], [30, 10], 11, in_place=True)
+    with pytest.raises(AssertionError):
+        design_dilutions([100], [10, 30], 11)
+
+
+def test_blocks():
+    assert block_of(0, [10, 10]) == (0, 0, 10)
+    assert block_of(13, [10, 10]) == (1, 10, 20)
+    assert block_of(25, [10, 10]) == (2, 20, 30)
+    assert chain_counters([5, 4, 5]).tolist() == [0, 5, 9]
+    # the third drug would straddle two blocks, it starts the next one
+    assert chain_counters([5, 4, 5], [10, 10]).tolist() == [0, 5, 10]
+    with pytest.raises(AssertionError):
+        chain_counters([5, 11], [10, 10])
+
+
+def test_stock_layout():
+    dose_wells, rounds = stock_layout([5, 4, 5], ['4', '5'])
+    assert dose_wells[0].tolist() == [
+        ('4', 'A{}'.format(c)) for c in range(2, 7)]
+    assert dose_wells[1, 4] is None
+    # the first plate is full after 10 columns
+    assert dose_wells[2].tolist() == [
+        ('4', 'A11'), ('5', 'A2'), ('5', 'A3'), ('5', 'A4'), ('5', 'A5')]
+    dose_wells, rounds = stock_layout(
+        [5, 4, 5], ['4', '5'], block_columns=[10])
+    assert dose_wells[2, 0] == ('5', 'A2')
+    assert rounds[2].tolist() == [0] * 5
+    dose_wells, rounds = stock_layout([5] * 5, ['4'])
+    assert rounds[:, 0].tolist() == [0, 0, 1, 1, 2]
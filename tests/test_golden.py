@@ -0,0 +1,62 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.golden (without simulating)
+"""
+
+from otprotocols.golden import (
+    normalise, rolling_hash, diff_commands, golden_path, golden_parameters,
+    record, check)
+
+STREAM = [
+    'Picking up tip wells A1...H1 in "3"',
+    'Transferring 3.0 from wells A1...H1 in "1" to wells A1...H1 in "2"',
+    'Aspirating 3.0 uL from wells A1...H1 in "1" at 1.0 speed',
+    'Dispensing 3.0 uL into wells A1...H1 in "2" at 1.0 speed',
+    'Dropping tip well A1 in "12"',
+    ]
+
+
+def test_normalise():
+    assert normalise(['Aspirating  3.14159 uL\tfrom A1']) == [
+        'Aspirating 3.14 uL from A1']
+    assert normalise(['Dispensing 5.000001 uL']) == ['Dispensing 5 uL']
+    assert normalise(STREAM)[1] == (
+        'Transferring 3 from wells A1...H1 in "1" to wells A1...H1 in "2"')
+
+
+def test_rolling_hash():
+    assert rolling_hash(STREAM) == rolling_hash(list(STREAM))
+    assert rolling_hash(STREAM) != rolling_hash(STREAM[::-1])
+    assert rolling_hash(STREAM) != rolling_hash(STREAM[:-1])
+    assert len(rolling_hash([])) == 16
+
+
+def test_diff_commands():
+    diff = diff_commands(STREAM, STREAM)
+    assert diff['added'] == diff['removed'] == diff['moved'] == []
+    assert diff['seconds'] == 0
+    new = STREAM[:2] + ['Touching tip'] + STREAM[2:4]
+    diff = diff_commands(STREAM, new)
+    assert diff['added'] == [(2, 'Touching tip')]
+    assert diff['removed'] == [(4, STREAM[4])]
+    assert diff['moved'] == []
+    # swapping two commands moves one of them
+    new = STREAM[:2] + [STREAM[3], STREAM[2]] + STREAM[4:]
+    diff = diff_commands(STREAM, new)
+    assert diff['added'] == diff['removed'] == []
+    assert len(diff['moved']) == 1
+    assert diff['seconds'] == 0
+
+
+def test_record_and_check(tmp_path):
+    golden_dir = str(tmp_path)
+    path = record('some/protocol.py', STREAM, golden_dir, {'seed': 1})
+    assert path == golden_path('protocol.py', golden_dir)
+    assert golden_parameters('protocol.py', golden_dir) == {'seed': 1}
+    assert check('protocol.py', STREAM, golden_dir) is None
+    # only differences that matter on the robot
+    assert check('protocol.py', [' ' + c for c in STREAM], golden_dir) is None
+    diff = check('protocol.py', STREAM[:-1], golden_dir)
+    assert diff['removed'] == [(4, STREAM[4])]
@@ -0,0 +1,111 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.plan (the parts that do not need the robot)
+"""
+
+import numpy as np
+import pytest
+
+from otprotocols.plan import (
+    make_step, transfer_options, channel_wells, shuffle_plan, group_steps,
+    split_steps, count_plan_tips)
+
+
+def _steps(n, **kwargs):
+    return [
+        make_step('drugs', 'multi', 3, ('1', 'A1'), ('2', 'A{}'.format(c)),
+                  n_channels=8, **kwargs)
+        for c in range(1, n + 1)]
+
+
+def test_make_step():
+    step = make_step('water', 'single', 5, (9, 'A12'), (2, 'B3'),
+                     replicate=2)
+    assert step['source'] == ('9', 'A12')
+    assert step['destination'] == ('2', 'B3')
+    assert step['volume'] == 5.0
+    assert step['n_channels'] == 1
+    assert step['options'] == {}
+    assert step['replicate'] == 2
+
+
+def test_transfer_options_touch():
+    options = {'touch': True, 'new_tip': 'always'}
+    assert transfer_options(options) == {
+        'touch_tip': True, 'new_tip': 'always'}
+    # the options of the caller are left alone
+    assert options == {'touch': True, 'new_tip': 'always'}
+    assert transfer_options({'touch': True, 'touch_tip': False}) == {
+        'touch_tip': False}
+    assert transfer_options(None) == {}
+    step = make_step('drugs', 'multi', 3, ('1', 'A1'), ('2', 'A1'),
+                     options={'touch': True})
+    assert step['options'] == {'touch_tip': True}
+
+
+def test_channel_wells():
+    assert channel_wells('C4', 1) == ['C4']
+    assert channel_wells('A12', 8) == [r + '12' for r in 'ABCDEFGH']
+    assert channel_wells('B1', 4) == ['B1', 'C1', 'D1', 'E1']
+    with pytest.raises(AssertionError):
+        channel_wells('B1', 8)
+
+
+def test_shuffle_plan():
+    drugs_mapping = {
+        ('1', '2'): (np.arange(3), np.array([2, 0, 1])),
+        ('1', '5'): (np.arange(3), np.array([1, 2, 0])),
+        }
+    written = []
+
+    class _Writer(object):
+        def write_step(self, step):
+            written.append(step)
+
+    plan = shuffle_plan(drugs_mapping, 3, seed=42, platemap=_Writer())
+    assert len(plan) == 6
+    assert written == plan
+    assert [s['destination'] for s in plan[:3]] == [
+        ('2', 'A3'), ('2', 'A1'), ('2', 'A2')]
+    assert [s['source'] for s in plan[3:]] == [
+        ('1', 'A1'), ('1', 'A2'), ('1', 'A3')]
+    assert [s['replicate'] for s in plan] == [1, 1, 1, 2, 2, 2]
+    assert all(s['seed'] == 42 and s['n_channels'] == 8 for s in plan)
+
+
+def test_group_steps():
+    plan = (_steps(3) + _steps(2, options={'new_tip': 'always'})
+            + _steps(2))
+    groups = group_steps(plan)
+    assert [len(g) for g in groups] == [3, 2, 2]
+    assert sum(groups, []) == plan
+    # steps of different chains are not grouped
+    plan = _steps(2, chain=0) + _steps(2, chain=1)
+    assert [len(g) for g in group_steps(plan)] == [2, 2]
+
+
+def test_split_steps():
+    group = _steps(3)
+    assert split_steps(group, 'always') == [[s] for s in group]
+    assert split_steps(group, 'never') == [[s] for s in group]
+    assert split_steps(group, 'once') == [group]
+    shared = _steps(3, aspiration=0, disposal_volume=1)
+    assert split_steps(shared, 'always') == [shared]
+
+
+def test_count_plan_tips():
+    always = _steps(3, options={'new_tip': 'always'})
+    assert count_plan_tips(always) == {'multi': 24}
+    assert count_plan_tips(_steps(3)) == {'multi': 8}
+    never = _steps(3, options={'new_tip': 'never'})
+    assert count_plan_tips(never) == {'multi': 0}
+    # one tip per chain, kept across the groups of the same chain
+    plan = (_steps(2, chain=0, options={'new_tip': 'once'})
+            + _steps(1, chain=0, options={'new_tip': 'once', 'touch': True})
+            + _steps(2, chain=1, options={'new_tip': 'once'}))
+    assert count_plan_tips(plan) == {'multi': 16}
+    plan = [make_step('water', 'single', 5, ('9', 'A1'), ('2', 'A1'),
+                      options={'new_tip': 'always'})] + always
+    assert count_plan_tips(plan) == {'single': 1, 'multi': 24}
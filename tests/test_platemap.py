@@ -0,0 +1,79 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.platemap
+"""
+
+import csv
+
+import numpy as np
+import pytest
+
+from otprotocols.plan import make_step, shuffle_plan
+from otprotocols.platemap import (
+    PLATEMAP_COLUMNS, step_to_records, PlateMapWriter, export_plan)
+
+PLATE_NAMES = {'1': 'library_01', '2': 'stock_A'}
+
+
+def _read_csv(path):
+    with open(str(path), newline='') as fid:
+        return list(csv.DictReader(fid))
+
+
+def test_step_to_records_multi():
+    step = make_step('drugs', 'multi', 3, ('1', 'A4'), ('2', 'A7'),
+                     n_channels=8, replicate=1, seed=7)
+    records = step_to_records(step, 5, PLATE_NAMES)
+    assert len(records) == 8
+    assert all(set(r) == set(PLATEMAP_COLUMNS) for r in records)
+    assert [r['well'] for r in records] == [r + '7' for r in 'ABCDEFGH']
+    assert [r['source_well'] for r in records] == [
+        r + '4' for r in 'ABCDEFGH']
+    # no compound: named after the library plate and well
+    assert records[2]['compound'] == 'library_01_C4'
+    assert records[0]['plate_id'] == 'stock_A'
+    assert records[0]['slot'] == '2'
+    assert all(r['step'] == 5 and r['seed'] == 7 for r in records)
+
+
+def test_step_to_records_compounds():
+    step = make_step('dilution', 'single', 2, ('3', 'B1'), ('4', 'B2'),
+                     compound='DMSO', dose=10.0)
+    records = step_to_records(step, 0)
+    assert len(records) == 1
+    assert records[0]['compound'] == 'DMSO'
+    assert records[0]['dose'] == 10.0
+    # without plate names, the plates are their slots
+    assert records[0]['plate_id'] == '4'
+    step = make_step('drugs', 'multi', 3, ('1', 'A1'), ('2', 'A1'),
+                     n_channels=2, compound=['x', 'y'], dose=[1, 3])
+    records = step_to_records(step, 0)
+    assert [(r['compound'], r['dose']) for r in records] == [
+        ('x', 1), ('y', 3)]
+
+
+def test_writer_csv(tmp_path):
+    drugs_mapping = {('1', '2'): (np.arange(12), np.arange(12)[::-1])}
+    path = tmp_path / 'maps' / 'platemap.csv'
+    with PlateMapWriter(path, PLATE_NAMES, batch_size=10) as writer:
+        plan = shuffle_plan(drugs_mapping, 3, seed=1, platemap=writer)
+    assert writer.n_steps == 12
+    assert writer.n_rows == 96
+    rows = _read_csv(path)
+    assert len(rows) == 96
+    assert list(rows[0]) == PLATEMAP_COLUMNS
+    assert rows[0]['well'] == 'A12'
+    assert rows[0]['compound'] == 'library_01_A1'
+    assert rows[-1]['well'] == 'H1'
+    assert rows[-1]['step'] == '11'
+    # streaming and exporting at the end write the same file
+    other = tmp_path / 'export.csv'
+    assert export_plan(plan, other, PLATE_NAMES) == 96
+    assert _read_csv(other) == rows
+
+
+def test_writer_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        PlateMapWriter(tmp_path / 'platemap.xlsx')
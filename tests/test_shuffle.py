@@ -0,0 +1,62 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.shuffle
+"""
+
+import numpy as np
+import pytest
+
+from otprotocols.shuffle import (
+    constrained_column_shuffles, constrained_drugs_mapping)
+
+
+def test_same_seed_same_shuffles():
+    first = constrained_column_shuffles(4, seed=20191205)
+    second = constrained_column_shuffles(4, seed=20191205)
+    assert np.array_equal(first, second)
+    other = constrained_column_shuffles(4, seed=20191206)
+    assert not np.array_equal(first, other)
+
+
+def test_constraints():
+    n_replicates, n_columns = 6, 12
+    control_cols = [0, 11]
+    groups = np.repeat(np.arange(6), 2)  # columns 2k, 2k+1 same compound
+    out = constrained_column_shuffles(
+        n_replicates, n_columns, seed=1, control_cols=control_cols,
+        compound_groups=groups)
+    assert out.shape == (n_replicates, n_columns)
+    # each replicate is a permutation of the columns
+    assert (np.sort(out, axis=1) == np.arange(n_columns)).all()
+    # a source column never goes twice to the same destination column
+    for src in range(n_columns):
+        assert len(set(out[:, src])) == n_replicates
+    # controls never on the edge, edges shared evenly
+    on_edge = (out == 0) | (out == n_columns - 1)
+    assert not on_edge[:, control_cols].any()
+    max_edge = int(np.ceil(n_replicates * 2 / (n_columns - 2)))
+    assert on_edge.sum(axis=0).max() <= max_edge
+    # same compound never in neighbouring destination columns
+    dst_groups = groups[out.argsort(axis=1)]
+    assert not (dst_groups[:, 1:] == dst_groups[:, :-1]).any()
+
+
+def test_impossible_layouts():
+    with pytest.raises(AssertionError):
+        constrained_column_shuffles(13, 12, seed=0)
+    # all columns are controls, none can go on the edge
+    with pytest.raises(ValueError):
+        constrained_column_shuffles(
+            2, 4, seed=0, control_cols=range(4), max_edge_per_column=1,
+            max_restarts=2)
+
+
+def test_drugs_mapping():
+    mapping = constrained_drugs_mapping('1', ['2', '5', '8'], seed=3)
+    assert list(mapping) == [('1', '2'), ('1', '5'), ('1', '8')]
+    shuffles = constrained_column_shuffles(3, seed=3)
+    for (src_cols, dst_cols), expected in zip(mapping.values(), shuffles):
+        assert np.array_equal(src_cols, np.arange(12))
+        assert np.array_equal(dst_cols, expected)
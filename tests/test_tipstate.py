@@ -0,0 +1,78 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tests of otprotocols.tipstate
+"""
+
+from otprotocols.tipstate import (
+    TIPRACK_WELLS, load_tip_state, save_tip_state, get_rack, reset_rack,
+    mark_tips_used, available_tips, first_available_tip, tips_left,
+    picked_up_tips, update_from_commands, reachable_tips)
+
+COMMANDS = [
+    'Picking up tip wells A1...H1 in "3"',
+    'Aspirating 3.0 uL from wells A1...H1 in "1" at 1.0 speed',
+    'Dropping tip well A1 in "12"',
+    'Picking up tip well A1 in "5"',
+    'Picking up tip well C2 in "5"',
+    'Picking up tip wells C4...H4 in "3"',
+    ]
+
+
+def test_picked_up_tips():
+    assert picked_up_tips(COMMANDS) == [
+        ('3', [r + '1' for r in 'ABCDEFGH']),
+        ('5', ['A1']),
+        ('5', ['C2']),
+        ('3', [r + '4' for r in 'CDEFGH']),
+        ]
+
+
+def test_update_from_commands():
+    state = update_from_commands({}, COMMANDS, {'3': 'multi_rack'})
+    assert list(state) == ['multi_rack']
+    used = state['multi_rack']['used']
+    assert len(used) == 14
+    # kept in the order the robot picks tips up
+    assert used == [w for w in TIPRACK_WELLS if w in set(used)]
+
+
+def test_available_tips():
+    state = {}
+    assert get_rack(state, 'r')['used'] == []
+    assert tips_left(state, 'r') == 96
+    assert tips_left(state, 'r', n_channels=8) == 12
+    mark_tips_used(state, 'r', ['A1', 'B1', 'D2'])
+    assert first_available_tip(state, 'r') == 'C1'
+    assert first_available_tip(state, 'r', n_channels=8) == 'A3'
+    assert available_tips(state, 'r', n_channels=8)[:2] == ['A3', 'A4']
+    assert tips_left(state, 'r') == 93
+    assert tips_left(state, 'r', n_channels=8) == 10
+    mark_tips_used(state, 'r', TIPRACK_WELLS)
+    assert first_available_tip(state, 'r') is None
+    reset_rack(state, 'r')
+    assert tips_left(state, 'r') == 96
+
+
+def test_reachable_tips():
+    state = {}
+    mark_tips_used(state, 'r1', TIPRACK_WELLS[:90])
+    # the robot goes from the 6 tips left in r1 into r2 from A1
+    assert reachable_tips(state, ['r1', 'r2']) == 6 + 96
+    mark_tips_used(state, 'r2', ['B1'])
+    assert reachable_tips(state, ['r1', 'r2']) == 6 + 1
+    # empty racks first are skipped, then the robot starts at A1
+    mark_tips_used(state, 'r1', TIPRACK_WELLS)
+    assert reachable_tips(state, ['r1', 'r2']) == 1
+    assert reachable_tips(state, ['r1', 'r2'], n_channels=8) == 11
+
+
+def test_load_save(tmp_path):
+    path = str(tmp_path / 'state' / 'tip_state.json')
+    assert load_tip_state(path) == {}
+    state = {}
+    mark_tips_used(state, 'r', ['A1'])
+    save_tip_state(state, path)
+    assert load_tip_state(path) == state
+    assert not (tmp_path / 'state' / 'tip_state.json.tmp').exists()
@@ -0,0 +1,90 @@
+"""
+@author lferiani
+@date Oct 19th, 2026
+
+Tip rack in 3
+
+Replaces the drop_tip scripts (pick up, wait, return every tip) with a tip
+inventory that is kept across runs in
+/data/user_storage/opentrons_data/tip_state.json
+
+Each physical rack has an id (write it on the rack!). For that rack:
+    - if trust_tip_state is True and the rack has been audited before,
+        nothing moves, the state is just printed
+    - otherwise the pipette quickly picks up and returns only the tips the
+        state thinks are there, no delays. If a pick up fails, add the tip
+        position to missing_tips and run again.
+The other protocols then start from the first available tip by themselves.
+
+"""
+
+from opentrons import labware, instruments, robot
+from otprotocols.tipstate import (
+    TIP_STATE_FILE, load_tip_state, save_tip_state, get_rack, reset_rack,
+    mark_tips_used, available_tips, tips_left)
+
+####################### user intuitive parameters
+
+pipette_type = 'p10-Multi'  # or 'p10-Single'
+pipette_mount = 'left'
+
+tiprack_slot = '3'
+tiprack_type = 'opentrons-tiprack-10ul'
+rack_id = 'p10_rack_01'
+
+is_new_rack = False  # True if the rack has just been refilled
+trust_tip_state = True  # skip the sweep if the rack was audited already
+missing_tips = []  # e.g. ['A10', 'B10'] if spotted by eye
+delay_seconds = 0  # the old scripts waited 5 seconds per tip
+
+############################ tip state
+
+tip_state = load_tip_state()
+if is_new_rack:
+    reset_rack(tip_state, rack_id)
+if missing_tips:
+    mark_tips_used(tip_state, rack_id, missing_tips)
+rack = get_rack(tip_state, rack_id)
+
+n_channels = 8 if pipette_type == 'p10-Multi' else 1
+print('RACK {}: {} pick ups left, last audited {}'.format(
+    rack_id, tips_left(tip_state, rack_id, n_channels), rack['audited']))
+
+############################ define labware
+# pipette and tiprack
+tiprack = labware.load(tiprack_type, tiprack_slot)
+if pipette_type == 'p10-Multi':
+    pipette = instruments.P10_Multi(
+        mount=pipette_mount,
+        tip_racks=[tiprack])
+elif pipette_type == 'p10-Single':
+    pipette = instruments.P10_Single(
+        mount=pipette_mount,
+        tip_racks=[tiprack])
+pipette.plunger_positions['drop_tip'] = -6
+
+#################### actions
+
+if trust_tip_state and rack['audited'] is not None:
+    print('Tip state trusted, skipping the sweep')
+else:
+    for tip in available_tips(tip_state, rack_id, n_channels):
+        if n_channels == 1:
+            pipette.pick_up_tip(tiprack.wells(tip))
+        else:
+            pipette.pick_up_tip(tiprack.cols(tip[1:]))
+        if delay_seconds > 0:
+            pipette.delay(seconds=delay_seconds)
+        pipette.return_tip()
+    # returned tips are back in the rack, so the used tips are unchanged
+    if not robot.is_simulating():
+        import datetime
+        rack['audited'] = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+if not robot.is_simulating():
+    save_tip_state(tip_state)
+    print('Tip state saved in {}'.format(TIP_STATE_FILE))
+
+# print
+for c in robot.commands():
+    print(c)
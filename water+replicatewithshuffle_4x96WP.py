@@ -21,6 +21,12 @@ Times 4:
 
 import numpy as np
 from opentrons import labware, instruments, robot
+from otprotocols.agar import (
+    plate_heights, load_calibration, dispense_offsets, column_offsets,
+    drop_touches, apply_to_plan)
+from otprotocols.plan import make_step, shuffle_plan, print_plan
+from otprotocols.microops import execute_plan_ops
+from otprotocols.motion import MotionManager
 
 ####################### user intuitive parameters
 
@@ -53,6 +59,12 @@ drugs_volume = 3.0
 agar_thickness = +3.3 # mm from the bottom of the well
 destination_slots = ['11', '8', '5', '2']
 destination_type = '96-well-plate-sqfb-whatman'
+# agar map per plate (see otprotocols.agar), replaces agar_thickness if either
+# the agar volume or a calibration file is given
+agar_volume = None # ul of agar per well
+agar_poured = None # 'YYYY-MM-DD', to estimate how much agar dried out
+agar_calibration_file = None # csv with columns plate, well, height
+destination_plate_ids = destination_slots # plate names in the calibration
 
 n_columns = 12
 
@@ -133,8 +145,11 @@ if multi_pipette_type == 'p10-Multi': # this is mostly a check as we don't own o
         tip_racks=tiprackdrugs)
 pipette_multi.start_at_tip(tiprackdrugs[0].well(tiprackdrugs_startfrom))
 pipette_multi.plunger_positions['drop_tip'] = -6
-# faster dispense
-pipette_multi.set_speed(dispense=pipette_multi.speeds['dispense']*4)
+# speeds per move (see otprotocols.motion): slow approach into the agar only,
+# and 4x faster dispense of water and drugs (was set_speed(dispense=...*4))
+motion = MotionManager(
+    robot, slot_classes={slot: 'agar' for slot in destination_slots},
+    liquid_classes={'WATER': 'water', 'drugs': 'water'})
 # I only associated the "drugs" tiprack to the pipette as this is the one I want to handle authomatically
 # I'll manually handle pipetting water
 
@@ -144,26 +159,56 @@ water_src_well = water_src_container.wells(H2O_source_well)
 # tiprack for water
 tiprackwater = labware.load(tiprackH2O_type, tiprackH2O_slot)
 
-# translate the drugs mapping dict in robot language
-wells_mapping = {}
-for key, value in drugs_mapping.items():
-    # unpack slots
-    _src_slot, _dst_slot = key
-    _src_cols, _dst_cols = value
-    # load labware for src and dst
-    src_plate = labware.load(drugs_source_type, _src_slot)
-    dst_plate = labware.load(destination_type,  _dst_slot)
-    # create list of wells with the right offset
-    # NOT YET FOLLOWING THE ORDER WE WANT
-    src_wells = [well.bottom(frombottom_off) for well in src_plate.rows('A')]
-    dst_wells = [well.bottom(agar_thickness) for well in dst_plate.rows('A')]
-    # these are normal lists though so should be reshufflable
-    src_wells = [src_wells[wi] for wi in _src_cols]
-    dst_wells = [dst_wells[wi] for wi in _dst_cols]
-    # store in wells_mapping
-    wells_mapping[(src_plate, dst_plate)] = (src_wells, dst_wells)
-
-# print(wells_mapping)
+# agar calibration, by destination slot
+agar_calibration = (load_calibration(agar_calibration_file, destination_type)
+                    if agar_calibration_file is not None else None)
+plate_ids = dict(zip(destination_slots, destination_plate_ids))
+
+# translate the slots in the plan in robot language
+plates = {H2O_source_slot: water_src_container}
+for _src_slot, _dst_slot in drugs_mapping:
+    plates[_src_slot] = labware.load(drugs_source_type, _src_slot)
+    plates[_dst_slot] = labware.load(destination_type, _dst_slot)
+
+# drugs plan, with the lowest safe offset per column if there is an agar map
+drugs_plan = shuffle_plan(
+    drugs_mapping, drugs_volume, source_offset=frombottom_off,
+    destination_offset=agar_thickness, options={'new_tip': 'always'})
+blow_outs = {}
+agar_offsets = {}
+for _dst_slot in destination_slots:
+    if agar_volume is not None or agar_calibration_file is not None:
+        heights, margin = plate_heights(
+            plate_ids[_dst_slot], agar_volume, agar_poured, agar_calibration,
+            destination_type)
+        agar_offsets[_dst_slot] = dispense_offsets(heights, margin)
+        dst_gaps = (column_offsets(agar_offsets[_dst_slot])
+                    - heights.min(axis=0))
+        # no blow out only if the drops touch agar that was measured: an
+        # estimate that is off would leave the volume in the tip
+        is_calibrated = (agar_calibration is not None
+                         and plate_ids[_dst_slot] in agar_calibration)
+        blow_outs[_dst_slot] = not (
+            is_calibrated
+            and drop_touches(dst_gaps, drugs_volume).all()
+            and drop_touches(dst_gaps, H2O_volume).all())
+    else:
+        blow_outs[_dst_slot] = True
+drugs_plan = apply_to_plan(drugs_plan, agar_offsets)
+for step in drugs_plan:
+    step['options']['blow_out'] = blow_outs[step['destination'][0]]
+    step['liquid'] = 'drugs'
+
+# water in the same wells, one tip per plate (picked up by hand)
+water_plan = [
+    make_step(
+        'water', 'multi', H2O_volume, (H2O_source_slot, H2O_source_well),
+        step['destination'], n_channels=8,
+        destination_offset=step['destination_offset'],
+        options={'new_tip': 'never',
+                 'blow_out': blow_outs[step['destination'][0]]},
+        compound='WATER')
+    for step in drugs_plan]
 
 
 ################### actions
@@ -186,32 +231,25 @@ count_used_tips() # should be 0
 
 wtcc = 0 # water tips column counter
 # first put water, then drugs in plates
-for plates_tuple, wells_tuple in wells_mapping.items():
-    # unpack
-    src_plate, dst_plate = plates_tuple
-    src_wells, dst_wells = wells_tuple
-
+for _src_slot, _dst_slot in drugs_mapping:
+    plate_water_plan = [
+        step for step in water_plan if step['destination'][0] == _dst_slot]
+    plate_drugs_plan = [
+        step for step in drugs_plan if step['destination'][0] == _dst_slot]
 
     # manual water transfer
     # pipette_multi.pick_up_tip(tiprackwater.wells('A'+str(wtcc+1)))
     pipette_multi.pick_up_tip(tiprackwater.cols(str(wtcc+1)))
-    pipette_multi.transfer(H2O_volume,
-                           water_src_well,
-                           dst_wells,
-                           new_tip='never',
-                           blow_out=True)
+    execute_plan_ops(
+        plate_water_plan, {'multi': pipette_multi}, plates, motion=motion)
     pipette_multi.drop_tip()
     wtcc += 1
 
     # drug transfer
-    pipette_multi.transfer(drugs_volume,
-                           src_wells,
-                           dst_wells,
-                           new_tip='always',
-                           blow_out=True)
-
-    for s,d in zip(src_wells, dst_wells):
-        print('{} {} -> {} {}'.format(src_plate.parent, s[0], dst_plate.parent, d[0]))
+    execute_plan_ops(
+        plate_drugs_plan, {'multi': pipette_multi}, plates, motion=motion)
+
+    print_plan(plate_drugs_plan)
 
     count_used_tips()
     robot.pause()